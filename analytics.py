@@ -0,0 +1,186 @@
+import time
+import heapq
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils import MovieUtils
+
+
+class CountMinSketch:
+    """Approximate counts of many keys in fixed memory.
+
+    Each key bumps one counter in each of depth rows; its estimate is the
+    smallest of those counters, so it can overcount (on collisions) but
+    never undercount.
+    """
+
+    def __init__(self, width: int = 1024, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self._rows = [[0] * width for _ in range(depth)]
+
+    def _columns(self, key: str):
+        for seed in range(self.depth):
+            yield hash((seed, key)) % self.width
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Count key and return its new estimate"""
+        estimate = None
+        for row, column in zip(self._rows, self._columns(key)):
+            row[column] += count
+            if estimate is None or row[column] < estimate:
+                estimate = row[column]
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[column] for row, column in zip(self._rows, self._columns(key)))
+
+
+class _Bucket:
+    """Counts for one time window plus the keys that may be among its top-k"""
+
+    def __init__(self, width: int, depth: int):
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates: Dict[str, int] = {}
+        # No key counting this low or lower can displace a candidate
+        self.floor = 0
+
+
+class TopQueries:
+    """Rolling top-k of keys seen in the last buckets windows of bucket_seconds.
+
+    Every window has its own count-min sketch and keeps its capacity heaviest
+    keys as candidates. top() adds up the sketch estimates of all candidates
+    over the live windows, so the cost is independent of how many searches
+    were logged; old windows are simply dropped.
+    """
+
+    def __init__(self, k: int = 20, bucket_seconds: float = 3600, buckets: int = 24,
+                 width: int = 1024, depth: int = 4, clock: Callable[[], float] = time.time):
+        self.k = k
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.width = width
+        self.depth = depth
+        self.capacity = k * 5
+        self.clock = clock
+        self._buckets: Dict[int, _Bucket] = {}
+
+    def _expire(self, now: float):
+        oldest = int(now // self.bucket_seconds) - self.buckets + 1
+        for start in [start for start in self._buckets if start < oldest]:
+            del self._buckets[start]
+
+    def add(self, key: str, at: Optional[float] = None):
+        """Count key at time at (now by default)"""
+        now = self.clock()
+        at = now if at is None else at
+        start = int(at // self.bucket_seconds)
+        if start <= int(now // self.bucket_seconds) - self.buckets:
+            return
+        bucket = self._buckets.get(start)
+        if bucket is None:
+            self._expire(now)
+            bucket = self._buckets[start] = _Bucket(self.width, self.depth)
+
+        count = bucket.sketch.add(key)
+        candidates = bucket.candidates
+        if key in candidates or len(candidates) < self.capacity:
+            candidates[key] = count
+        elif count > bucket.floor:
+            lightest = min(candidates, key=candidates.get)
+            if count > candidates[lightest]:
+                del candidates[lightest]
+                candidates[key] = count
+            bucket.floor = min(candidates.values())
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        """(key, estimated count) of the k most frequent keys, most frequent first"""
+        self._expire(self.clock())
+        buckets = list(self._buckets.values())
+        keys = set()
+        for bucket in buckets:
+            keys.update(bucket.candidates)
+        totals = ((key, sum(bucket.sketch.estimate(key) for bucket in buckets)) for key in keys)
+        return heapq.nlargest(k or self.k, totals, key=lambda item: item[1])
+
+
+class SearchLog:
+    """Write-behind log of searches with rolling trending and zero-result top-k.
+
+    add() only queues a row; rows are written with one log_searches call
+    once max_size are pending or every interval seconds, so a reply never
+    waits on the log. refresh() reads the rows written since the last
+    refresh (by any worker) into the TopQueries trackers.
+    """
+
+    def __init__(self, db, max_size: int = 500, interval: float = 5.0, k: int = 20,
+                 bucket_seconds: float = 3600, buckets: int = 24, batch_size: int = 5000):
+        self.db = db
+        self.max_size = max_size
+        self.interval = interval
+        self.batch_size = batch_size
+        self.trending = TopQueries(k, bucket_seconds, buckets)
+        self.missing = TopQueries(k, bucket_seconds, buckets)
+        self.window = bucket_seconds * buckets
+        self._pending: List[Tuple[int, str, str, int, float]] = []
+        self._last_id: Optional[int] = None
+        self._task = None
+        self._flushing = None
+        self._refreshing = asyncio.Lock()
+
+    def add(self, user_id: int, query: str, result_count: int):
+        """Queue one search and how many results it found"""
+        norm_query = MovieUtils.normalize_title(query)
+        if not norm_query:
+            return
+        self._pending.append((user_id, query, norm_query, result_count, time.time()))
+        if len(self._pending) >= self.max_size and not self._flushing:
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Write all pending searches in one transaction"""
+        try:
+            while self._pending:
+                rows, self._pending = self._pending, []
+                await self.db.log_searches(rows)
+        finally:
+            self._flushing = None
+
+    async def refresh(self):
+        """Count searches logged since the last refresh, by this and other workers"""
+        async with self._refreshing:
+            await self.flush()
+            if self._last_id is None:
+                self._last_id = await self.db.first_search_id(time.time() - self.window) - 1
+            while True:
+                rows = await self.db.get_searches(self._last_id, self.batch_size)
+                for search_id, norm_query, result_count, searched_at in rows:
+                    self.trending.add(norm_query, searched_at)
+                    if not result_count:
+                        self.missing.add(norm_query, searched_at)
+                if rows:
+                    self._last_id = rows[-1][0]
+                if len(rows) < self.batch_size:
+                    return
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flush task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def pending(self) -> int:
+        """Searches waiting to be written"""
+        return len(self._pending)
+
+    async def stop(self):
+        """Stop the periodic flush and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
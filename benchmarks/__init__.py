@@ -0,0 +1,4 @@
+"""Benchmarks for the bot's hot paths.
+
+Run with ``python -m benchmarks <name>``; see ``python -m benchmarks --help``.
+"""
@@ -0,0 +1,29 @@
+import argparse
+import logging
+
+from benchmarks import api_calls, catalog, db_concurrency, e2e, fuzzy, micro, parser, updates
+
+BENCHMARKS = {
+    'api-calls': api_calls,
+    'async-db': db_concurrency,
+    'catalog': catalog,
+    'e2e': e2e,
+    'fuzzy': fuzzy,
+    'micro': micro,
+    'parser': parser,
+    'updates': updates,
+}
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    for name, module in BENCHMARKS.items():
+        module.add_arguments(subparsers.add_parser(name, help=module.run.__doc__))
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+from benchmarks.catalog import populate
+from benchmarks.updates import FAKE_TOKEN, FakeTelegram, _free_port
+
+# Most Bot API calls each interaction may make before it counts as a regression
+BUDGETS = {
+    'search': 1,
+    'search-miss': 1,
+    'select': 2,
+    'quality': 2,
+    'page': 2,
+}
+
+_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {'id': user_id, 'is_bot': False, 'first_name': 'Bench'}
+
+
+def _message_update(user_id: int, text: str) -> Dict[str, Any]:
+    update_id = next(_ids)
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': _user(user_id),
+            'text': text
+        }
+    }
+
+
+def _callback_update(user_id: int, data: str) -> Dict[str, Any]:
+    update_id = next(_ids)
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': 'results'
+            }
+        }
+    }
+
+
+async def _count(bot, fake: FakeTelegram, update: Dict[str, Any]) -> Dict[str, int]:
+    from telegram import Update
+
+    before = dict(fake.calls)
+    await bot.application.process_update(Update.de_json(update, bot.application.bot))
+    return {method: count - before.get(method, 0)
+            for method, count in fake.calls.items() if count != before.get(method, 0)}
+
+
+async def _measure() -> Dict[str, Dict[str, int]]:
+    from callbacks import Action
+    from main import FilmziBot
+
+    fake = FakeTelegram()
+    fake_port = _free_port()
+    fake_runner = await fake.start(fake_port)
+
+    bot = FilmziBot()
+    await bot.db.connect()
+    bot.application = bot.build_application(base_url=f"http://127.0.0.1:{fake_port}/bot")
+    # An inserted title: sampled queries can miss a small catalog
+    query = (await bot.db.get_movie_by_id(1))['movie_name']
+    movie = (await bot.db.search_movies(query, 1))[0]
+
+    interactions = {
+        'search': _message_update(1, query),
+        'search-miss': _message_update(2, 'zzzz qqqq xxxx'),
+        'select': _callback_update(3, bot.callbacks.encode(Action.SELECT, movie['id'])),
+        'quality': _callback_update(4, bot.callbacks.encode(Action.QUALITY, movie['id'])),
+        'page': _callback_update(5, bot.callbacks.encode(
+            Action.PAGE, query, 2, float(movie['rank']), movie['id'], 0
+        )),
+    }
+    calls = {}
+    try:
+        async with bot.application:
+            for name, update in interactions.items():
+                calls[name] = await _count(bot, fake, update)
+    finally:
+        await fake_runner.cleanup()
+        await bot.db.close()
+    return calls
+
+
+def run(args):
+    """Count Bot API calls per user interaction and flag any over budget"""
+    from config import Config
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.BOT_TOKEN = FAKE_TOKEN
+        Config.DB_NAME = os.path.join(tmp, 'bench.db')
+        Config.DATABASE_URL = f'sqlite:///{Config.DB_NAME}'
+        from database import Database
+        populate(Database(Config.DB_NAME), args.catalog)
+        calls = asyncio.run(_measure())
+
+    over_budget = []
+    for name, methods in calls.items():
+        total = sum(methods.values())
+        detail = ', '.join(f"{method}={count}" for method, count in sorted(methods.items()))
+        flag = ''
+        if total > BUDGETS[name]:
+            over_budget.append(name)
+            flag = f'  OVER BUDGET ({BUDGETS[name]})'
+        print(f"{name:>12}: {total} calls  [{detail}]{flag}")
+    if over_budget:
+        sys.exit(1)
+
+
+def add_arguments(parser):
+    parser.add_argument('--catalog', type=int, default=5000)
+    parser.set_defaults(func=run)
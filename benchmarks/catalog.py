@@ -0,0 +1,129 @@
+import os
+import random
+import string
+import time
+from typing import Dict, Any, Iterator, List
+
+from database import Database
+from utils import MovieUtils
+
+WORDS = [
+    'avengers', 'endgame', 'iron', 'man', 'dark', 'knight', 'rises', 'inception',
+    'interstellar', 'kgf', 'chapter', 'pushpa', 'rise', 'bahubali', 'beginning',
+    'conclusion', 'jawan', 'pathaan', 'leo', 'vikram', 'master', 'beast', 'salaar',
+    'kantara', 'rrr', 'dangal', 'lagaan', 'war', 'tiger', 'zinda', 'hai', 'drishyam',
+    'spider', 'home', 'coming', 'far', 'from', 'no', 'way', 'doctor', 'strange',
+    'black', 'panther', 'wakanda', 'forever', 'thor', 'love', 'thunder', 'ragnarok',
+    'guardians', 'galaxy', 'fast', 'furious', 'mission', 'impossible', 'dead',
+    'reckoning', 'john', 'wick', 'oppenheimer', 'barbie', 'dune', 'part', 'two',
+    'joker', 'batman', 'superman', 'wonder', 'woman', 'aquaman', 'lost', 'kingdom',
+]
+SYLLABLES = ['ka', 'ra', 'vi', 'mo', 'an', 'shi', 'tu', 'lee', 'da', 'ne', 'ro', 'sa', 'pu', 'gan', 'tha', 'mi']
+
+
+def _vocabulary(size: int, seed: int = 3) -> List[str]:
+    """Pseudo-words so large catalogs have a realistic number of distinct words"""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+VOCABULARY = _vocabulary(20000)
+
+QUALITIES = ['480p', '720p', '1080p', '2160p', 'HDTV', 'BluRay', 'WEB-DL', '4K']
+LANGUAGES = ['Hindi', 'Tamil', 'Telugu', 'English', 'Malayalam', 'Kannada']
+EXTENSIONS = ['.mkv', '.mp4', '.avi']
+
+
+def make_title(rng: random.Random) -> str:
+    """Random two-to-four word title mixing real and generated words"""
+    return ' '.join(
+        rng.choice(WORDS if rng.random() < 0.5 else VOCABULARY).capitalize()
+        for _ in range(rng.randint(2, 4))
+    )
+
+
+def make_filename(rng: random.Random, title: str) -> str:
+    """Filename in one of the shapes channels actually use"""
+    year = rng.randint(1980, 2025)
+    quality = rng.choice(QUALITIES)
+    language = rng.choice(LANGUAGES)
+    extension = rng.choice(EXTENSIONS)
+    shape = rng.randrange(3)
+    if shape == 0:
+        return f"{title} ({year}) {quality} {language}{extension}"
+    if shape == 1:
+        return f"{title.replace(' ', '.')}.{year}.{quality}.{language}{extension}"
+    return f"[{language}] {title} {quality}{extension}"
+
+
+def generate_movies(count: int, seed: int = 42, variants: int = 3) -> Iterator[Dict[str, Any]]:
+    """Yield movie rows parsed through MovieUtils.parse_movie_info"""
+    rng = random.Random(seed)
+    titles = [make_title(rng) for _ in range(max(1, count // variants))]
+    for i in range(count):
+        file_name = make_filename(rng, rng.choice(titles))
+        info = MovieUtils.parse_movie_info(file_name)
+        size = rng.randint(200 * 1024 ** 2, 4 * 1024 ** 3)
+        yield {
+            'file_id': f"{i}-" + ''.join(rng.choices(string.ascii_letters, k=16)),
+            'file_name': file_name,
+            'size_bytes': size,
+            'movie_name': info['movie_name'],
+            'year': info.get('year'),
+            'quality': info.get('quality'),
+            'language': info.get('language'),
+            'category': info.get('category', 'movie'),
+        }
+
+
+def populate(db: Database, count: int, seed: int = 42, batch_size: int = 10000) -> None:
+    """Fill db with a synthetic catalog of count files"""
+    batch = []
+    for movie in generate_movies(count, seed):
+        batch.append(movie)
+        if len(batch) >= batch_size:
+            db.add_movies(batch)
+            batch = []
+    if batch:
+        db.add_movies(batch)
+
+
+def sample_queries(count: int, seed: int = 7) -> List[str]:
+    """Queries of the shape users type: one or two words, sometimes partial"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = rng.sample(WORDS, rng.randint(1, 2))
+        if rng.random() < 0.3:
+            words[-1] = words[-1][:max(2, len(words[-1]) - 2)]
+        queries.append(' '.join(words))
+    return queries
+
+
+def build(path: str, count: int, seed: int = 42) -> str:
+    """Create a catalog database at path unless one exists; returns path"""
+    if not os.path.exists(path):
+        db = Database(path)
+        populate(db, count, seed)
+        db.close_all_connections()
+    return path
+
+
+def run(args):
+    """Write a synthetic catalog database for the other benchmarks (--db) to reuse"""
+    if os.path.exists(args.out):
+        raise SystemExit(f"{args.out} already exists")
+    started = time.perf_counter()
+    build(args.out, args.count, args.seed)
+    elapsed = time.perf_counter() - started
+    print(f"{args.count} files in {elapsed:.1f} s ({args.count / elapsed:.0f} files/s) -> {args.out}")
+
+
+def add_arguments(parser):
+    parser.add_argument('--count', type=int, default=100000, help='files to generate (10k to 1M)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', required=True, help='SQLite file to create')
+    parser.set_defaults(func=run)
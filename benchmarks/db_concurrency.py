@@ -0,0 +1,64 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from database import Database, AsyncDatabase
+from benchmarks.catalog import populate, sample_queries
+
+
+async def _heartbeat(stop: asyncio.Event, interval: float, stalls: list):
+    """Record how late the loop wakes up; a blocked loop shows as a long stall"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+
+async def _drive(search, queries, concurrency: int):
+    stop = asyncio.Event()
+    stalls = []
+    heartbeat = asyncio.create_task(_heartbeat(stop, 0.005, stalls))
+    pending = iter(queries)
+
+    async def client():
+        for query in pending:
+            await search(query)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await heartbeat
+    return elapsed, max(stalls, default=0.0)
+
+
+def run(args):
+    """Compare inline Database calls with the AsyncDatabase worker pool"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        populate(db, args.catalog)
+        queries = sample_queries(args.queries)
+
+        async def inline(query):
+            return db.search_movies(query, 10)
+
+        adb = AsyncDatabase(db, args.workers)
+
+        async def pooled(query):
+            return await adb.search_movies(query, 10)
+
+        print(f"catalog={args.catalog} queries={args.queries} concurrency={args.concurrency}")
+        for name, search in (('inline', inline), (f'pool[{args.workers}]', pooled)):
+            elapsed, stall = asyncio.run(_drive(search, queries, args.concurrency))
+            print(f"{name:>10}: {len(queries) / elapsed:8.0f} searches/s  "
+                  f"max loop stall {stall * 1000:7.1f} ms")
+        asyncio.run(adb.close())
+
+
+def add_arguments(parser):
+    parser.add_argument('--catalog', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.set_defaults(func=run)
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.api_calls import _callback_update, _message_update
+from benchmarks.catalog import build, sample_queries
+from benchmarks.report import add_baseline_arguments, finish, summarize
+from benchmarks.updates import FAKE_TOKEN, FakeTelegram, _free_port, disable_rate_limits
+
+
+async def _drive(args) -> Dict[str, Dict[str, float]]:
+    from telegram import Update
+    from callbacks import Action
+    from main import FilmziBot
+
+    fake = FakeTelegram()
+    fake_port = _free_port()
+    fake_runner = await fake.start(fake_port)
+
+    bot = FilmziBot()
+    await bot.db.connect()
+    bot.application = bot.build_application(base_url=f"http://127.0.0.1:{fake_port}/bot")
+    timings: Dict[str, List[float]] = {}
+
+    async def timed(name: str, handler, update: Dict):
+        started = time.perf_counter()
+        await handler(Update.de_json(update, bot.application.bot), None)
+        timings.setdefault(name, []).append(time.perf_counter() - started)
+
+    async def session(user_id: int, query: str):
+        """One user: search, open a result, pick a quality, go to page 2"""
+        await timed('handle_message', bot.handle_message, _message_update(user_id, query))
+        movies = await bot.db.search_movies(query, bot.config.RESULTS_PER_PAGE + 1)
+        if not movies:
+            return
+        movie = movies[0]
+        for name, data in (
+            ('button_handler[select]', bot.callbacks.encode(Action.SELECT, movie['id'])),
+            ('button_handler[quality]', bot.callbacks.encode(Action.QUALITY, movie['id'])),
+            ('button_handler[page]', bot.callbacks.encode(
+                Action.PAGE, query, 2, float(movies[-1]['rank']), movies[-1]['id'], 0
+            )),
+        ):
+            await timed(name, bot.button_handler, _callback_update(user_id, data))
+
+    queries = sample_queries(args.sessions)
+    pending = iter(enumerate(queries, 1))
+
+    async def client():
+        for user_id, query in pending:
+            started = time.perf_counter()
+            await session(user_id, query)
+            timings.setdefault('session', []).append(time.perf_counter() - started)
+
+    try:
+        async with bot.application:
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+    finally:
+        await fake_runner.cleanup()
+        await bot.db.close()
+
+    results = {name: summarize(values, elapsed) for name, values in timings.items()}
+    print(f"{sum(fake.calls.values())} Bot API calls in {elapsed:.2f} s")
+    return results
+
+
+async def _drive_limiter(args) -> Dict[str, Dict[str, float]]:
+    """Send messages through the outbound limiter as fast as the clients can"""
+    from main import FilmziBot
+
+    fake = FakeTelegram()
+    fake_port = _free_port()
+    fake_runner = await fake.start(fake_port)
+
+    bot = FilmziBot()
+    bot.application = bot.build_application(base_url=f"http://127.0.0.1:{fake_port}/bot")
+    timings: List[float] = []
+    pending = iter(range(args.limiter_sends))
+
+    async def client():
+        for index in pending:
+            started = time.perf_counter()
+            await bot.application.bot.send_message(1000 + index, 'benchmark')
+            timings.append(time.perf_counter() - started)
+
+    try:
+        async with bot.application:
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+    finally:
+        await fake_runner.cleanup()
+
+    print(f"{len(timings)} sends through a {bot.config.OUTBOUND_RATE:g}/s limiter in {elapsed:.2f} s")
+    return {'send_message[limited]': summarize(timings, elapsed)}
+
+
+def run(args):
+    """Drive searches and button presses through FilmziBot against a stub Bot API.
+
+    Sessions run with the rate limits lifted, so they time the handlers;
+    the outbound limiter at its configured rate is timed on its own.
+    """
+    from config import Config
+
+    outbound_rate = Config.OUTBOUND_RATE
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.BOT_TOKEN = FAKE_TOKEN
+        Config.DB_NAME = os.path.join(tmp, 'bench.db')
+        Config.DATABASE_URL = f'sqlite:///{Config.DB_NAME}'
+        if args.db:
+            # Work on a copy: the run writes users and scheduled deletions
+            shutil.copyfile(args.db, Config.DB_NAME)
+        else:
+            build(Config.DB_NAME, args.catalog)
+        disable_rate_limits(Config)
+        results = asyncio.run(_drive(args))
+        if args.limiter_sends:
+            Config.OUTBOUND_RATE = outbound_rate
+            results.update(asyncio.run(_drive_limiter(args)))
+
+    print(f"catalog={args.db or args.catalog} sessions={args.sessions} concurrency={args.concurrency}")
+    finish(results, args, {
+        'catalog': args.db or args.catalog, 'sessions': args.sessions, 'concurrency': args.concurrency,
+        'outbound_rate': outbound_rate, 'limiter_sends': args.limiter_sends
+    })
+
+
+def add_arguments(parser):
+    parser.add_argument('--catalog', type=int, default=20000, help='files in the generated catalog')
+    parser.add_argument('--db', help='reuse a catalog written by "python -m benchmarks catalog"')
+    parser.add_argument('--sessions', type=int, default=500, help='simulated users')
+    parser.add_argument('--concurrency', type=int, default=20, help='users active at once')
+    parser.add_argument('--limiter-sends', type=int, default=150,
+                        help='messages sent through the outbound limiter at OUTBOUND_RATE, 0 to skip')
+    add_baseline_arguments(parser)
+    parser.set_defaults(func=run)
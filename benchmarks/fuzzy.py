@@ -0,0 +1,67 @@
+import difflib
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from database import Database
+from benchmarks.catalog import populate
+
+
+def misspell(rng: random.Random, word: str) -> str:
+    """Apply one typo: drop, swap, or replace a letter"""
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return word[:i] + word[i + 1:]
+    if kind == 1:
+        return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+    return word[:i] + rng.choice('aeiouyjkz') + word[i + 1:]
+
+
+def run(args):
+    """Latency and accuracy of fuzzy query correction on a synthetic catalog"""
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        started = time.perf_counter()
+        populate(db, args.catalog)
+        print(f"catalog={args.catalog} built in {time.perf_counter() - started:.1f}s")
+
+        with db.get_cursor() as cursor:
+            cursor.execute('SELECT term FROM title_terms WHERE length(term) >= 5')
+            words = [row['term'] for row in cursor.fetchall()]
+        print(f"vocabulary: {len(words)} words of 5+ letters")
+
+        cases = [(misspell(rng, word), word) for word in rng.sample(words, min(args.queries, len(words)))]
+
+        timings = []
+        correct = 0
+        for typo, expected in cases:
+            started = time.perf_counter()
+            suggestion = db.suggest_query(typo)
+            timings.append(time.perf_counter() - started)
+            correct += (suggestion or typo) == expected
+
+        timings.sort()
+        print(f"suggest_query: p50 {statistics.median(timings) * 1000:.2f} ms  "
+              f"p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} ms  "
+              f"accuracy {correct / len(cases):.1%} ({len(cases)} queries)")
+
+        # Reference: difflib over every distinct title, the approach this replaces
+        with db.get_cursor() as cursor:
+            cursor.execute('SELECT DISTINCT movie_name FROM movies')
+            all_names = [row['movie_name'].casefold() for row in cursor.fetchall()]
+        started = time.perf_counter()
+        for typo, _ in cases[:5]:
+            difflib.get_close_matches(typo, all_names, n=1)
+        per_query = (time.perf_counter() - started) / 5
+        print(f"difflib over {len(all_names)} titles: {per_query * 1000:.0f} ms per query")
+        db.close_all_connections()
+
+
+def add_arguments(parser):
+    parser.add_argument('--catalog', type=int, default=500000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.set_defaults(func=run)
@@ -0,0 +1,79 @@
+import os
+import random
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from database import Database
+from benchmarks.catalog import build, sample_queries
+from benchmarks.report import add_baseline_arguments, finish, summarize
+
+
+def measure(call: Callable[[Any], Any], inputs: List[Any],
+            before: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """Run call once per input and summarize; before() runs untimed ahead of each call"""
+    timings = []
+    total = 0.0
+    for value in inputs:
+        if before:
+            before()
+        started = time.perf_counter()
+        call(value)
+        took = time.perf_counter() - started
+        timings.append(took)
+        total += took
+    return summarize(timings, total)
+
+
+def sample_names(db: Database, count: int, seed: int = 11) -> List[str]:
+    """movie_name values of random catalog rows"""
+    with db.get_cursor() as cursor:
+        cursor.execute('SELECT MAX(id) FROM movies')
+        max_id = cursor.fetchone()[0] or 0
+        rng = random.Random(seed)
+        names = []
+        for _ in range(count):
+            cursor.execute('SELECT movie_name FROM movies WHERE id >= ? LIMIT 1', (rng.randint(1, max_id),))
+            row = cursor.fetchone()
+            if row:
+                names.append(row[0])
+        return names
+
+
+def run(args):
+    """Time Database.search_movies, get_movies_by_name and add_user on a synthetic catalog"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or build(os.path.join(tmp, 'bench.db'), args.catalog)
+        db = Database(path)
+        queries = sample_queries(args.ops)
+        names = sample_names(db, args.ops)
+        clear = db.search_cache.clear
+
+        results = {
+            'search_movies[uncached]': measure(lambda q: db.search_movies(q, 6), queries, before=clear),
+        }
+        for query in queries:
+            db.search_movies(query, 6)
+        results['search_movies[cached]'] = measure(lambda q: db.search_movies(q, 6), queries)
+        results['search_movies[filtered]'] = measure(
+            lambda q: db.search_movies(q, 6, filters={'language': 'Hindi', 'max_size': 2 * 1024 ** 3}),
+            queries, before=clear
+        )
+        results['facet_counts'] = measure(db.facet_counts, queries, before=clear)
+        results['get_movies_by_name'] = measure(db.get_movies_by_name, names)
+        results['add_user'] = measure(
+            lambda user_id: db.add_user(user_id, f'user{user_id}', 'Bench', ''),
+            list(range(1, args.ops + 1))
+        )
+        db.close_all_connections()
+
+    print(f"catalog={args.db or args.catalog} ops={args.ops}")
+    finish(results, args, {'catalog': args.db or args.catalog, 'ops': args.ops})
+
+
+def add_arguments(parser):
+    parser.add_argument('--catalog', type=int, default=50000, help='files in the generated catalog')
+    parser.add_argument('--db', help='reuse a catalog written by "python -m benchmarks catalog"')
+    parser.add_argument('--ops', type=int, default=1000, help='calls per benchmark')
+    add_baseline_arguments(parser)
+    parser.set_defaults(func=run)
@@ -0,0 +1,51 @@
+import re
+import random
+import time
+
+from utils import MovieUtils
+from benchmarks.catalog import generate_movies
+
+
+def legacy_parse_movie_info(filename):
+    """The parser MovieUtils.parse_movie_info replaced, kept as the baseline"""
+    info = {'movie_name': filename, 'year': None, 'quality': '480p', 'language': 'English', 'category': 'movie'}
+    year_match = re.search(r'\((\d{4})\)', filename)
+    if year_match:
+        info['year'] = int(year_match.group(1))
+        info['movie_name'] = re.sub(r'\(\d{4}\)', '', filename).strip()
+    for pattern in [r'(\d{3,4}p)', r'(HDTV)', r'(BluRay)', r'(WEB-DL)', r'(720p)', r'(1080p)', r'(480p)', r'(4K)']:
+        quality_match = re.search(pattern, filename, re.IGNORECASE)
+        if quality_match:
+            info['quality'] = quality_match.group(1).upper()
+            break
+    lang_patterns = {'hindi': ['hindi', 'hin'], 'tamil': ['tamil', 'tam'],
+                     'telugu': ['telugu', 'tel'], 'english': ['english', 'eng']}
+    for lang, patterns in lang_patterns.items():
+        if any(pattern in filename.lower() for pattern in patterns):
+            info['language'] = lang.capitalize()
+            break
+    info['movie_name'] = re.sub(r'[\[\]]', '', info['movie_name'])
+    info['movie_name'] = re.sub(r'\.mkv$|\.mp4$|\.avi$', '', info['movie_name'])
+    info['movie_name'] = info['movie_name'].strip()
+    return info
+
+
+def throughput(parse, filenames):
+    started = time.perf_counter()
+    for filename in filenames:
+        parse(filename)
+    return len(filenames) / (time.perf_counter() - started)
+
+
+def run(args):
+    """Throughput against the old parser (accuracy is checked by tests/test_parser.py)"""
+    filenames = [m['file_name'] for m in generate_movies(args.count)]
+    random.Random(5).shuffle(filenames)
+    legacy = throughput(legacy_parse_movie_info, filenames)
+    current = throughput(MovieUtils.parse_movie_info, filenames)
+    print(f"throughput over {len(filenames)} names: legacy {legacy:,.0f}/s, current {current:,.0f}/s")
+
+
+def add_arguments(parser):
+    parser.add_argument('--count', type=int, default=50000)
+    parser.set_defaults(func=run)
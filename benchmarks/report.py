@@ -0,0 +1,90 @@
+import json
+import platform
+import sys
+import time
+from typing import Any, Dict, List
+
+# Metrics where a bigger number is worse
+LATENCY_KEYS = ('p50_ms', 'p95_ms', 'p99_ms')
+# Latency changes smaller than this are timer noise, whatever the ratio
+MIN_DELTA_MS = 0.05
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings: List[float], elapsed: float) -> Dict[str, float]:
+    """Throughput and p50/p95/p99 latency of timings (seconds) measured over elapsed seconds"""
+    values = sorted(timings)
+    return {
+        'count': len(values),
+        'ops_per_s': len(values) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+    }
+
+
+def print_results(results: Dict[str, Dict[str, float]]):
+    print(f"{'benchmark':>24} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in results.items():
+        print(f"{name:>24} {stats['ops_per_s']:10.0f} {stats['p50_ms']:9.2f} "
+              f"{stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}")
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, float]], params: Dict[str, Any]):
+    """Write results with the parameters and machine they were measured on"""
+    with open(path, 'w') as f:
+        json.dump({
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'params': params,
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    print(f"Baseline saved to {path}")
+
+
+def compare(results: Dict[str, Dict[str, float]], path: str, tolerance: float) -> List[str]:
+    """Benchmarks slower than the baseline at path by more than tolerance (0.2 = 20%)"""
+    with open(path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, stats in results.items():
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        for key in LATENCY_KEYS:
+            if stats[key] > old[key] * (1 + tolerance) and stats[key] - old[key] > MIN_DELTA_MS:
+                regressions.append(f"{name} {key}: {old[key]:.2f} -> {stats[key]:.2f}")
+        if old['ops_per_s'] and stats['ops_per_s'] < old['ops_per_s'] * (1 - tolerance):
+            regressions.append(f"{name} ops/s: {old['ops_per_s']:.0f} -> {stats['ops_per_s']:.0f}")
+    return regressions
+
+
+def finish(results: Dict[str, Dict[str, float]], args, params: Dict[str, Any]):
+    """Print results, then save and/or check them against a baseline as asked on the command line.
+
+    Exits with status 1 when a regression is found, so CI can gate on it.
+    """
+    print_results(results)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, params)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument('--save-baseline', metavar='PATH', help='write the results as a JSON baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a saved baseline; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before flagging (0.2 = 20%%)')
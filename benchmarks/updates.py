@@ -0,0 +1,238 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from aiohttp import ClientSession, web
+
+from benchmarks.catalog import populate, sample_queries
+
+FAKE_TOKEN = '123456:benchmark'
+# High enough that no limiter ever waits during a run
+UNLIMITED_RATE = 1e9
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def disable_rate_limits(config):
+    """Lift the outbound and per-user limits so a run measures the bot, not the limiters"""
+    config.OUTBOUND_RATE = UNLIMITED_RATE
+    config.USER_RATE = UNLIMITED_RATE
+    config.USER_BURST = int(UNLIMITED_RATE)
+
+
+def synthetic_updates(count: int, chats: int = 200) -> List[Dict[str, Any]]:
+    """Private-chat text messages searching for catalog titles"""
+    queries = sample_queries(count)
+    updates = []
+    for update_id, query in enumerate(queries, 1):
+        chat_id = 1000 + update_id % chats
+        user = {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'}
+        updates.append({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': user,
+                'text': query
+            }
+        })
+    return updates
+
+
+def load_updates(path: str) -> List[Dict[str, Any]]:
+    """Captured updates, one JSON object per line, renumbered in order"""
+    with open(path) as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    for update_id, update in enumerate(updates, 1):
+        update['update_id'] = update_id
+    return updates
+
+
+class FakeTelegram:
+    """Minimal Bot API server: serves getUpdates from a queue and
+    acknowledges every other method with a plausible result."""
+
+    def __init__(self):
+        self.updates: List[Dict[str, Any]] = []
+        self.calls: Dict[str, int] = {}
+        self._arrived = asyncio.Event()
+        self._message_ids = itertools.count(1)
+
+    def push(self, updates: List[Dict[str, Any]]):
+        self.updates.extend(updates)
+        self._arrived.set()
+
+    async def _params(self, request) -> Dict[str, Any]:
+        if request.content_type == 'application/json':
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        return params
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = await self._params(request)
+        if method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif method == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif method.startswith(('send', 'edit')):
+            result = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                'text': str(params.get('text', ''))
+            }
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _get_updates(self, params) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        # An offset confirms every update before it
+        self.updates = [u for u in self.updates if u['update_id'] >= offset]
+        if not self.updates and timeout:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    async def start(self, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        return runner
+
+
+async def _post_webhooks(bot, updates, rate: float, concurrency: int):
+    url = f"http://127.0.0.1:{bot.config.PORT}{bot.config.WEBHOOK_PATH}"
+    headers = {'X-Telegram-Bot-Api-Secret-Token': bot.webhook_secret}
+    pending = iter(enumerate(updates))
+    started = time.perf_counter()
+
+    async with ClientSession() as session:
+        async def sender():
+            for index, update in pending:
+                if rate:
+                    await asyncio.sleep(max(0.0, started + index / rate - time.perf_counter()))
+                async with session.post(url, json=update, headers=headers) as response:
+                    response.raise_for_status()
+
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+
+
+async def _feed_polling(fake: FakeTelegram, updates, rate: float):
+    if not rate:
+        fake.push(updates)
+        return
+    started = time.perf_counter()
+    for index, update in enumerate(updates):
+        await asyncio.sleep(max(0.0, started + index / rate - time.perf_counter()))
+        fake.push([update])
+
+
+async def _replay(mode: str, updates, args) -> Dict[str, float]:
+    from main import FilmziBot
+
+    fake = FakeTelegram()
+    fake_port = _free_port()
+    fake_runner = await fake.start(fake_port)
+
+    bot = FilmziBot()
+    await bot.db.connect()
+    bot.config.PORT = _free_port()
+    bot.config.WEBHOOK_URL = f"http://127.0.0.1:{bot.config.PORT}" if mode == 'webhook' else ''
+    bot.application = bot.build_application(base_url=f"http://127.0.0.1:{fake_port}/bot")
+
+    done = asyncio.Event()
+    processed = 0
+    process_update = bot.application.process_update
+
+    async def counted(update):
+        # Counted once all handler groups are done, also for updates a
+        # handler stopped early (e.g. dropped by the per-user limit)
+        nonlocal processed
+        try:
+            await process_update(update)
+        finally:
+            processed += 1
+            if processed == len(updates):
+                done.set()
+
+    bot.application.process_update = counted
+    await bot.start_web_server()
+    try:
+        async with bot.application:
+            await bot.application.start()
+            await bot.start_updates()
+            started = time.perf_counter()
+            if mode == 'webhook':
+                feed = _post_webhooks(bot, updates, args.rate, args.concurrency)
+            else:
+                feed = _feed_polling(fake, updates, args.rate)
+            try:
+                await asyncio.wait_for(asyncio.gather(feed, done.wait()), args.timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"{mode}: only {processed} of {len(updates)} updates "
+                                   f"processed after {args.timeout:g} s") from None
+            elapsed = time.perf_counter() - started
+            await bot.stop_updates()
+            await bot.application.stop()
+    finally:
+        await bot.web_runner.cleanup()
+        await fake_runner.cleanup()
+        await bot.db.close()
+
+    return {'elapsed': elapsed, 'rate': len(updates) / elapsed, 'api_calls': sum(fake.calls.values())}
+
+
+def run(args):
+    """Replay updates through a fake Bot API in polling and webhook mode, rate limits lifted"""
+    from config import Config
+
+    updates = load_updates(args.updates) if args.updates else synthetic_updates(args.count)
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.BOT_TOKEN = FAKE_TOKEN
+        Config.DB_NAME = os.path.join(tmp, 'bench.db')
+        Config.DATABASE_URL = f'sqlite:///{Config.DB_NAME}'
+        disable_rate_limits(Config)
+        from database import Database
+        populate(Database(Config.DB_NAME), args.catalog)
+
+        print(f"updates={len(updates)} catalog={args.catalog} rate={args.rate or 'max'}")
+        for mode in args.modes:
+            result = asyncio.run(_replay(mode, [dict(u) for u in updates], args))
+            print(f"{mode:>8}: {result['rate']:8.0f} updates/s  "
+                  f"{result['elapsed']:6.2f} s  {result['api_calls']} API calls")
+
+
+def add_arguments(parser):
+    parser.add_argument('--updates', help='JSON-lines file of captured updates')
+    parser.add_argument('--count', type=int, default=2000, help='synthetic updates when --updates is not given')
+    parser.add_argument('--catalog', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=0, help='updates per second to offer, 0 for as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=20, help='parallel webhook senders')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds to wait for all updates per mode')
+    parser.add_argument('--modes', nargs='+', choices=('polling', 'webhook'), default=['polling', 'webhook'])
+    parser.set_defaults(func=run)
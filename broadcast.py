@@ -0,0 +1,148 @@
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from storage import Storage
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class Broadcaster:
+    """Copy an admin's message to every active user.
+
+    Users are read in keyset chunks of batch_size ordered by user_id and
+    messages are paced by a token bucket whose rate adapts: a RetryAfter
+    halves it (down to min_rate) and every chunk without one raises it by
+    one message/second again, up to max_rate. Progress is saved after each
+    chunk under a lease, so after a restart or crash the broadcast goes on
+    from the last saved user in whichever process claims it first. Users
+    who blocked the bot are marked inactive and skipped from then on.
+    """
+
+    def __init__(self, db: Storage, owner: str, max_rate: float = 20, min_rate: float = 1,
+                 batch_size: int = 100, lease: float = 300, poll: float = 30):
+        self.db = db
+        self.owner = owner
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.bucket = TokenBucket(max_rate, 1)
+        self.batch_size = batch_size
+        self.lease = lease
+        self.poll = poll
+        self.throttles = 0
+        self.bot = None
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def rate(self) -> float:
+        """Current messages per second"""
+        return self.bucket.rate
+
+    def slow_down(self):
+        self.throttles += 1
+        self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+
+    def speed_up(self):
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + 1)
+
+    async def send(self, broadcast: Dict[str, Any], user_id: int) -> str:
+        """Copy the broadcast message to user_id; returns 'sent', 'blocked' or 'failed'"""
+        while True:
+            await asyncio.sleep(self.bucket.reserve())
+            try:
+                # The outbound limiter must not retry: RetryAfter is handled here
+                await self.bot.copy_message(
+                    user_id, broadcast['from_chat_id'], broadcast['message_id'], rate_limit_args=0
+                )
+                return 'sent'
+            except RetryAfter as e:
+                self.slow_down()
+                logger.warning(f"Broadcast throttled for {e.retry_after}s, now {self.rate():g} msg/s")
+                await asyncio.sleep(float(e.retry_after))
+            except Forbidden:
+                return 'blocked'
+            except BadRequest as e:
+                if 'chat not found' in str(e).lower():
+                    return 'blocked'
+                logger.info(f"Could not broadcast to {user_id}: {e}")
+                return 'failed'
+            except TelegramError as e:
+                logger.info(f"Could not broadcast to {user_id}: {e}")
+                return 'failed'
+
+    async def _save(self, broadcast_id: int, after: int, counts: Dict[str, int], blocked: List[int]) -> bool:
+        if blocked:
+            await self.db.mark_users_inactive(blocked)
+            blocked.clear()
+        return await self.db.save_broadcast_progress(
+            broadcast_id, after, counts['sent'], counts['failed'], counts['blocked'], time.time() + self.lease
+        )
+
+    async def broadcast(self, broadcast: Dict[str, Any]):
+        """Send a claimed broadcast from its saved position to the last active user"""
+        broadcast_id = broadcast['id']
+        counts = {key: broadcast[key] for key in ('sent', 'failed', 'blocked')}
+        after = saved = broadcast['last_user_id']
+        blocked: List[int] = []
+        try:
+            while True:
+                user_ids = await self.db.get_active_user_ids(after, self.batch_size)
+                if not user_ids:
+                    await self.db.finish_broadcast(broadcast_id)
+                    logger.info(f"Broadcast {broadcast_id} done: {counts}")
+                    return
+                throttles = self.throttles
+                for user_id in user_ids:
+                    result = await self.send(broadcast, user_id)
+                    counts[result] += 1
+                    if result == 'blocked':
+                        blocked.append(user_id)
+                    after = user_id
+                if self.throttles == throttles:
+                    self.speed_up()
+                running = await self._save(broadcast_id, after, counts, blocked)
+                saved = after
+                if not running:
+                    logger.info(f"Broadcast {broadcast_id} cancelled: {counts}")
+                    return
+        finally:
+            # Stopped mid-chunk: keep the exact position so nobody gets it twice
+            if after != saved:
+                await self._save(broadcast_id, after, counts, blocked)
+
+    async def _run(self):
+        while True:
+            for broadcast in await self.db.get_unfinished_broadcasts():
+                now = time.time()
+                if not await self.db.claim_broadcast(broadcast['id'], self.owner, now + self.lease, now):
+                    continue
+                try:
+                    await self.broadcast(broadcast)
+                except Exception as e:
+                    logger.error(f"Error in broadcast {broadcast['id']}: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def wake(self):
+        """Look for new broadcasts now instead of at the next poll"""
+        self._wake.set()
+
+    def start(self, bot):
+        """Resume unfinished broadcasts and pick up new ones"""
+        self.bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop sending and save the position reached"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,102 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from utils import MovieUtils
+
+
+class SearchCache:
+    """Thread-safe LRU cache with a TTL for search results.
+    
+    Keys are tuples whose first item is a query normalized with
+    MovieUtils.normalize_title, so "KGF  Chapter-2" and "kgf chapter 2"
+    share an entry.
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl: float = 300, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    @staticmethod
+    def make_key(query: str, *args) -> tuple:
+        """Cache key for a query plus any extra search arguments"""
+        return (MovieUtils.normalize_title(query),) + args
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a cached value, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry if full"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate_matching(self, *texts: str):
+        """Drop cached queries that a new movie with these names would match"""
+        normalized = ' '.join(MovieUtils.normalize_title(text) for text in texts)
+        words = normalized.split()
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if self._matches(key[0], normalized, words)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+    
+    @staticmethod
+    def _matches(query: str, normalized: str, words) -> bool:
+        # Mirrors search: every query word is a prefix of a title word,
+        # or the whole query is a substring (LIKE fallback)
+        if not query or query in normalized:
+            return True
+        return all(
+            any(word.startswith(term) for word in words)
+            for term in query.split()
+        )
+    
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Counters for sizing the cache"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
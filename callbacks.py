@@ -0,0 +1,216 @@
+import time
+import base64
+import struct
+import itertools
+import threading
+from enum import IntEnum
+from collections import OrderedDict
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+# Telegram rejects callback_data longer than this many bytes
+MAX_CALLBACK_BYTES = 64
+
+ARG_INT = 0
+ARG_TEXT = 1
+ARG_HANDLE = 2
+ARG_FLOAT = 3
+
+
+class Action(IntEnum):
+    """First byte of every encoded callback_data"""
+    MAIN_MENU = 1
+    BUY_PREMIUM = 2
+    SELECT = 3
+    MORE = 4
+    QUALITY = 5
+    DOWNLOAD = 6
+    ALL_QUALITIES = 7
+    PAGE = 8
+    FILTER = 9
+
+
+class CallbackExpired(Exception):
+    """The server-side handle behind a button is gone"""
+    
+    def __init__(self, message: str, handle: int):
+        super().__init__(message)
+        self.handle = handle
+
+
+class HandleTable:
+    """Short-lived server-side storage for callback arguments too long to inline.
+
+    Maps small integer handles to strings with LRU eviction and a TTL.
+    Storing the same string twice returns the same live handle. When
+    several processes share handles, pass ids that cannot collide across
+    them (e.g. random ones) and on_put to publish new handles.
+    """
+
+    def __init__(self, max_size: int = 50000, ttl: float = 3600, clock: Callable[[], float] = time.monotonic,
+                 ids: Optional[Iterator[int]] = None, on_put: Optional[Callable[[int, str], None]] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.on_put = on_put
+        self._values: "OrderedDict[int, Tuple[float, str]]" = OrderedDict()
+        self._handles = {}
+        self._ids = ids or itertools.count(1)
+        self._lock = threading.Lock()
+
+    def put(self, value: str) -> int:
+        """Store value and return its handle"""
+        with self._lock:
+            now = self.clock()
+            handle = self._handles.get(value)
+            is_new = handle is None
+            if is_new:
+                handle = next(self._ids)
+                self._handles[value] = handle
+            self._values[handle] = (now + self.ttl, value)
+            self._values.move_to_end(handle)
+            self._evict(now)
+        if is_new and self.on_put:
+            self.on_put(handle, value)
+        return handle
+    
+    def restore(self, handle: int, value: str):
+        """Add a handle created by another process"""
+        with self._lock:
+            self._handles[value] = handle
+            self._values[handle] = (self.clock() + self.ttl, value)
+            self._values.move_to_end(handle)
+            self._evict(self.clock())
+
+    def get(self, handle: int) -> Optional[str]:
+        """Value behind handle, or None if it expired"""
+        with self._lock:
+            entry = self._values.get(handle)
+            if entry is None or entry[0] <= self.clock():
+                return None
+            return entry[1]
+
+    def _evict(self, now: float):
+        while self._values:
+            handle, (expires_at, value) = next(iter(self._values.items()))
+            if len(self._values) <= self.max_size and expires_at > now:
+                break
+            del self._values[handle]
+            if self._handles.get(value) == handle:
+                del self._handles[value]
+
+    def __len__(self):
+        return len(self._values)
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class CallbackCodec:
+    """Encode button callbacks as an action byte plus varint arguments, base64url.
+
+    Each argument is a varint header ``(value << 2) | kind`` where kind is
+    an int, an inline UTF-8 string (value is its length), a HandleTable
+    handle or a float (8 bytes follow). Strings are inlined when they fit in MAX_CALLBACK_BYTES and
+    moved to the handle table otherwise; decode() resolves both, so
+    handlers always receive the original arguments.
+    """
+
+    def __init__(self, handles: HandleTable):
+        self.handles = handles
+
+    def encode(self, action: Action, *args: Any) -> str:
+        """callback_data for action with int/str arguments"""
+        data = self._encode(action, args, inline=True)
+        if len(data) > MAX_CALLBACK_BYTES:
+            data = self._encode(action, args, inline=False)
+        return data
+
+    def _encode(self, action: Action, args, inline: bool) -> str:
+        out = bytearray([action])
+        for arg in args:
+            if isinstance(arg, int):
+                if arg < 0:
+                    raise ValueError("callback ints must be non-negative")
+                _write_varint(out, int(arg) << 2 | ARG_INT)
+            elif isinstance(arg, float):
+                _write_varint(out, ARG_FLOAT)
+                out += struct.pack('<d', arg)
+            elif inline:
+                raw = arg.encode('utf-8')
+                _write_varint(out, len(raw) << 2 | ARG_TEXT)
+                out += raw
+            else:
+                _write_varint(out, self.handles.put(arg) << 2 | ARG_HANDLE)
+        return base64.urlsafe_b64encode(bytes(out)).rstrip(b'=').decode('ascii')
+
+    def decode(self, data: str) -> Tuple[Action, List[Any]]:
+        """Action and arguments of encoded callback_data.
+
+        Raises ValueError for malformed data and CallbackExpired when a
+        handle has been evicted.
+        """
+        try:
+            raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+            action = Action(raw[0])
+            args = []
+            pos = 1
+            while pos < len(raw):
+                header, pos = _read_varint(raw, pos)
+                value, kind = header >> 2, header & 3
+                if kind == ARG_INT:
+                    args.append(value)
+                elif kind == ARG_TEXT:
+                    args.append(raw[pos:pos + value].decode('utf-8'))
+                    pos += value
+                elif kind == ARG_FLOAT:
+                    args.append(struct.unpack_from('<d', raw, pos)[0])
+                    pos += 8
+                elif kind == ARG_HANDLE:
+                    text = self.handles.get(value)
+                    if text is None:
+                        raise CallbackExpired(f"callback handle {value} expired", value)
+                    args.append(text)
+                else:
+                    raise ValueError(f"unknown argument kind {kind}")
+            return action, args
+        except CallbackExpired:
+            raise
+        except (IndexError, UnicodeDecodeError, ValueError, TypeError) as e:
+            raise ValueError(f"malformed callback data {data!r}: {e}") from e
+
+    @staticmethod
+    def decode_legacy(data: str) -> Optional[Tuple[Action, List[Any]]]:
+        """Decode the "select_12"-style data on buttons sent by older versions"""
+        if data == "main_menu":
+            return Action.MAIN_MENU, []
+        if data == "buy_premium":
+            return Action.BUY_PREMIUM, []
+        prefix, _, rest = data.partition("_")
+        if prefix == "select":
+            return Action.SELECT, [int(rest)]
+        if prefix == "more":
+            return Action.MORE, [rest]
+        if prefix == "quality":
+            return Action.QUALITY, [int(rest.split("_")[0])]
+        if prefix == "dl":
+            # Old download buttons carry the Telegram file_id itself
+            return Action.DOWNLOAD, [rest]
+        if prefix == "all":
+            # Always a movie name, even an all-digit one like "1917"
+            return Action.ALL_QUALITIES, [rest]
+        return None
@@ -0,0 +1,45 @@
+import argparse
+import asyncio
+import logging
+
+from config import Config
+from storage import create_storage
+from utils import MovieUtils
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+async def compact(config: Config):
+    """Merge duplicate files in the catalog and report what was removed"""
+    db = create_storage(config)
+    await db.connect()
+    try:
+        stats = await db.compact_movies()
+    finally:
+        await db.close()
+    logger.info(
+        f"Merged {stats['groups']} duplicated files, removed {stats['removed']} rows; "
+        f"database {MovieUtils.format_file_size(stats['bytes_before'])} -> "
+        f"{MovieUtils.format_file_size(stats['bytes_after'])}"
+    )
+    return stats
+
+
+def main():
+    """Entry point: python compact.py [--database-url URL]; run it while the indexer is stopped"""
+    parser = argparse.ArgumentParser(description="Merge duplicate movies and shrink the database")
+    parser.add_argument('--database-url', help="defaults to DATABASE_URL (or DB_NAME for SQLite)")
+    args = parser.parse_args()
+
+    config = Config()
+    if args.database_url:
+        config.DATABASE_URL = args.database_url
+    asyncio.run(compact(config))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,18 +11,94 @@ class Config:
     CHANNEL_ID = int(os.getenv("CHANNEL_ID", 0))
     ADMIN_ID = int(os.getenv("ADMIN_ID", 0))
     
-    # Database
+    # Database: postgresql://... or sqlite:///path; unset uses DB_NAME
+    DATABASE_URL = os.getenv("DATABASE_URL", "")
     DB_NAME = "filmzi_bot.db"
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_WORKERS = int(os.getenv("DB_WORKERS", 4))
+    USER_FLUSH_SIZE = int(os.getenv("USER_FLUSH_SIZE", 500))
+    USER_FLUSH_SECONDS = float(os.getenv("USER_FLUSH_SECONDS", 2))
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 1024))
+    SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 300))
+    FUZZY_MIN_RESULTS = int(os.getenv("FUZZY_MIN_RESULTS", 3))
+    
+    # Update processing and rate limits
+    CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 32))
+    USER_RATE = float(os.getenv("USER_RATE", 1))
+    USER_BURST = int(os.getenv("USER_BURST", 5))
+    OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", 30))
+    OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 2))
+    TYPING_DELAY = float(os.getenv("TYPING_DELAY", 0.5))
+    
+    # Inline button state
+    CALLBACK_HANDLE_TTL = int(os.getenv("CALLBACK_HANDLE_TTL", 3600))
     
     # Bot Settings
     BOT_NAME = "Filmzi Movie & TV Series Bot"
     WELCOME_IMAGE = "https://ar-hosting.pages.dev/1759107724318.jpg"
     MAX_RESULTS = 10
-    MOVIE_EXPIRY_MINUTES = 10
+    RESULTS_PER_PAGE = int(os.getenv("RESULTS_PER_PAGE", 5))
+    MOVIE_EXPIRY_MINUTES = int(os.getenv("MOVIE_EXPIRY_MINUTES", 10))
+    
+    # Inline mode (enable with /setinline in BotFather)
+    INLINE_RESULTS = int(os.getenv("INLINE_RESULTS", 20))
+    INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 300))
+    INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", 0.3))
+    
+    # Group auto-filter (the bot needs privacy mode off in BotFather to see
+    # plain group messages)
+    GROUP_MAX_WORDS = int(os.getenv("GROUP_MAX_WORDS", 8))
+    GROUP_BURST_SECONDS = float(os.getenv("GROUP_BURST_SECONDS", 2))
+    GROUP_MAX_QUERIES = int(os.getenv("GROUP_MAX_QUERIES", 3))
+    GROUP_RESULTS = int(os.getenv("GROUP_RESULTS", 3))
+    TITLE_REFRESH_SECONDS = float(os.getenv("TITLE_REFRESH_SECONDS", 600))
+    
+    # Search analytics (/trending): hourly buckets over the last day by default
+    SEARCH_LOG_FLUSH_SIZE = int(os.getenv("SEARCH_LOG_FLUSH_SIZE", 500))
+    SEARCH_LOG_FLUSH_SECONDS = float(os.getenv("SEARCH_LOG_FLUSH_SECONDS", 5))
+    TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", 20))
+    TRENDING_BUCKET_SECONDS = float(os.getenv("TRENDING_BUCKET_SECONDS", 3600))
+    TRENDING_BUCKETS = int(os.getenv("TRENDING_BUCKETS", 24))
+    
+    # Admin broadcasts stay under the ~30 msg/s outbound limit so replies keep flowing
+    BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 20))
+    BROADCAST_MIN_RATE = float(os.getenv("BROADCAST_MIN_RATE", 1))
+    BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", 100))
+    BROADCAST_LEASE_SECONDS = float(os.getenv("BROADCAST_LEASE_SECONDS", 300))
+    BROADCAST_POLL_SECONDS = float(os.getenv("BROADCAST_POLL_SECONDS", 30))
+    
+    # Channel Indexer
+    INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", 200))
+    INDEX_FLUSH_SECONDS = int(os.getenv("INDEX_FLUSH_SECONDS", 5))
+    # Request notifications take tokens from the bot's OUTBOUND_RATE bucket:
+    # the indexer sends them through SHARED_STATE_URL; without it the bot
+    # process does, reading newly fulfilled requests every NOTIFY_POLL_SECONDS
+    NOTIFY_POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", 30))
     
     # Koyeb Specific
     PORT = int(os.getenv("PORT", 8080))
     
+    # Webhook mode: set WEBHOOK_URL to the public base URL to stop polling
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))
+    
+    # Process roles: "all" runs everything in one process; "ingress" receives
+    # updates and queues them, "worker" handles queued updates. Ingress and
+    # workers talk through SHARED_STATE_URL (redis://... across machines,
+    # sqlite:///path for processes on one machine)
+    ROLE = os.getenv("ROLE", "all")
+    SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "")
+    QUEUE_PARTITIONS = int(os.getenv("QUEUE_PARTITIONS", 64))
+    QUEUE_POLL_SECONDS = float(os.getenv("QUEUE_POLL_SECONDS", 0.05))
+    WORKER_TTL = float(os.getenv("WORKER_TTL", 15))
+    CACHE_SYNC_SECONDS = float(os.getenv("CACHE_SYNC_SECONDS", 5))
+    
+    # Health checks
+    HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", 2))
+    HEALTH_MAX_LOOP_LAG = float(os.getenv("HEALTH_MAX_LOOP_LAG", 1))
+    
     @classmethod
     def validate_config(cls):
         """Validate that all required environment variables are set"""
@@ -1,22 +1,81 @@
+import os
+import re
+import time
+import asyncio
+import difflib
 import sqlite3
 import logging
+import functools
 import threading
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional, Tuple
 from contextlib import contextmanager
 
+from cache import SearchCache
+from facets import SIZE_LIMITS, facet_conditions, filters_key
+from utils import MovieUtils
+
 logger = logging.getLogger(__name__)
 
+WORD_RE = re.compile(r'[^\W_]+')
+# "chapter2" -> "chapter 2" when looking for a fuzzy match
+LETTER_DIGIT_RE = re.compile(r'(?<=[^\W\d_])(?=\d)|(?<=\d)(?=[^\W\d_])')
+
+# id is NULL for a new file; a file already stored is updated in place so
+# its id, and every button carrying it, stays valid
+UPSERT_MOVIE_SQL = '''
+    INSERT INTO movies
+    (id, file_id, file_unique_id, file_name, file_size, movie_name, year, quality, language,
+     category, title_id, resolution_rank, size_bytes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        file_id = excluded.file_id,
+        file_unique_id = excluded.file_unique_id,
+        file_name = excluded.file_name,
+        file_size = excluded.file_size,
+        movie_name = excluded.movie_name,
+        year = excluded.year,
+        quality = excluded.quality,
+        language = excluded.language,
+        category = excluded.category,
+        title_id = excluded.title_id,
+        resolution_rank = excluded.resolution_rank,
+        size_bytes = excluded.size_bytes
+'''
+# The stored row a file replaces: the same file_id, else the same file
+# reposted (file_unique_id plus exact or rounded legacy size)
+EXISTING_MOVIE_SQL = '''
+    SELECT id, 0 AS preference FROM movies WHERE file_id = ?
+    UNION ALL
+    SELECT id, 1 FROM movies WHERE file_unique_id = ? AND size_bytes IN (?, ?)
+    ORDER BY preference, id LIMIT 1
+'''
+
 class Database:
-    def __init__(self, db_name: str):
+    def __init__(self, db_name: str, cache_size: int = 1024, cache_ttl: float = 300,
+                 fuzzy_min_results: int = 3):
         self.db_name = db_name
+        self.search_cache = SearchCache(cache_size, cache_ttl)
+        self.fuzzy_min_results = fuzzy_min_results
         self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.fts_enabled = False
+        self.fuzzy_enabled = False
         self.init_db()
     
     def get_connection(self):
         """Get database connection with thread safety"""
         if not hasattr(self._local, 'conn'):
-            self._local.conn = sqlite3.connect(self.db_name, check_same_thread=False)
+            self._local.conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=10)
             self._local.conn.row_factory = sqlite3.Row
+            # WAL lets readers run alongside the writer; NORMAL only fsyncs at checkpoints
+            self._local.conn.execute('PRAGMA journal_mode = WAL')
+            self._local.conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn.execute('PRAGMA cache_size = -16000')
+            self._local.conn.execute('PRAGMA temp_store = MEMORY')
+            with self._connections_lock:
+                self._connections.append(self._local.conn)
         return self._local.conn
     
     @contextmanager
@@ -59,9 +118,12 @@ class Database:
                         first_name TEXT,
                         last_name TEXT,
                         is_premium BOOLEAN DEFAULT FALSE,
-                        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        is_active BOOLEAN DEFAULT TRUE
                     )
                 ''')
+                # Cleared when the user blocks the bot; broadcasts skip them
+                self._add_columns(cursor, 'users', {'is_active': 'BOOLEAN DEFAULT TRUE'})
                 
                 # Requests table
                 cursor.execute('''
@@ -74,6 +136,119 @@ class Database:
                     )
                 ''')
                 
+                # One row per requested title (normalized), with its requesters
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS movie_requests (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        norm_title TEXT UNIQUE NOT NULL,
+                        title TEXT,
+                        requester_count INTEGER DEFAULT 0,
+                        status TEXT DEFAULT 'pending',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        fulfilled_at TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_movie_requests_demand
+                    ON movie_requests(status, requester_count DESC)
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS movie_request_users (
+                        request_id INTEGER REFERENCES movie_requests(id),
+                        user_id INTEGER,
+                        notified BOOLEAN DEFAULT FALSE,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (request_id, user_id)
+                    )
+                ''')
+                self._migrate_requests(cursor)
+                
+                # Titles group the files (quality variants) of one movie
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS titles (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        canonical_name TEXT NOT NULL,
+                        year INTEGER,
+                        display_name TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_titles_name_year
+                    ON titles(canonical_name, COALESCE(year, 0))
+                ''')
+                self._add_columns(cursor, 'movies', {
+                    'title_id': 'INTEGER REFERENCES titles(id)',
+                    'resolution_rank': 'INTEGER DEFAULT 0',
+                    'size_bytes': 'INTEGER',
+                    'file_unique_id': 'TEXT'
+                })
+                
+                # Ids of movies merged into another row by compact.py, so old
+                # buttons keep working
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS movie_aliases (
+                        old_id INTEGER PRIMARY KEY,
+                        movie_id INTEGER
+                    )
+                ''')
+                
+                # Indexer checkpoints (e.g. last channel message indexed)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS index_state (
+                        key TEXT PRIMARY KEY,
+                        value INTEGER,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # Sent files waiting to be deleted (due_at is a Unix timestamp)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS scheduled_deletions (
+                        chat_id INTEGER,
+                        message_id INTEGER,
+                        due_at REAL,
+                        PRIMARY KEY (chat_id, message_id)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_scheduled_deletions_due
+                    ON scheduled_deletions(due_at)
+                ''')
+                
+                # One row per search (searched_at is a Unix timestamp)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS search_log (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER,
+                        query TEXT,
+                        norm_query TEXT,
+                        result_count INTEGER,
+                        searched_at REAL
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_search_log_time ON search_log(searched_at)
+                ''')
+                
+                # Admin broadcasts; last_user_id is the keyset position in users
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS broadcasts (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        from_chat_id INTEGER,
+                        message_id INTEGER,
+                        status TEXT DEFAULT 'running',
+                        last_user_id INTEGER DEFAULT 0,
+                        sent INTEGER DEFAULT 0,
+                        failed INTEGER DEFAULT 0,
+                        blocked INTEGER DEFAULT 0,
+                        owner TEXT,
+                        lease_until REAL DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP
+                    )
+                ''')
+                
                 # Create indexes for better performance
                 cursor.execute('''
                     CREATE INDEX IF NOT EXISTS idx_movies_name ON movies(movie_name)
@@ -81,81 +256,950 @@ class Database:
                 cursor.execute('''
                     CREATE INDEX IF NOT EXISTS idx_movies_quality ON movies(quality)
                 ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_movies_title
+                    ON movies(title_id, resolution_rank DESC)
+                ''')
+                # Facet filters: language, then resolution, then size
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_movies_facets
+                    ON movies(language, resolution_rank, size_bytes)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_movies_year
+                    ON movies(year, resolution_rank)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_movies_file_unique
+                    ON movies(file_unique_id, size_bytes)
+                ''')
+                
+                self.fts_enabled = self._init_fts(cursor)
+                self.fuzzy_enabled = self.fts_enabled and self._init_fuzzy(cursor)
+                self._backfill_titles(cursor)
+                self._backfill_sizes(cursor)
+                self._backfill_unique_ids(cursor)
                 
             logger.info("Database initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
     
+    @staticmethod
+    def _add_columns(cursor, table: str, columns: Dict[str, str]):
+        """Add columns missing from tables created by older versions"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {row['name'] for row in cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+    
+    def _migrate_requests(self, cursor):
+        """Fold rows of the old per-user requests table into movie_requests"""
+        cursor.execute('SELECT 1 FROM movie_requests LIMIT 1')
+        if cursor.fetchone():
+            return
+        cursor.execute('SELECT user_id, movie_name, status FROM requests ORDER BY id')
+        rows = cursor.fetchall()
+        for row in rows:
+            self._add_request(cursor, row['user_id'], row['movie_name'] or '')
+        if rows:
+            logger.info(f"Migrated {len(rows)} legacy movie requests")
+    
+    def _backfill_titles(self, cursor, batch_size: int = 5000):
+        """Link movies stored before titles existed to their title"""
+        while True:
+            cursor.execute('''
+                SELECT id, movie_name, year, quality FROM movies
+                WHERE title_id IS NULL LIMIT ?
+            ''', (batch_size,))
+            rows = [dict(row) for row in cursor.fetchall()]
+            if not rows:
+                return
+            # Names stored by the old parser can still carry tags ("Inception 1080p")
+            for row in rows:
+                info = MovieUtils.parse_movie_info(row['movie_name'] or '')
+                row['movie_name'] = info['movie_name']
+                row['year'] = row['year'] or info.get('year')
+            title_ids = self._resolve_title_ids(cursor, rows)
+            cursor.executemany(
+                'UPDATE movies SET title_id = ?, resolution_rank = ? WHERE id = ?',
+                [
+                    (title_id, MovieUtils.resolution_rank(row['quality']), row['id'])
+                    for row, title_id in zip(rows, title_ids)
+                ]
+            )
+            logger.info(f"Linked {len(rows)} existing movies to titles")
+    
+    @staticmethod
+    def _backfill_sizes(cursor, batch_size: int = 5000):
+        """Fill size_bytes of movies stored with only the formatted file_size"""
+        while True:
+            cursor.execute(
+                'SELECT id, file_size FROM movies WHERE size_bytes IS NULL LIMIT ?', (batch_size,)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            cursor.executemany('UPDATE movies SET size_bytes = ? WHERE id = ?', [
+                (MovieUtils.parse_file_size(row['file_size']), row['id']) for row in rows
+            ])
+            logger.info(f"Backfilled sizes of {len(rows)} movies")
+    
+    @staticmethod
+    def _backfill_unique_ids(cursor, batch_size: int = 5000):
+        """Fill file_unique_id of movies stored before it was kept"""
+        while True:
+            cursor.execute(
+                'SELECT id, file_id FROM movies WHERE file_unique_id IS NULL LIMIT ?', (batch_size,)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            cursor.executemany('UPDATE movies SET file_unique_id = ? WHERE id = ?', [
+                (MovieUtils.file_unique_id(row['file_id']), row['id']) for row in rows
+            ])
+            logger.info(f"Backfilled file_unique_id of {len(rows)} movies")
+    
+    def _resolve_title_ids(self, cursor, movies: List[Dict[str, Any]]) -> List[int]:
+        """Title id for each movie, creating titles as needed.
+        
+        Titles are keyed on the normalized name and year; a file without a
+        year joins an existing title of the same name.
+        """
+        resolved: Dict[tuple, int] = {}
+        title_ids = []
+        for movie in movies:
+            key = (MovieUtils.normalize_title(movie['movie_name']), movie.get('year'))
+            if key not in resolved:
+                resolved[key] = self._title_id(cursor, key[0], key[1], movie['movie_name'])
+            title_ids.append(resolved[key])
+        return title_ids
+    
+    @staticmethod
+    def _title_id(cursor, canonical_name: str, year: Optional[int], display_name: str) -> int:
+        cursor.execute('''
+            SELECT id FROM titles
+            WHERE canonical_name = ? AND (COALESCE(year, 0) = COALESCE(?, 0) OR ? IS NULL)
+            ORDER BY COALESCE(year, 0) = COALESCE(?, 0) DESC
+            LIMIT 1
+        ''', (canonical_name, year, year, year))
+        row = cursor.fetchone()
+        if row:
+            return row['id']
+        cursor.execute(
+            'INSERT INTO titles (canonical_name, year, display_name) VALUES (?, ?, ?)',
+            (canonical_name, year, display_name)
+        )
+        return cursor.lastrowid
+    
+    def _init_fts(self, cursor) -> bool:
+        """Create the FTS5 index over movies and its sync triggers"""
+        cursor.execute('''
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movies_fts'
+        ''')
+        exists = cursor.fetchone() is not None
+        
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+                    movie_name,
+                    file_name,
+                    content='movies',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 not available, using LIKE search: {e}")
+            return False
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+                INSERT INTO movies_fts(rowid, movie_name, file_name)
+                VALUES (new.id, new.movie_name, new.file_name);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+                INSERT INTO movies_fts(movies_fts, rowid, movie_name, file_name)
+                VALUES ('delete', old.id, old.movie_name, old.file_name);
+            END
+        ''')
+        # Only re-index when indexed columns change (older versions fired on any update)
+        cursor.execute('DROP TRIGGER IF EXISTS movies_fts_update')
+        cursor.execute('''
+            CREATE TRIGGER movies_fts_update AFTER UPDATE OF movie_name, file_name ON movies BEGIN
+                INSERT INTO movies_fts(movies_fts, rowid, movie_name, file_name)
+                VALUES ('delete', old.id, old.movie_name, old.file_name);
+                INSERT INTO movies_fts(rowid, movie_name, file_name)
+                VALUES (new.id, new.movie_name, new.file_name);
+            END
+        ''')
+        
+        if not exists:
+            # Existing databases: index the rows that were there before FTS
+            cursor.execute("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')")
+            logger.info("Built movies_fts index from existing movies")
+        
+        return True
+    
+    def _init_fuzzy(self, cursor) -> bool:
+        """Create the title word vocabulary and its trigram index for fuzzy search.
+        
+        Typos are corrected word by word against the vocabulary, which grows
+        with the number of distinct words rather than the number of files.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS title_terms (
+                id INTEGER PRIMARY KEY,
+                term TEXT UNIQUE
+            )
+        ''')
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS title_terms_fts USING fts5(
+                    term, content='title_terms', content_rowid='id', tokenize='trigram'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 trigram tokenizer not available, fuzzy search disabled: {e}")
+            return False
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS title_terms_fts_insert AFTER INSERT ON title_terms BEGIN
+                INSERT INTO title_terms_fts(rowid, term) VALUES (new.id, new.term);
+            END
+        ''')
+        
+        cursor.execute('SELECT 1 FROM title_terms LIMIT 1')
+        if cursor.fetchone() is None:
+            # Existing databases: seed the vocabulary from the words in movies_fts
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS temp.movies_vocab
+                USING fts5vocab(main, movies_fts, 'col')
+            ''')
+            cursor.execute('''
+                INSERT OR IGNORE INTO title_terms (term)
+                SELECT term FROM temp.movies_vocab WHERE col = 'movie_name'
+            ''')
+            cursor.execute('DROP TABLE temp.movies_vocab')
+        
+        return True
+    
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        """Turn free text into an FTS5 query matching every word as a prefix"""
+        tokens = WORD_RE.findall(query.lower())
+        return ' '.join(f'"{token}"*' for token in tokens)
+    
+    def _add_terms(self, cursor, movie_names: List[str]):
+        """Record the words of new titles in the fuzzy search vocabulary"""
+        if not self.fuzzy_enabled:
+            return
+        terms = {term for name in movie_names for term in WORD_RE.findall(name.casefold())}
+        cursor.executemany('INSERT OR IGNORE INTO title_terms (term) VALUES (?)', [(t,) for t in terms])
+    
+    def _correct_word(self, cursor, word: str) -> str:
+        """Closest vocabulary word to word, or word itself"""
+        if len(word) < 3 or word.isdigit():
+            return word
+        cursor.execute('SELECT 1 FROM title_terms WHERE term = ?', (word,))
+        if cursor.fetchone():
+            return word
+        
+        trigrams = {word[i:i + 3] for i in range(len(word) - 2)}
+        cursor.execute('''
+            SELECT term FROM title_terms_fts WHERE title_terms_fts MATCH ?
+            ORDER BY rank LIMIT 20
+        ''', (' OR '.join(f'"{gram}"' for gram in trigrams),))
+        candidates = [row['term'] for row in cursor.fetchall()]
+        best = difflib.get_close_matches(word, candidates, n=1, cutoff=0.7)
+        return best[0] if best else word
+    
+    def suggest_query(self, query: str) -> Optional[str]:
+        """Spelling-corrected version of query, or None if nothing changes"""
+        if not self.fuzzy_enabled:
+            return None
+        try:
+            words = WORD_RE.findall(LETTER_DIGIT_RE.sub(' ', query.casefold()))
+            with self.get_cursor() as cursor:
+                corrected = [self._correct_word(cursor, word) for word in words]
+            suggestion = ' '.join(corrected)
+            return suggestion if suggestion != ' '.join(WORD_RE.findall(query.casefold())) else None
+        except Exception as e:
+            logger.error(f"Error correcting query: {e}")
+            return None
+    
+    @staticmethod
+    def unique_movies(movies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """movies with file_unique_id and size_bytes filled in, one per file (the last one wins)"""
+        unique: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        for movie in movies:
+            movie = dict(movie)
+            if movie.get('size_bytes') is None:
+                movie['size_bytes'] = MovieUtils.parse_file_size(movie.get('file_size'))
+            if not movie.get('file_unique_id'):
+                movie['file_unique_id'] = MovieUtils.file_unique_id(movie['file_id'])
+            unique[(movie['file_unique_id'], movie['size_bytes'])] = movie
+        return list(unique.values())
+    
+    @staticmethod
+    def _existing_params(movie: Dict[str, Any]) -> tuple:
+        """Parameters for EXISTING_MOVIE_SQL"""
+        return (movie['file_id'], movie['file_unique_id'], movie['size_bytes'],
+                MovieUtils.rounded_size(movie['size_bytes']))
+    
+    def _existing_movie_ids(self, cursor, movies: List[Dict[str, Any]]) -> List[Optional[int]]:
+        """Id of the stored row each of unique_movies() replaces, None for new files"""
+        movie_ids = []
+        for movie in movies:
+            cursor.execute(EXISTING_MOVIE_SQL, self._existing_params(movie))
+            row = cursor.fetchone()
+            movie_ids.append(row['id'] if row else None)
+        return movie_ids
+    
+    @staticmethod
+    def _movie_row(movie_data: Dict[str, Any], title_id: int, movie_id: Optional[int]) -> tuple:
+        """Parameters for UPSERT_MOVIE_SQL, for a movie from unique_movies()"""
+        return (
+            movie_id,
+            movie_data['file_id'],
+            movie_data['file_unique_id'],
+            movie_data['file_name'],
+            movie_data.get('file_size'),
+            movie_data['movie_name'],
+            movie_data.get('year'),
+            movie_data.get('quality'),
+            movie_data.get('language'),
+            movie_data.get('category', 'movie'),
+            title_id,
+            MovieUtils.resolution_rank(movie_data.get('quality')),
+            movie_data['size_bytes']
+        )
+    
+    def _insert_movies(self, cursor, movies: List[Dict[str, Any]]):
+        """Insert or update movies with their titles and fuzzy search words"""
+        movies = self.unique_movies(movies)
+        title_ids = self._resolve_title_ids(cursor, movies)
+        movie_ids = self._existing_movie_ids(cursor, movies)
+        cursor.executemany(UPSERT_MOVIE_SQL, [
+            self._movie_row(movie, title_id, movie_id)
+            for movie, title_id, movie_id in zip(movies, title_ids, movie_ids)
+        ])
+        self._add_terms(cursor, [movie['movie_name'] for movie in movies])
+    
     def add_movie(self, movie_data: Dict[str, Any]):
         """Add movie to database"""
         try:
             with self.get_cursor() as cursor:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO movies 
-                    (file_id, file_name, file_size, movie_name, year, quality, language, category)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    movie_data['file_id'],
-                    movie_data['file_name'],
-                    movie_data['file_size'],
-                    movie_data['movie_name'],
-                    movie_data.get('year'),
-                    movie_data.get('quality'),
-                    movie_data.get('language'),
-                    movie_data.get('category', 'movie')
-                ))
+                self._insert_movies(cursor, [movie_data])
+            self.search_cache.invalidate_matching(movie_data['movie_name'], movie_data['file_name'])
         except Exception as e:
             logger.error(f"Error adding movie: {e}")
     
-    def search_movies(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search movies by name"""
+    def add_movies(self, movies: List[Dict[str, Any]], checkpoint: Optional[Tuple[str, int]] = None) -> int:
+        """Add many movies in one transaction, optionally saving an indexer checkpoint with them"""
         try:
             with self.get_cursor() as cursor:
-                cursor.execute('''
-                    SELECT * FROM movies 
-                    WHERE movie_name LIKE ? OR file_name LIKE ?
-                    ORDER BY 
-                        CASE WHEN movie_name LIKE ? THEN 1 ELSE 2 END,
-                        year DESC
+                self._insert_movies(cursor, movies)
+                if checkpoint:
+                    cursor.execute('''
+                        INSERT INTO index_state (key, value) VALUES (?, ?)
+                        ON CONFLICT(key) DO UPDATE SET
+                            value = excluded.value,
+                            updated_at = CURRENT_TIMESTAMP
+                    ''', checkpoint)
+            for movie in movies:
+                self.search_cache.invalidate_matching(movie['movie_name'], movie['file_name'])
+            return len(movies)
+        except Exception as e:
+            logger.error(f"Error adding movies: {e}")
+            return 0
+    
+    def get_checkpoint(self, key: str) -> Optional[int]:
+        """Get a saved indexer checkpoint"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('SELECT value FROM index_state WHERE key = ?', (key,))
+                row = cursor.fetchone()
+                return row['value'] if row else None
+        except Exception as e:
+            logger.error(f"Error getting checkpoint: {e}")
+            return None
+    
+    def search_movies(self, query: str, limit: int = 10, after: Optional[Tuple[float, int]] = None,
+                      before: Optional[Tuple[float, int]] = None,
+                      filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search movies by name, serving repeated queries from search_cache.
+        
+        Results are ordered by (rank, id); every row carries its rank. Pass the
+        (rank, id) of the last row as after for the next page, or of the first
+        row as before for the previous one, so each page costs the same.
+        
+        On the first page, when fewer than fuzzy_min_results rows match, the
+        results of the spelling-corrected query are appended; those rows carry
+        matched_query so later pages can continue with it.
+        
+        filters narrows the results by facet (see facets.facet_conditions).
+        """
+        key = self.search_cache.make_key(query, limit, after, before, filters_key(filters))
+        results = self.search_cache.get(key)
+        if results is None:
+            results = self._search_movies(query, limit, after, before, filters)
+            if results is None:
+                return []
+            first_page = after is None and before is None
+            if first_page and len(results) < min(limit, self.fuzzy_min_results):
+                results = self._add_fuzzy_results(query, limit, results, filters)
+            self.search_cache.set(key, results)
+        return list(results)
+    
+    def _add_fuzzy_results(self, query: str, limit: int, results: List[Dict[str, Any]],
+                           filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Top up results with matches for the spelling-corrected query"""
+        suggestion = self.suggest_query(query)
+        if not suggestion:
+            return results
+        seen = {movie['id'] for movie in results}
+        extra = [
+            dict(movie, matched_query=suggestion)
+            for movie in self._search_movies(suggestion, limit, filters=filters) or []
+            if movie['id'] not in seen
+        ]
+        return (results + extra)[:limit]
+    
+    def _ranked_query(self, query: str, filters: Optional[Dict[str, Any]] = None) -> Tuple[str, List[Any]]:
+        """SELECT of the movies matching query and filters, each with its rank"""
+        conditions, filter_params = facet_conditions(filters, 'movies.')
+        match = self._fts_query(query) if self.fts_enabled else ''
+        if match:
+            # BM25 weighs movie_name 10x over file_name; lower is better
+            ranked = f'''
+                SELECT movies.*, bm25(movies_fts, 10.0, 1.0) AS rank FROM movies_fts
+                JOIN movies ON movies.id = movies_fts.rowid
+                WHERE movies_fts MATCH ? {conditions}
+            '''
+            params = [match]
+        else:
+            ranked = f'''
+                SELECT *, CASE WHEN movie_name LIKE ? THEN 0.0 ELSE 1.0 END AS rank
+                FROM movies
+                WHERE (movie_name LIKE ? OR file_name LIKE ?) {conditions}
+            '''
+            params = [f'{query}%', f'%{query}%', f'%{query}%']
+        return ranked, params + filter_params
+    
+    def _search_movies(self, query: str, limit: int, after: Optional[Tuple[float, int]] = None,
+                       before: Optional[Tuple[float, int]] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        """Run a search against the database; None on error so it is not cached"""
+        try:
+            ranked, params = self._ranked_query(query, filters)
+            
+            if before is not None:
+                where, order = 'WHERE (rank, id) < (?, ?)', 'DESC'
+                params += list(before)
+            elif after is not None:
+                where, order = 'WHERE (rank, id) > (?, ?)', 'ASC'
+                params += list(after)
+            else:
+                where, order = '', 'ASC'
+            
+            with self.get_cursor() as cursor:
+                cursor.execute(f'''
+                    SELECT * FROM ({ranked}) {where}
+                    ORDER BY rank {order}, id {order}
                     LIMIT ?
-                ''', (f'%{query}%', f'%{query}%', f'{query}%', limit))
-                
-                rows = cursor.fetchall()
-                return [dict(row) for row in rows]
+                ''', params + [limit])
+                rows = [dict(row) for row in cursor.fetchall()]
+            
+            return rows[::-1] if before is not None else rows
         except Exception as e:
             logger.error(f"Error searching movies: {e}")
-            return []
+            return None
+    
+    def facet_counts(self, query: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Tuple[Any, int]]]:
+        """Matches per facet value for query within filters, most common first.
+        
+        Returns {'language': [('Hindi', 12), ...], 'resolution': [(1080, 8), ...],
+        'year': [...], 'max_size': [(limit_bytes, count), ...]}. Cached like searches.
+        """
+        key = self.search_cache.make_key(query, 'facets', filters_key(filters))
+        counts = self.search_cache.get(key)
+        if counts is not None:
+            return counts
+        try:
+            ranked, params = self._ranked_query(query, filters)
+            sizes = ' UNION ALL '.join(
+                "SELECT 'max_size', ?, COUNT(*) FROM matched WHERE size_bytes BETWEEN 1 AND ?"
+                for _ in SIZE_LIMITS
+            )
+            with self.get_cursor() as cursor:
+                cursor.execute(f'''
+                    WITH matched AS ({ranked})
+                    SELECT 'language', language, COUNT(*) FROM matched
+                    WHERE language IS NOT NULL GROUP BY language
+                    UNION ALL
+                    SELECT 'resolution', resolution_rank, COUNT(*) FROM matched GROUP BY resolution_rank
+                    UNION ALL
+                    SELECT 'year', year, COUNT(*) FROM matched WHERE year IS NOT NULL GROUP BY year
+                    UNION ALL {sizes}
+                ''', params + [value for limit in SIZE_LIMITS for value in (limit, limit)])
+                rows = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error counting facets: {e}")
+            return {}
+        counts = self._group_facet_counts(rows)
+        self.search_cache.set(key, counts)
+        return counts
+    
+    @staticmethod
+    def _group_facet_counts(rows) -> Dict[str, List[Tuple[Any, int]]]:
+        """(facet, value, count) rows to facet -> [(value, count)], most common first"""
+        counts: Dict[str, List[Tuple[Any, int]]] = {}
+        for facet, value, count in rows:
+            if count:
+                counts.setdefault(facet, []).append((value, count))
+        for facet, values in counts.items():
+            if facet != 'max_size':
+                values.sort(key=lambda item: -item[1])
+        return counts
     
     def add_user(self, user_id: int, username: str, first_name: str, last_name: str = ""):
         """Add or update user"""
+        self.add_users([(user_id, username, first_name, last_name)])
+    
+    def add_users(self, users: List[Tuple[int, str, str, str]]):
+        """Upsert many (user_id, username, first_name, last_name) rows in one transaction.
+        
+        Existing rows keep is_premium and joined_at.
+        """
         try:
             with self.get_cursor() as cursor:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO users (user_id, username, first_name, last_name)
+                cursor.executemany('''
+                    INSERT INTO users (user_id, username, first_name, last_name)
                     VALUES (?, ?, ?, ?)
-                ''', (user_id, username, first_name, last_name))
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        username = excluded.username,
+                        first_name = excluded.first_name,
+                        last_name = excluded.last_name,
+                        is_active = TRUE
+                ''', users)
+        except Exception as e:
+            logger.error(f"Error adding users: {e}")
+    
+    def get_active_user_ids(self, after_user_id: int = 0, limit: int = 500) -> List[int]:
+        """Next limit user_ids above after_user_id of users who have not blocked the bot"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    SELECT user_id FROM users WHERE user_id > ? AND is_active
+                    ORDER BY user_id LIMIT ?
+                ''', (after_user_id, limit))
+                return [row[0] for row in cursor.fetchall()]
         except Exception as e:
-            logger.error(f"Error adding user: {e}")
+            logger.error(f"Error getting active users: {e}")
+            return []
+    
+    def mark_users_inactive(self, user_ids: List[int]):
+        """Skip these users in later broadcasts (they blocked the bot)"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.executemany('UPDATE users SET is_active = FALSE WHERE user_id = ?',
+                                   [(user_id,) for user_id in user_ids])
+        except Exception as e:
+            logger.error(f"Error marking users inactive: {e}")
+    
+    @staticmethod
+    def request_key(title: str) -> str:
+        """Normalized title used to deduplicate requests ("Inception (2010) 1080p" -> "inception")"""
+        return MovieUtils.normalize_title(MovieUtils.parse_movie_info(title)['movie_name'])
+    
+    def _add_request(self, cursor, user_id: int, title: str) -> Optional[Dict[str, Any]]:
+        norm_title = self.request_key(title)
+        if not norm_title:
+            return None
+        # A title requested again after being fulfilled (e.g. files removed) is reopened
+        cursor.execute('''
+            INSERT INTO movie_requests (norm_title, title) VALUES (?, ?)
+            ON CONFLICT(norm_title) DO UPDATE SET status = 'pending'
+        ''', (norm_title, title.strip()))
+        cursor.execute('SELECT id FROM movie_requests WHERE norm_title = ?', (norm_title,))
+        request_id = cursor.fetchone()['id']
+        cursor.execute('''
+            INSERT OR IGNORE INTO movie_request_users (request_id, user_id) VALUES (?, ?)
+        ''', (request_id, user_id))
+        is_new = cursor.rowcount > 0
+        if is_new:
+            cursor.execute(
+                'UPDATE movie_requests SET requester_count = requester_count + 1 WHERE id = ?',
+                (request_id,)
+            )
+        else:
+            cursor.execute('''
+                UPDATE movie_request_users SET notified = FALSE WHERE request_id = ? AND user_id = ?
+            ''', (request_id, user_id))
+        cursor.execute('SELECT * FROM movie_requests WHERE id = ?', (request_id,))
+        request = dict(cursor.fetchone())
+        request['is_new'] = is_new
+        return request
+    
+    def add_request(self, user_id: int, title: str) -> Optional[Dict[str, Any]]:
+        """Record that user_id wants title; returns the request row plus is_new"""
+        try:
+            with self.get_cursor() as cursor:
+                return self._add_request(cursor, user_id, title)
+        except Exception as e:
+            logger.error(f"Error adding request: {e}")
+            return None
+    
+    def title_exists(self, title: str) -> bool:
+        """Whether the catalog already has a title matching a request"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute(
+                    'SELECT 1 FROM titles WHERE canonical_name = ? LIMIT 1', (self.request_key(title),)
+                )
+                return cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Error checking title: {e}")
+            return False
+    
+    def get_top_requests(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Pending requests with the most requesters (served by idx_movie_requests_demand)"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    SELECT id, title, requester_count, created_at FROM movie_requests
+                    WHERE status = 'pending'
+                    ORDER BY requester_count DESC
+                    LIMIT ?
+                ''', (limit,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting top requests: {e}")
+            return []
+    
+    def fulfill_requests(self, movie_names: List[str]) -> List[Dict[str, Any]]:
+        """Mark pending requests for these movie names fulfilled and return them"""
+        try:
+            keys = list({MovieUtils.normalize_title(name) for name in movie_names} - {''})
+            if not keys:
+                return []
+            with self.get_cursor() as cursor:
+                fulfilled = []
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(f'''
+                        SELECT id, title, requester_count FROM movie_requests
+                        WHERE status = 'pending' AND norm_title IN ({placeholders})
+                    ''', chunk)
+                    fulfilled += [dict(row) for row in cursor.fetchall()]
+                cursor.executemany('''
+                    UPDATE movie_requests SET status = 'fulfilled', fulfilled_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', [(request['id'],) for request in fulfilled])
+                return fulfilled
+        except Exception as e:
+            logger.error(f"Error fulfilling requests: {e}")
+            return []
+    
+    def get_unnotified_requests(self) -> List[Dict[str, Any]]:
+        """Fulfilled requests that still have requesters to notify"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    SELECT id, title, requester_count FROM movie_requests r
+                    WHERE status = 'fulfilled' AND EXISTS (
+                        SELECT 1 FROM movie_request_users u
+                        WHERE u.request_id = r.id AND NOT u.notified
+                    )
+                ''')
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting unnotified requests: {e}")
+            return []
+    
+    def get_requesters(self, request_id: int, after_user_id: int = 0, limit: int = 100) -> List[int]:
+        """Next batch of not yet notified requesters, in user_id order"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    SELECT user_id FROM movie_request_users
+                    WHERE request_id = ? AND user_id > ? AND NOT notified
+                    ORDER BY user_id
+                    LIMIT ?
+                ''', (request_id, after_user_id, limit))
+                return [row['user_id'] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting requesters: {e}")
+            return []
+    
+    def mark_requesters_notified(self, request_id: int, user_ids: List[int]):
+        """Record that these requesters have been told"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.executemany('''
+                    UPDATE movie_request_users SET notified = TRUE WHERE request_id = ? AND user_id = ?
+                ''', [(request_id, user_id) for user_id in user_ids])
+        except Exception as e:
+            logger.error(f"Error marking requesters notified: {e}")
+    
+    def schedule_deletions(self, jobs: List[Tuple[int, int, float]]):
+        """Save (chat_id, message_id, due_at) deletion jobs"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO scheduled_deletions (chat_id, message_id, due_at)
+                    VALUES (?, ?, ?)
+                ''', jobs)
+        except Exception as e:
+            logger.error(f"Error scheduling deletions: {e}")
+    
+    def get_scheduled_deletions(self) -> List[Tuple[int, int, float]]:
+        """All pending deletion jobs, earliest first"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    SELECT chat_id, message_id, due_at FROM scheduled_deletions ORDER BY due_at
+                ''')
+                return [tuple(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting scheduled deletions: {e}")
+            return []
+    
+    def remove_scheduled_deletions(self, messages: List[Tuple[int, int]]):
+        """Forget deletion jobs for (chat_id, message_id) pairs"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.executemany('''
+                    DELETE FROM scheduled_deletions WHERE chat_id = ? AND message_id = ?
+                ''', messages)
+        except Exception as e:
+            logger.error(f"Error removing scheduled deletions: {e}")
+    
+    def create_broadcast(self, from_chat_id: int, message_id: int) -> Optional[int]:
+        """Start a broadcast of message_id in from_chat_id; returns its id"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO broadcasts (from_chat_id, message_id) VALUES (?, ?)
+                ''', (from_chat_id, message_id))
+                return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Error creating broadcast: {e}")
+            return None
+    
+    def get_broadcasts(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """Latest broadcasts, newest first"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('SELECT * FROM broadcasts ORDER BY id DESC LIMIT ?', (limit,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting broadcasts: {e}")
+            return []
+    
+    def get_unfinished_broadcasts(self) -> List[Dict[str, Any]]:
+        """Running broadcasts, oldest first"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting unfinished broadcasts: {e}")
+            return []
+    
+    def claim_broadcast(self, broadcast_id: int, owner: str, lease_until: float, now: float) -> bool:
+        """Take a running broadcast unless another process holds a live lease on it"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    UPDATE broadcasts SET owner = ?, lease_until = ?
+                    WHERE id = ? AND status = 'running' AND (owner = ? OR owner IS NULL OR lease_until < ?)
+                ''', (owner, lease_until, broadcast_id, owner, now))
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Error claiming broadcast: {e}")
+            return False
+    
+    def save_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                                blocked: int, lease_until: float) -> bool:
+        """Record progress and extend the lease; False once the broadcast was cancelled"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    UPDATE broadcasts SET last_user_id = ?, sent = ?, failed = ?, blocked = ?, lease_until = ?
+                    WHERE id = ? AND status = 'running'
+                ''', (last_user_id, sent, failed, blocked, lease_until, broadcast_id))
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Error saving broadcast progress: {e}")
+            return True
+    
+    def finish_broadcast(self, broadcast_id: int):
+        """Mark a broadcast as sent to everyone"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    UPDATE broadcasts SET status = 'done', finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'running'
+                ''', (broadcast_id,))
+        except Exception as e:
+            logger.error(f"Error finishing broadcast: {e}")
+    
+    def cancel_broadcasts(self) -> int:
+        """Stop every running broadcast; returns how many were running"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    UPDATE broadcasts SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+                    WHERE status = 'running'
+                ''')
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error cancelling broadcasts: {e}")
+            return 0
+    
+    def log_searches(self, searches: List[Tuple[int, str, str, int, float]]):
+        """Save (user_id, query, norm_query, result_count, searched_at) rows"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.executemany('''
+                    INSERT INTO search_log (user_id, query, norm_query, result_count, searched_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', searches)
+        except Exception as e:
+            logger.error(f"Error logging searches: {e}")
+    
+    def first_search_id(self, since: float) -> int:
+        """Id of the first search at or after since; one past the last id if there is none"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('SELECT MIN(id) FROM search_log WHERE searched_at >= ?', (since,))
+                first = cursor.fetchone()[0]
+                if first is None:
+                    cursor.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM search_log')
+                    first = cursor.fetchone()[0]
+                return first
+        except Exception as e:
+            logger.error(f"Error finding first search: {e}")
+            return 1
+    
+    def get_searches(self, after_id: int = 0, limit: int = 5000) -> List[Tuple[int, str, int, float]]:
+        """(id, norm_query, result_count, searched_at) of searches after after_id, oldest first"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    SELECT id, norm_query, result_count, searched_at FROM search_log
+                    WHERE id > ? ORDER BY id LIMIT ?
+                ''', (after_id, limit))
+                return [tuple(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting searches: {e}")
+            return []
     
     def get_movie_by_id(self, movie_id: int) -> Dict[str, Any]:
-        """Get movie by ID"""
+        """Get movie by ID, following ids merged away by compaction"""
         try:
             with self.get_cursor() as cursor:
                 cursor.execute('''
                     SELECT * FROM movies WHERE id = ?
                 ''', (movie_id,))
                 row = cursor.fetchone()
+                if row is None:
+                    cursor.execute('''
+                        SELECT m.* FROM movie_aliases a JOIN movies m ON m.id = a.movie_id
+                        WHERE a.old_id = ?
+                    ''', (movie_id,))
+                    row = cursor.fetchone()
                 return dict(row) if row else None
         except Exception as e:
             logger.error(f"Error getting movie: {e}")
             return None
     
+    def _movie_alias(self, movie_id: int) -> Optional[int]:
+        """Id of the movie that movie_id was merged into by compaction"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('SELECT movie_id FROM movie_aliases WHERE old_id = ?', (movie_id,))
+                row = cursor.fetchone()
+                return row['movie_id'] if row else None
+        except Exception as e:
+            logger.error(f"Error getting movie alias: {e}")
+            return None
+    
+    @staticmethod
+    def duplicate_groups(rows: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any], List[int]]]:
+        """Group movies rows that are the same file into (kept, newest, merged ids).
+        
+        Rows match on file_unique_id and size, rounded the way movies indexed
+        with only a formatted file_size were stored. The oldest row is kept
+        and takes the file_id of the newest one.
+        """
+        files: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+        for row in sorted(rows, key=lambda row: row['id']):
+            key = (row['file_unique_id'], MovieUtils.rounded_size(row['size_bytes']))
+            files.setdefault(key, []).append(row)
+        return [
+            (same[0], same[-1], [row['id'] for row in same[1:]])
+            for same in files.values() if len(same) > 1
+        ]
+    
+    def compact_movies(self) -> Dict[str, int]:
+        """Merge movies that are the same file, then VACUUM.
+        
+        Merged ids are kept in movie_aliases so buttons already sent still
+        open the kept row. Returns rows removed and database bytes before and after.
+        """
+        def database_bytes():
+            return sum(os.path.getsize(path) for path in (self.db_name, self.db_name + '-wal')
+                       if os.path.exists(path))
+        
+        bytes_before = database_bytes()
+        removed = 0
+        with self.get_cursor() as cursor:
+            self._backfill_unique_ids(cursor)
+            cursor.execute('''
+                SELECT id, file_id, file_size, size_bytes, file_unique_id FROM movies
+                WHERE file_unique_id IN (
+                    SELECT file_unique_id FROM movies GROUP BY file_unique_id HAVING COUNT(*) > 1
+                )
+            ''')
+            groups = self.duplicate_groups([dict(row) for row in cursor.fetchall()])
+            for kept, newest, merged_ids in groups:
+                cursor.executemany('DELETE FROM movies WHERE id = ?', [(old_id,) for old_id in merged_ids])
+                cursor.execute('''
+                    UPDATE movies SET file_id = ?, file_size = ?, size_bytes = ? WHERE id = ?
+                ''', (newest['file_id'], newest['file_size'], newest['size_bytes'], kept['id']))
+                cursor.executemany('UPDATE movie_aliases SET movie_id = ? WHERE movie_id = ?',
+                                   [(kept['id'], old_id) for old_id in merged_ids])
+                cursor.executemany('INSERT OR REPLACE INTO movie_aliases (old_id, movie_id) VALUES (?, ?)',
+                                   [(old_id, kept['id']) for old_id in merged_ids])
+                removed += len(merged_ids)
+            if self.fts_enabled:
+                cursor.execute("INSERT INTO movies_fts(movies_fts) VALUES ('optimize')")
+        
+        conn = self.get_connection()
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.search_cache.clear()
+        return {
+            'groups': len(groups),
+            'removed': removed,
+            'bytes_before': bytes_before,
+            'bytes_after': database_bytes()
+        }
+    
     def get_movies_by_name(self, movie_name: str) -> List[Dict[str, Any]]:
         """Get all movies with same name"""
         try:
             with self.get_cursor() as cursor:
                 cursor.execute('''
-                    SELECT * FROM movies WHERE movie_name = ? ORDER BY quality
+                    SELECT * FROM movies WHERE movie_name = ?
+                    ORDER BY resolution_rank DESC, id
                 ''', (movie_name,))
                 rows = cursor.fetchall()
                 return [dict(row) for row in rows]
@@ -163,6 +1207,72 @@ class Database:
             logger.error(f"Error getting movies by name: {e}")
             return []
     
+    def get_title_variants(self, title_id: int) -> Optional[Dict[str, Any]]:
+        """Get a title with all its files, best resolution first"""
+        return self._title_with_variants('m.title_id = ?', title_id)
+    
+    def get_title_names(self, after_id: int = 0, limit: int = 10000) -> List[Tuple[int, str]]:
+        """(id, canonical_name) of titles after after_id, in id order"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                    SELECT id, canonical_name FROM titles WHERE id > ? ORDER BY id LIMIT ?
+                ''', (after_id, limit))
+                return [tuple(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting title names: {e}")
+            return []
+    
+    def get_movie_with_variants(self, movie_id: int) -> Optional[Dict[str, Any]]:
+        """Get the title of a movie with all its files in one indexed query.
+        
+        Returns {'title': ..., 'movie': ..., 'variants': [...]}; movie is the
+        requested file.
+        """
+        condition = 'm.title_id = (SELECT title_id FROM movies WHERE id = ?)'
+        result = self._title_with_variants(condition, movie_id)
+        if result is None:
+            # Merged into another row by compaction
+            movie_id = self._movie_alias(movie_id)
+            result = self._title_with_variants(condition, movie_id) if movie_id else None
+        if result:
+            result['movie'] = next((v for v in result['variants'] if v['id'] == movie_id), None)
+        return result
+    
+    def _title_with_variants(self, condition: str, param: int) -> Optional[Dict[str, Any]]:
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute(f'''
+                    SELECT m.*, t.display_name AS title_name, t.year AS title_year
+                    FROM movies m JOIN titles t ON t.id = m.title_id
+                    WHERE {condition}
+                    ORDER BY m.resolution_rank DESC, m.id
+                ''', (param,))
+                rows = [dict(row) for row in cursor.fetchall()]
+            if not rows:
+                return None
+            return {
+                'title': {
+                    'id': rows[0]['title_id'],
+                    'name': rows[0]['title_name'],
+                    'year': rows[0]['title_year']
+                },
+                'variants': rows
+            }
+        except Exception as e:
+            logger.error(f"Error getting title variants: {e}")
+            return None
+    
+    def ping(self) -> bool:
+        """Check that the database answers"""
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('SELECT 1')
+                return cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Database ping failed: {e}")
+            return False
+    
     def get_user(self, user_id: int) -> Dict[str, Any]:
         """Get user by ID"""
         try:
@@ -177,5 +1287,121 @@ class Database:
     def close_connection(self):
         """Close database connection"""
         if hasattr(self._local, 'conn'):
+            with self._connections_lock:
+                self._connections.remove(self._local.conn)
             self._local.conn.close()
             del self._local.conn
+    
+    def close_all_connections(self):
+        """Close the connections opened by every thread"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class AsyncDatabase:
+    """Async facade over Database that runs every call on a bounded worker pool.
+    
+    Exposes the same methods as Database as coroutines, so handlers can
+    ``await self.db.search_movies(...)`` without blocking the event loop.
+    Each worker thread keeps its own SQLite connection. If given, observe
+    is called with the method name and its duration (queue wait included).
+    """
+    
+    def __init__(self, db: Database, max_workers: int = 4,
+                 observe: Optional[Callable[[str, float], None]] = None):
+        self.db = db
+        self.observe = observe
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+    
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking callable on the database pool"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            if self.observe:
+                self.observe(func.__name__, time.perf_counter() - started)
+    
+    def queue_size(self) -> int:
+        """Calls waiting for a free worker"""
+        return self._executor._work_queue.qsize()
+    
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+    
+    async def connect(self):
+        """Nothing to open; Database creates its schema on construction"""
+    
+    def _shutdown(self):
+        self._executor.shutdown(wait=True)
+        self.db.close_all_connections()
+    
+    async def close(self):
+        """Wait for pending queries and close all connections"""
+        await asyncio.get_running_loop().run_in_executor(None, self._shutdown)
+
+
+class UserWriteBuffer:
+    """Write-behind buffer for user upserts.
+    
+    Coalesces repeated user_ids and writes them with one add_users call
+    once max_size users are pending or every interval seconds.
+    """
+    
+    def __init__(self, db: AsyncDatabase, max_size: int = 500, interval: float = 2.0):
+        self.db = db
+        self.max_size = max_size
+        self.interval = interval
+        self._pending: Dict[int, Tuple[int, str, str, str]] = {}
+        self._task = None
+        self._flushing = None
+    
+    def add(self, user_id: int, username: str, first_name: str, last_name: str = ""):
+        """Queue a user upsert; the latest data for a user_id wins"""
+        self._pending[user_id] = (user_id, username, first_name, last_name)
+        if len(self._pending) >= self.max_size and not self._flushing:
+            self._flushing = asyncio.ensure_future(self.flush())
+    
+    async def flush(self):
+        """Write all pending users in one transaction"""
+        try:
+            while self._pending:
+                users, self._pending = list(self._pending.values()), {}
+                await self.db.add_users(users)
+        finally:
+            self._flushing = None
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+    
+    def start(self):
+        """Start the periodic flush task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    def pending(self) -> int:
+        """Users waiting to be written"""
+        return len(self._pending)
+    
+    async def stop(self):
+        """Stop the periodic flush and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
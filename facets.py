@@ -0,0 +1,73 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+GB = 1024 ** 3
+
+# "Up to N GB" size chips, in bytes
+SIZE_LIMITS = (1 * GB, 2 * GB, 4 * GB)
+
+# Facet name -> short key used in callback data
+FACET_KEYS = {'language': 'l', 'resolution': 'r', 'max_size': 's', 'year': 'y'}
+FACET_NAMES = {key: name for name, key in FACET_KEYS.items()}
+INT_FACETS = {'resolution', 'max_size', 'year'}
+
+
+def clean_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Known facets with a value, in a fixed order"""
+    filters = filters or {}
+    return {name: filters[name] for name in FACET_KEYS if filters.get(name) is not None}
+
+
+def filters_key(filters: Optional[Dict[str, Any]]) -> Tuple[Tuple[str, Any], ...]:
+    """Hashable form of filters for cache keys"""
+    return tuple(clean_filters(filters).items())
+
+
+def encode_filters(filters: Optional[Dict[str, Any]]) -> str:
+    """Compact text for callback data: "l=Hindi;r=1080"; empty without filters"""
+    return ';'.join(f'{FACET_KEYS[name]}={value}' for name, value in clean_filters(filters).items())
+
+
+def decode_filters(text: str) -> Dict[str, Any]:
+    """Filters from encode_filters; unknown or malformed parts are ignored"""
+    filters = {}
+    for part in (text or '').split(';'):
+        key, _, value = part.partition('=')
+        name = FACET_NAMES.get(key)
+        if name is None or not value:
+            continue
+        if name in INT_FACETS:
+            if not value.isdigit():
+                continue
+            filters[name] = int(value)
+        else:
+            filters[name] = value
+    return clean_filters(filters)
+
+
+def facet_label(name: str, value: Any) -> str:
+    """Chip text for one facet value"""
+    if name == 'resolution':
+        return f'{value}p' if value else 'Other'
+    if name == 'max_size':
+        return f'≤ {value // GB} GB'
+    return str(value)
+
+
+def facet_conditions(filters: Optional[Dict[str, Any]], column_prefix: str = '') -> Tuple[str, List[Any]]:
+    """SQL " AND ..." conditions (with ? placeholders) and their parameters"""
+    sql, params = '', []
+    filters = clean_filters(filters)
+    if 'language' in filters:
+        sql += f' AND {column_prefix}language = ?'
+        params.append(filters['language'])
+    if 'resolution' in filters:
+        sql += f' AND {column_prefix}resolution_rank = ?'
+        params.append(filters['resolution'])
+    if 'max_size' in filters:
+        # 0 means the size is unknown
+        sql += f' AND {column_prefix}size_bytes BETWEEN 1 AND ?'
+        params.append(filters['max_size'])
+    if 'year' in filters:
+        sql += f' AND {column_prefix}year = ?'
+        params.append(filters['year'])
+    return sql, params
@@ -0,0 +1,101 @@
+import re
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+# Chatter around a title ("bro send kgf 2 movie pls"); ignored when judging
+# whether a message names a title
+FILLER_WORDS = frozenset('''
+    a an the and or of in on at to for from with is are was be it its this that these those
+    i me my we you your he she they them hi hello hey ok okay yes no not bro sis pls plz please
+    thanks thank send give share link links movie movies film films series any anyone have has
+    need want available upload download watch full hd
+'''.split())
+
+
+class TitleFilter:
+    """Cheap in-memory check of whether a group message names a catalog title.
+
+    Holds every word of every title name. A message passes when it is short,
+    at least min_ratio of its non-filler words are title words and one of
+    those is distinctive (not a bare number or one letter). Only messages
+    that pass cost a database search.
+    """
+
+    def __init__(self, max_words: int = 8, min_ratio: float = 0.5):
+        self.max_words = max_words
+        self.min_ratio = min_ratio
+        self._words: Set[str] = set()
+
+    def add(self, names: Iterable[str]):
+        """Learn the words of title names"""
+        for name in names:
+            self._words.update(WORD_RE.findall(name.casefold()))
+
+    def replace(self, words: Set[str]):
+        """Swap in a freshly built word set"""
+        self._words = words
+
+    def query(self, text: str) -> Optional[str]:
+        """Search query made of the title words in text, None if it is chatter"""
+        words = WORD_RE.findall(text.casefold())
+        if not words or len(words) > self.max_words:
+            return None
+        content = [word for word in words if word not in FILLER_WORDS]
+        known = [word for word in content if word in self._words]
+        if len(known) < max(1, len(content) * self.min_ratio):
+            return None
+        if not any(len(word) > 1 and not word.isdigit() for word in known):
+            return None
+        return ' '.join(known)
+
+    def __len__(self):
+        return len(self._words)
+
+
+class BurstCoalescer:
+    """Collect items per key for a short window and handle them together.
+
+    The first item for a key starts a window of delay seconds; everything
+    added for that key until it closes goes to one flush(key, items) call,
+    so a burst of group messages gets a single reply.
+    """
+
+    def __init__(self, flush: Callable[[Hashable, List[Any]], Awaitable[Any]], delay: float = 2.0):
+        self.flush = flush
+        self.delay = delay
+        self._pending: Dict[Hashable, List[Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, key: Hashable, item: Any):
+        """Queue item for key's current window, opening one if needed"""
+        items = self._pending.get(key)
+        if items is not None:
+            items.append(item)
+            return
+        self._pending[key] = [item]
+        task = asyncio.create_task(self._close_window(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _close_window(self, key: Hashable):
+        await asyncio.sleep(self.delay)
+        items = self._pending.pop(key)
+        try:
+            await self.flush(key, items)
+        except Exception as e:
+            logger.error(f"Error flushing burst for {key}: {e}")
+
+    def pending(self) -> int:
+        """Keys with an open window"""
+        return len(self._pending)
+
+    async def stop(self):
+        """Drop open windows without flushing them"""
+        for task in list(self._tasks):
+            task.cancel()
+        self._pending.clear()
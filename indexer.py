@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, Any, List, Optional
+
+from pyrogram import Client, enums, filters, idle
+from pyrogram.errors import FloodWait
+from pyrogram.handlers import MessageHandler
+
+from config import Config
+from storage import Storage, create_storage
+from shared import SharedState, create_shared_state
+from notifier import RequestNotifier
+from ratelimit import OutboundRateLimiter
+from utils import MovieUtils
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class ChannelIndexer:
+    """Fill the movies table from the media posted in Config.CHANNEL_ID.
+
+    History is walked by message id in batches of Config.INDEX_BATCH_SIZE
+    (bots cannot call getHistory, but can fetch messages by id). Each batch
+    is written in one transaction together with its checkpoint, so a restart
+    resumes after the last indexed message. A batch that cannot be written
+    stops the run instead of being skipped.
+    """
+
+    # Consecutive empty batches after which the end of the channel is assumed
+    MAX_EMPTY_BATCHES = 5
+    # Tries per batch write, WRITE_RETRY_DELAY seconds apart (doubling)
+    WRITE_ATTEMPTS = 5
+    WRITE_RETRY_DELAY = 1.0
+
+    def __init__(self, config: Config, db: Storage, shared: Optional[SharedState] = None):
+        self.config = config
+        self.db = db
+        # Bot processes drop their cached searches when this bumps the generation
+        self.shared = shared
+        self.checkpoint_key = f"channel:{config.CHANNEL_ID}"
+        self.total_rows = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_last_id = 0
+        # New posts are only written once history is done, so their
+        # checkpoint never jumps past unindexed history
+        self._live = False
+        self.client = None
+        # The bot's outbound bucket, shared with it through the SharedState
+        self.limiter = OutboundRateLimiter(config.OUTBOUND_RATE, int(config.OUTBOUND_RATE), shared=shared)
+        self.notifier = RequestNotifier(db, self.send_notification, self.limiter)
+
+    @staticmethod
+    def movies_from_messages(messages) -> List[Dict[str, Any]]:
+        """Build movies rows from channel messages, skipping those without a file"""
+        files = []
+        for message in messages:
+            media = message.document or message.video
+            if not media:
+                continue
+            file_name = getattr(media, 'file_name', None) or (message.caption or '').split('\n')[0]
+            if file_name:
+                files.append((media, file_name))
+        rows = []
+        for (media, file_name), info in zip(files, MovieUtils.parse_many([name for _, name in files])):
+            rows.append({
+                'file_id': media.file_id,
+                'file_unique_id': media.file_unique_id,
+                'file_name': file_name,
+                'size_bytes': media.file_size or 0,
+                'movie_name': info['movie_name'],
+                'year': info.get('year'),
+                'quality': info.get('quality'),
+                'language': info.get('language'),
+                'category': info.get('category', 'movie')
+            })
+        return rows
+
+    async def _fetch(self, client: Client, message_ids: List[int]):
+        """get_messages with FloodWait handling"""
+        while True:
+            try:
+                return await client.get_messages(self.config.CHANNEL_ID, message_ids)
+            except FloodWait as e:
+                logger.warning(f"FloodWait while indexing, sleeping {e.value}s")
+                await asyncio.sleep(e.value)
+
+    async def send_notification(self, user_id: int, text: str):
+        """send_message with FloodWait handling"""
+        while True:
+            try:
+                return await self.client.send_message(user_id, text, parse_mode=enums.ParseMode.HTML)
+            except FloodWait as e:
+                logger.warning(f"FloodWait while notifying, sleeping {e.value}s")
+                await self.limiter.pause(e.value)
+                await asyncio.sleep(e.value)
+
+    async def _write(self, rows: List[Dict[str, Any]], last_id: int) -> int:
+        """Save rows with their checkpoint and queue notifications for requests they fulfil.
+        
+        add_movies returns 0 when its transaction failed; the batch is tried
+        again and, if it keeps failing, RuntimeError is raised so the
+        checkpoint never moves past rows that were not written.
+        """
+        delay = self.WRITE_RETRY_DELAY
+        for attempt in range(1, self.WRITE_ATTEMPTS + 1):
+            written = await self.db.add_movies(rows, (self.checkpoint_key, last_id))
+            if written or not rows:
+                break
+            if attempt == self.WRITE_ATTEMPTS:
+                raise RuntimeError(f"Could not write {len(rows)} rows up to message {last_id}")
+            logger.warning(f"Writing rows up to message {last_id} failed, retrying in {delay:g}s")
+            await asyncio.sleep(delay)
+            delay *= 2
+        if written:
+            self.notifier.enqueue(await self.db.fulfill_requests([row['movie_name'] for row in rows]))
+            if self.shared:
+                await self.shared.bump_cache_generation()
+        return written
+
+    async def index_history(self, client: Client):
+        """Walk the channel from the saved checkpoint to its end"""
+        batch_size = self.config.INDEX_BATCH_SIZE
+        last_id = await self.db.get_checkpoint(self.checkpoint_key) or 0
+        logger.info(f"Indexing channel history from message {last_id + 1}")
+
+        started = time.monotonic()
+        next_id = last_id + 1
+        empty_batches = 0
+
+        while empty_batches < self.MAX_EMPTY_BATCHES:
+            message_ids = list(range(next_id, next_id + batch_size))
+            next_id += batch_size
+
+            messages = [m for m in await self._fetch(client, message_ids) if not m.empty]
+            if not messages:
+                empty_batches += 1
+                continue
+            empty_batches = 0
+
+            rows = self.movies_from_messages(messages)
+            last_id = max(m.id for m in messages)
+            self.total_rows += await self._write(rows, last_id)
+
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"Indexed up to message {last_id}: {self.total_rows} rows, "
+                f"{self.total_rows / elapsed:.0f} rows/s"
+            )
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"History indexed: {self.total_rows} rows in {elapsed:.1f}s "
+            f"({self.total_rows / max(elapsed, 1e-9):.0f} rows/s)"
+        )
+
+    async def on_new_post(self, client: Client, message):
+        """Queue a new channel post for the next batched write"""
+        self._pending.extend(self.movies_from_messages([message]))
+        self._pending_last_id = max(self._pending_last_id, message.id)
+        if self._live and len(self._pending) >= self.config.INDEX_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        """Write queued new posts in one transaction"""
+        if not self._pending_last_id:
+            return
+        rows, self._pending = self._pending, []
+        last_id, self._pending_last_id = self._pending_last_id, 0
+        try:
+            self.total_rows += await self._write(rows, last_id)
+        except Exception:
+            # Keep the posts queued for the next flush
+            self._pending[:0] = rows
+            self._pending_last_id = max(self._pending_last_id, last_id)
+            raise
+        if rows:
+            logger.info(f"Indexed {len(rows)} new posts up to message {last_id}")
+
+    async def flush_periodically(self):
+        """Flush new posts at least every INDEX_FLUSH_SECONDS"""
+        while True:
+            await asyncio.sleep(self.config.INDEX_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing new posts: {e}")
+
+    async def run(self, history: bool = True):
+        """Index the channel history, then keep indexing new posts"""
+        client = self.client = Client(
+            "filmzi_indexer",
+            api_id=self.config.API_ID,
+            api_hash=self.config.API_HASH,
+            bot_token=self.config.BOT_TOKEN
+        )
+        media = filters.document | filters.video
+        client.add_handler(MessageHandler(self.on_new_post, filters.chat(self.config.CHANNEL_ID) & media))
+
+        async with client:
+            if self.shared:
+                self.notifier.start()
+            else:
+                # A private bucket would add its rate on top of the bot's, so the
+                # bot process sends them from the database through its own limiter
+                logger.info("No SHARED_STATE_URL: the bot process notifies requesters")
+            if history:
+                await self.index_history(client)
+            self._live = True
+
+            flusher = asyncio.create_task(self.flush_periodically())
+            logger.info("Watching channel for new posts...")
+            try:
+                await idle()
+            finally:
+                flusher.cancel()
+                await self.flush()
+                await self.notifier.stop()
+
+
+async def index(config: Config, history: bool):
+    """Run the indexer against the configured storage backend"""
+    db = create_storage(config)
+    shared = create_shared_state(config.SHARED_STATE_URL)
+    await db.connect()
+    try:
+        await ChannelIndexer(config, db, shared).run(history=history)
+    finally:
+        await db.close()
+        if shared:
+            await shared.close()
+
+
+def main():
+    """Entry point: python indexer.py [--no-history]"""
+    parser = argparse.ArgumentParser(description="Index CHANNEL_ID media into the movies table")
+    parser.add_argument('--no-history', action='store_true', help="only watch new posts")
+    args = parser.parse_args()
+
+    config = Config()
+    config.validate_config()
+
+    try:
+        asyncio.run(index(config, history=not args.no_history))
+    except KeyboardInterrupt:
+        logger.info("Indexer stopped by user")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import asyncio
+import itertools
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class InlineDebouncer:
+    """Answer only the last of a user's rapid inline queries.
+
+    Inline mode sends a query for every keystroke. Each one waits delay
+    seconds in settle(); if the same user typed again meanwhile, the older
+    query is dropped unanswered (Telegram discards stale answers anyway),
+    so a typed title costs one search instead of one per letter. The
+    update processor settles queries before they take a slot.
+    """
+
+    def __init__(self, delay: float = 0.3):
+        self.delay = delay
+        self._latest: Dict[Hashable, int] = {}
+        self._tokens = itertools.count(1)
+
+    async def settle(self, user_id: Hashable) -> bool:
+        """Wait out the debounce delay; False if a newer query superseded this one"""
+        token = next(self._tokens)
+        self._latest[user_id] = token
+        await asyncio.sleep(self.delay)
+        if self._latest.get(user_id) != token:
+            return False
+        del self._latest[user_id]
+        return True
+
+    def __len__(self):
+        return len(self._latest)
+
+
+def encode_offset(rank: float, movie_id: int, handle: Optional[int] = None) -> str:
+    """next_offset for the page after the row (rank, movie_id).
+
+    handle refers to the spelling-corrected query the row matched, if any;
+    Telegram limits offsets to 64 bytes, so the query itself is not stored.
+    """
+    offset = f"{float(rank)!r}:{movie_id}"
+    if handle is not None:
+        offset += f":{handle}"
+    return offset
+
+
+def decode_offset(offset: str) -> Optional[Tuple[float, int, Optional[int]]]:
+    """(rank, movie_id, handle) of an offset from encode_offset; None for the first page"""
+    if not offset:
+        return None
+    parts = offset.split(':')
+    try:
+        handle = int(parts[2]) if len(parts) > 2 else None
+        return float(parts[0]), int(parts[1]), handle
+    except (ValueError, IndexError):
+        return None
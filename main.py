@@ -1,11 +1,18 @@
 import os
+import json
+import hmac
+import time
+import socket
+import argparse
 import logging
+import secrets
 import asyncio
 import sqlite3
 from telegram import (
     Update, 
     InlineKeyboardButton, 
     InlineKeyboardMarkup,
+    InlineQueryResultCachedDocument,
     BotCommand
 )
 from telegram.ext import (
@@ -15,15 +22,34 @@ from telegram.ext import (
     filters, 
     ContextTypes,
     CallbackQueryHandler,
-    ApplicationBuilder
+    InlineQueryHandler,
+    ApplicationBuilder,
+    ApplicationHandlerStop,
+    TypeHandler
 )
+from telegram.constants import ChatType
+from telegram.helpers import escape_markdown
 import aiohttp
 from aiohttp import web
 import threading
 
 from config import Config
-from database import Database
+from analytics import SearchLog
+from broadcast import Broadcaster
+from database import UserWriteBuffer
+from storage import create_storage
 from utils import MovieUtils, BotUtils
+from callbacks import Action, CallbackCodec, CallbackExpired, HandleTable
+from cache import SearchCache
+from facets import decode_filters, encode_filters, facet_label
+from groups import BurstCoalescer, TitleFilter, WORD_RE
+from inline import InlineDebouncer, decode_offset, encode_offset
+from metrics import Metrics, InstrumentedRequest
+from responses import PendingReply
+from notifier import RequestNotifier
+from scheduler import DeletionScheduler
+from ratelimit import ChatOrderedUpdateProcessor, OutboundRateLimiter, UserRateLimiter
+from shared import assign_partitions, create_shared_state, encode_update, update_partition
 
 # Set up logging
 logging.basicConfig(
@@ -35,18 +61,72 @@ logger = logging.getLogger(__name__)
 class FilmziBot:
     def __init__(self):
         self.config = Config()
-        self.db = Database(self.config.DB_NAME)
+        self.metrics = Metrics()
+        self.db = create_storage(self.config, self.metrics.db_latency.observe)
+        self.user_buffer = UserWriteBuffer(
+            self.db, self.config.USER_FLUSH_SIZE, self.config.USER_FLUSH_SECONDS
+        )
+        self.search_log = SearchLog(
+            self.db, self.config.SEARCH_LOG_FLUSH_SIZE, self.config.SEARCH_LOG_FLUSH_SECONDS,
+            self.config.TRENDING_TOP_K, self.config.TRENDING_BUCKET_SECONDS, self.config.TRENDING_BUCKETS
+        )
         self.movie_utils = MovieUtils()
         self.bot_utils = BotUtils()
+        self.deletions = DeletionScheduler(self.db)
+        self.user_limiter = UserRateLimiter(self.config.USER_RATE, self.config.USER_BURST)
+        self.shared = create_shared_state(self.config.SHARED_STATE_URL)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        if self.shared:
+            # Random handles so workers never hand out the same one
+            handles = HandleTable(
+                ttl=self.config.CALLBACK_HANDLE_TTL,
+                ids=iter(lambda: secrets.randbits(40), None),
+                on_put=self.share_handle
+            )
+        else:
+            handles = HandleTable(ttl=self.config.CALLBACK_HANDLE_TTL)
+        self.callbacks = CallbackCodec(handles)
+        self.broadcaster = Broadcaster(
+            self.db, self.worker_id, self.config.BROADCAST_RATE, self.config.BROADCAST_MIN_RATE,
+            self.config.BROADCAST_BATCH_SIZE, self.config.BROADCAST_LEASE_SECONDS,
+            self.config.BROADCAST_POLL_SECONDS
+        )
+        # The indexer notifies requesters when it can share the outbound bucket
+        self.notifier = None if self.shared else RequestNotifier(
+            self.db, self.send_notification, poll=self.config.NOTIFY_POLL_SECONDS
+        )
+        self.inline_debouncer = InlineDebouncer(self.config.INLINE_DEBOUNCE)
+        # Built answers per (query, offset); matches the cache_time Telegram is given
+        self.inline_cache = SearchCache(self.config.SEARCH_CACHE_SIZE, self.config.INLINE_CACHE_TIME)
+        self.title_filter = TitleFilter(self.config.GROUP_MAX_WORDS)
+        self.group_bursts = BurstCoalescer(self.flush_group_burst, self.config.GROUP_BURST_SECONDS)
+        self._background = set()
+        self._cache_generation = None
+        self._cache_checked = 0.0
+        self.callback_routes = {
+            Action.MAIN_MENU: self.show_main_menu,
+            Action.BUY_PREMIUM: self.show_premium_purchase,
+            Action.SELECT: self.send_movie_details,
+            Action.MORE: self.show_more_results,
+            Action.QUALITY: self.send_download_options,
+            Action.DOWNLOAD: self.send_file,
+            Action.ALL_QUALITIES: self.send_all_qualities,
+            Action.PAGE: self.show_results_page,
+            Action.FILTER: self.show_filtered_results
+        }
         self.application = None
+        self.web_runner = None
+        # Telegram echoes this in every webhook request; random if not configured
+        self.webhook_secret = self.config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        self.register_gauges()
         
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Send welcome message when command /start is issued."""
         try:
             user = update.effective_user
             
-            # Add user to database
-            self.db.add_user(
+            # Queue user upsert; written in batches by user_buffer
+            self.user_buffer.add(
                 user.id, 
                 user.username, 
                 user.first_name, 
@@ -72,8 +152,8 @@ class FilmziBot:
             plans_text = self.bot_utils.get_premium_plans()
             
             keyboard = [
-                [InlineKeyboardButton("💳 Buy Premium", callback_data="buy_premium")],
-                [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
+                [InlineKeyboardButton("💳 Buy Premium", callback_data=self.callbacks.encode(Action.BUY_PREMIUM))],
+                [InlineKeyboardButton("🔙 Back", callback_data=self.callbacks.encode(Action.MAIN_MENU))]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
@@ -103,64 +183,352 @@ For issues contact @your_admin
 """
         await update.message.reply_text(help_text, parse_mode='Markdown')
     
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle movie search requests"""
+    async def request_movie(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Record a request for a movie that is not in the catalog"""
         try:
-            query = update.message.text.strip()
-            
-            if len(query) < 2:
-                await update.message.reply_text("🔍 Please enter at least 2 characters to search.")
+            title = ' '.join(context.args).strip()
+            if len(title) < 2:
+                await update.message.reply_text("📝 Usage: /request <movie name>\n\nExample: /request Inception 2010")
                 return
             
-            # Show searching message
-            search_msg = await update.message.reply_text(f"🔍 Searching for '{query}'...")
-            
-            # Add quote reaction (using text emoji)
-            await update.message.reply_text("💭")
-            
-            # Search in database
-            results = self.db.search_movies(query, self.config.MAX_RESULTS)
-            
-            if not results:
-                await search_msg.edit_text(
-                    f"❌ No results found for '{query}'\n\n"
-                    "If you can't find your movie, please:\n"
-                    "• Check the spelling\n" 
-                    "• Use /request to request it\n"
-                    "• Try different keywords"
-                )
+            if await self.db.title_exists(title):
+                await update.message.reply_text(f"✅ '{title}' is already available. Just send the name to search for it!")
                 return
             
-            # Format results
-            response_text = f"**🎬 Search Results for '{query}'**\n\n"
-            
-            for i, movie in enumerate(results, 1):
-                response_text += f"**{i}.** {movie['movie_name']}"
-                if movie.get('year'):
-                    response_text += f" ({movie['year']})"
-                response_text += f"\n   📁 {movie.get('quality', '480p')} | 📊 {movie.get('file_size', 'N/A')}\n\n"
+            request = await self.db.add_request(update.effective_user.id, title)
+            if not request:
+                await update.message.reply_text("🚫 Could not record your request. Please try again.")
+                return
             
-            # Create keyboard with results
-            keyboard = []
-            for movie in results[:5]:
-                btn_text = f"🎬 {movie['movie_name'][:20]}..."
-                if movie.get('year'):
-                    btn_text += f" ({movie['year']})"
-                keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"select_{movie['id']}")])
+            others = request['requester_count'] - 1
+            # Titles are user text: "kgf_2" would not parse as Markdown
+            shown = escape_markdown(request['title'])
+            text = f"📝 Request for **{shown}** recorded." if request['is_new'] \
+                else f"📝 You have already requested **{shown}**."
+            if others:
+                text += f"\n👥 {others} other user{'s' if others != 1 else ''} requested it too."
+            text += "\n\nWe will message you when it is available."
+            await update.message.reply_text(text, parse_mode='Markdown')
+        except Exception as e:
+            logger.error(f"Error in request command: {e}")
+            await update.message.reply_text("🚫 An error occurred. Please try again.")
+    
+    async def send_notification(self, user_id: int, text: str):
+        """Message a requester through the bot's outbound limiter"""
+        await self.application.bot.send_message(user_id, text, parse_mode='HTML')
+    
+    async def show_requests(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Admin only: most requested titles that are still missing"""
+        if update.effective_user.id != self.config.ADMIN_ID:
+            return
+        try:
+            requests = await self.db.get_top_requests(20)
+            if not requests:
+                await update.message.reply_text("📭 No pending requests.")
+                return
             
-            if len(results) > 5:
-                keyboard.append([InlineKeyboardButton("🔍 More Results", callback_data=f"more_{query}")])
+            text = "📊 **Top Requests**\n\n"
+            for i, request in enumerate(requests, 1):
+                text += f"{i}. {escape_markdown(request['title'])} — {request['requester_count']} requests\n"
+            await update.message.reply_text(text, parse_mode='Markdown')
+        except Exception as e:
+            logger.error(f"Error in requests command: {e}")
+            await update.message.reply_text("🚫 An error occurred. Please try again.")
+    
+    async def show_trending(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Admin only: most searched queries and most searched queries with no results"""
+        if update.effective_user.id != self.config.ADMIN_ID:
+            return
+        try:
+            await self.search_log.refresh()
+            hours = self.config.TRENDING_BUCKET_SECONDS * self.config.TRENDING_BUCKETS / 3600
+            text = f"📈 **Trending searches** (last {hours:g}h)\n\n"
+            trending = self.search_log.trending.top()
+            for i, (query, count) in enumerate(trending, 1):
+                text += f"{i}. {query} — ~{count}\n"
+            if not trending:
+                text += "No searches yet.\n"
             
-            keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")])
+            text += "\n🕳 **Searches with no results**\n\n"
+            missing = self.search_log.missing.top()
+            for i, (query, count) in enumerate(missing, 1):
+                text += f"{i}. {query} — ~{count}\n"
+            if not missing:
+                text += "None.\n"
+            await update.message.reply_text(text, parse_mode='Markdown')
+        except Exception as e:
+            logger.error(f"Error in trending command: {e}")
+            await update.message.reply_text("🚫 An error occurred. Please try again.")
+    
+    async def broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Admin only: reply to a message with /broadcast to send it to every user"""
+        if update.effective_user.id != self.config.ADMIN_ID:
+            return
+        try:
+            action = context.args[0].lower() if context.args else ''
+            if action == 'status':
+                broadcasts = await self.db.get_broadcasts(5)
+                if not broadcasts:
+                    await update.message.reply_text("📭 No broadcasts yet.")
+                    return
+                text = "📣 **Broadcasts**\n\n"
+                for broadcast in broadcasts:
+                    text += (
+                        f"#{broadcast['id']} {broadcast['status']} — {broadcast['sent']} sent, "
+                        f"{broadcast['blocked']} blocked, {broadcast['failed']} failed\n"
+                    )
+                text += f"\nRate: {self.broadcaster.rate():g} msg/s"
+                await update.message.reply_text(text, parse_mode='Markdown')
+            elif action == 'cancel':
+                cancelled = await self.db.cancel_broadcasts()
+                await update.message.reply_text(f"🛑 Cancelled {cancelled} broadcast{'s' if cancelled != 1 else ''}.")
+            elif update.message.reply_to_message:
+                message = update.message.reply_to_message
+                broadcast_id = await self.db.create_broadcast(message.chat_id, message.message_id)
+                if broadcast_id is None:
+                    await update.message.reply_text("🚫 Could not start the broadcast.")
+                    return
+                self.broadcaster.wake()
+                await update.message.reply_text(
+                    f"📣 Broadcast #{broadcast_id} started.\n\n"
+                    "/broadcast status shows progress, /broadcast cancel stops it."
+                )
+            else:
+                await update.message.reply_text(
+                    "Reply to the message to send with /broadcast.\n\n"
+                    "/broadcast status — progress\n"
+                    "/broadcast cancel — stop running broadcasts"
+                )
+        except Exception as e:
+            logger.error(f"Error in broadcast command: {e}")
+            await update.message.reply_text("🚫 An error occurred. Please try again.")
+    
+    async def rate_limit(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Drop updates from users over their token bucket before any handler runs"""
+        user = update.effective_user
+        # Inline queries arrive per keystroke and group chatter is mostly not
+        # searches; inline_search and the group burst window limit those
+        if user is None or update.inline_query or self.is_group_chatter(update):
+            return
+        if await self.allow_user(user.id):
+            return
+        if update.callback_query:
+            await update.callback_query.answer("⏳ Too many requests, please slow down.")
+        raise ApplicationHandlerStop
+    
+    @staticmethod
+    def is_group_chatter(update: Update) -> bool:
+        """Whether update is a plain (non-command) group message"""
+        message = update.message
+        return (message is not None and not (message.text or '').startswith('/')
+                and message.chat.type in (ChatType.GROUP, ChatType.SUPERGROUP))
+    
+    async def allow_user(self, user_id: int) -> bool:
+        """Take a token from user_id's bucket (shared between workers if configured)"""
+        if user_id == self.config.ADMIN_ID:
+            return True
+        if self.shared:
+            wait = await self.shared.acquire(
+                f'user:{user_id}', self.config.USER_RATE, self.config.USER_BURST, reserve=False
+            )
+            return not wait
+        return self.user_limiter.allow(user_id)
+    
+    async def sync_cache(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Drop cached searches once another process has changed the catalog"""
+        now = time.monotonic()
+        if now - self._cache_checked < self.config.CACHE_SYNC_SECONDS:
+            return
+        self._cache_checked = now
+        try:
+            generation = await self.shared.cache_generation()
+        except Exception as e:
+            logger.error(f"Error reading cache generation: {e}")
+            return
+        if generation != self._cache_generation:
+            self.db.search_cache.clear()
+            self._cache_generation = generation
+    
+    def share_handle(self, handle: int, value: str):
+        """Publish a new callback handle so any worker can decode the button"""
+        task = asyncio.get_running_loop().create_task(
+            self.shared.put_handle(handle, value, self.config.CALLBACK_HANDLE_TTL)
+        )
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+    
+    async def decode_callback(self, data: str):
+        """Decode callback data, fetching handles made by other workers"""
+        legacy = self.callbacks.decode_legacy(data)
+        if legacy:
+            return legacy
+        while True:
+            try:
+                return self.callbacks.decode(data)
+            except CallbackExpired as e:
+                value = await self.shared.get_handle(e.handle) if self.shared else None
+                if value is None:
+                    raise
+                self.callbacks.handles.restore(e.handle, value)
+    
+    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle movie search requests"""
+        try:
+            query = update.message.text.strip()
             
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            if len(query) < 2:
+                await update.message.reply_text("🔍 Please enter at least 2 characters to search.")
+                return
             
-            await search_msg.edit_text(response_text, reply_markup=reply_markup, parse_mode='Markdown')
+            # One reply per search; typing shows only if the search is slow
+            async with PendingReply.to_message(update.message, self.config.TYPING_DELAY) as reply:
+                # Search in database; one extra row tells whether there is a next page
+                per_page = self.config.RESULTS_PER_PAGE
+                results = await self.db.search_movies(query, per_page + 1)
+                # Count is capped at one page plus one; enough to spot empty searches
+                self.search_log.add(update.effective_user.id, query, len(results))
+                
+                if not results:
+                    reply.update(
+                        f"❌ No results found for '{query}'\n\n"
+                        "If you can't find your movie, please:\n"
+                        "• Check the spelling\n" 
+                        "• Use /request to request it\n"
+                        "• Try different keywords"
+                    )
+                    return
+                
+                # Filter chips only help when there is more than one page
+                has_next = len(results) > per_page
+                facets = await self.db.facet_counts(query) if has_next else None
+                response_text, reply_markup = self.build_results_page(
+                    query, results[:per_page], 1, has_next=has_next, facets=facets
+                )
+                reply.update(response_text, reply_markup=reply_markup, parse_mode='Markdown')
             
         except Exception as e:
             logger.error(f"Error handling message: {e}")
             await update.message.reply_text("🚫 An error occurred while searching. Please try again.")
     
+    async def inline_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer inline queries with cached documents, one page per offset"""
+        inline_query = update.inline_query
+        try:
+            query = inline_query.query.strip()
+            if len(query) < 2:
+                return
+            if not await self.allow_user(inline_query.from_user.id):
+                return
+            
+            key = self.inline_cache.make_key(query, inline_query.offset)
+            answer = self.inline_cache.get(key)
+            if answer is None:
+                answer = await self.build_inline_page(query, inline_query.offset)
+                self.inline_cache.set(key, answer)
+            results, next_offset = answer
+            await inline_query.answer(
+                results,
+                cache_time=self.config.INLINE_CACHE_TIME,
+                next_offset=next_offset
+            )
+        except Exception as e:
+            logger.error(f"Error answering inline query: {e}")
+    
+    async def build_inline_page(self, query: str, offset: str):
+        """Cached-document results after offset and the offset of the next page"""
+        per_page = self.config.INLINE_RESULTS
+        search_query, after = query, None
+        cursor = decode_offset(offset)
+        if cursor:
+            rank, movie_id, handle = cursor
+            after = (rank, movie_id)
+            if handle is not None:
+                matched = self.callbacks.handles.get(handle)
+                if matched is None and self.shared:
+                    matched = await self.shared.get_handle(handle)
+                search_query = matched or query
+        # One extra row tells whether there is a next page
+        movies = await self.db.search_movies(search_query, per_page + 1, after=after)
+        
+        results = []
+        for movie in movies[:per_page]:
+            title = movie['movie_name']
+            if movie.get('year'):
+                title += f" ({movie['year']})"
+            results.append(InlineQueryResultCachedDocument(
+                id=str(movie['id']),
+                title=title,
+                document_file_id=movie['file_id'],
+                description=f"📁 {movie.get('quality', '480p')} | 📊 {self.movie_utils.display_size(movie)}",
+                caption=f"🎬 {title}"
+            ))
+        
+        next_offset = ''
+        if len(movies) > per_page:
+            last = movies[per_page - 1]
+            matched = last.get('matched_query')
+            handle = self.callbacks.handles.put(matched) if matched else None
+            next_offset = encode_offset(last['rank'], last['id'], handle)
+        return results, next_offset
+    
+    async def group_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Group auto-filter: queue messages that look like a catalog title"""
+        message = update.message
+        query = self.title_filter.query(message.text)
+        if query:
+            self.group_bursts.add(message.chat_id, (message, query))
+    
+    async def flush_group_burst(self, chat_id: int, items):
+        """Answer a burst of title-like group messages with one reply"""
+        queries = list(dict.fromkeys(query for _, query in items))
+        
+        text = "🎬 **Found in the catalog:**\n\n"
+        keyboard = []
+        seen = set()
+        for query in queries[-self.config.GROUP_MAX_QUERIES:]:
+            # Spelling-corrected matches are too loose to post unasked
+            results = [
+                movie for movie in await self.db.search_movies(query, self.config.GROUP_RESULTS)
+                if 'matched_query' not in movie and movie['id'] not in seen
+            ]
+            for movie in results:
+                seen.add(movie['id'])
+                name = movie['movie_name']
+                if movie.get('year'):
+                    name += f" ({movie['year']})"
+                text += f"• {name}\n   📁 {movie.get('quality', '480p')} | 📊 {self.movie_utils.display_size(movie)}\n"
+                keyboard.append([InlineKeyboardButton(
+                    f"🎬 {name[:30]}", callback_data=self.callbacks.encode(Action.SELECT, movie['id'])
+                )])
+        if not keyboard:
+            return
+        
+        # Reply to the latest message of the burst
+        await items[-1][0].reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    
+    async def load_titles(self):
+        """Rebuild the group title filter from the titles table"""
+        words = set()
+        after = 0
+        while True:
+            rows = await self.db.get_title_names(after)
+            if not rows:
+                break
+            for _, name in rows:
+                words.update(WORD_RE.findall(name.casefold()))
+            after = rows[-1][0]
+        self.title_filter.replace(words)
+        logger.info(f"Group title filter has {len(words)} words")
+    
+    async def refresh_titles(self):
+        """Pick up titles the indexer added since the last load"""
+        while True:
+            await asyncio.sleep(self.config.TITLE_REFRESH_SECONDS)
+            try:
+                await self.load_titles()
+            except Exception as e:
+                logger.error(f"Error refreshing title filter: {e}")
+    
     async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle button callbacks"""
         try:
@@ -169,27 +537,13 @@ For issues contact @your_admin
             
             data = query.data
             
-            if data == "main_menu":
-                await self.show_main_menu(query)
-            elif data == "buy_premium":
-                await self.show_premium_purchase(query)
-            elif data.startswith("select_"):
-                movie_id = int(data.split("_")[1])
-                await self.send_movie_details(query, movie_id)
-            elif data.startswith("more_"):
-                search_query = data.split("_", 1)[1]
-                await self.show_more_results(query, search_query)
-            elif data.startswith("quality_"):
-                parts = data.split("_")
-                movie_id = int(parts[1])
-                quality = parts[2]
-                await self.send_download_options(query, movie_id, quality)
-            elif data.startswith("dl_"):
-                file_id = data.split("_")[1]
-                await self.send_file(query, file_id)
-            elif data.startswith("all_"):
-                movie_name = data.split("_", 1)[1]
-                await self.send_all_qualities(query, movie_name)
+            try:
+                action, args = await self.decode_callback(data)
+            except CallbackExpired:
+                await query.edit_message_text("⌛ This button has expired. Please search again.")
+                return
+            
+            await self.callback_routes[action](query, *args)
                 
         except Exception as e:
             logger.error(f"Error in button handler: {e}")
@@ -230,7 +584,7 @@ We accept:
 
         keyboard = [
             [InlineKeyboardButton("📞 Contact Admin", url="https://t.me/your_admin")],
-            [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
+            [InlineKeyboardButton("🔙 Back", callback_data=self.callbacks.encode(Action.MAIN_MENU))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -238,13 +592,14 @@ We accept:
     
     async def send_movie_details(self, query, movie_id: int):
         """Send movie details with quality options"""
-        movie = self.db.get_movie_by_id(movie_id)
+        # The file and all other qualities of its title in one query
+        title = await self.db.get_movie_with_variants(movie_id)
+        movie = title['movie'] if title else None
         if not movie:
             await query.edit_message_text("❌ Movie not found in database!")
             return
         
-        # Get all available qualities for this movie
-        all_movies = self.db.get_movies_by_name(movie['movie_name'])
+        all_movies = title['variants']
         
         text = self.movie_utils.create_movie_caption(movie)
         text += "\n\n**Available Qualities:**"
@@ -253,67 +608,87 @@ We accept:
         for mov in all_movies:
             keyboard.append([
                 InlineKeyboardButton(
-                    f"📹 {mov['quality']} ({mov['file_size']})", 
-                    callback_data=f"quality_{mov['id']}_{mov['quality']}"
+                    f"📹 {mov['quality']} ({self.movie_utils.display_size(mov)})", 
+                    callback_data=self.callbacks.encode(Action.QUALITY, mov['id'])
                 )
             ])
         
-        keyboard.append([InlineKeyboardButton("📤 All Qualities", callback_data=f"all_{movie['movie_name']}")])
-        keyboard.append([InlineKeyboardButton("🔙 Back to Search", callback_data="main_menu")])
+        keyboard.append([InlineKeyboardButton("📤 All Qualities", callback_data=self.callbacks.encode(Action.ALL_QUALITIES, movie['title_id']))])
+        keyboard.append([InlineKeyboardButton("🔙 Back to Search", callback_data=self.callbacks.encode(Action.MAIN_MENU))])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     
-    async def send_download_options(self, query, movie_id: int, quality: str):
+    async def send_download_options(self, query, movie_id: int):
         """Send download and streaming options"""
-        movie = self.db.get_movie_by_id(movie_id)
+        movie = await self.db.get_movie_by_id(movie_id)
         if not movie:
             await query.edit_message_text("❌ File not found!")
             return
+        quality = movie.get('quality', '480p')
         
         warning_text = "⚠️ **IMPORTANT** ⚠️\n\n"
-        warning_text += "THIS MOVIE FILE/VIDEO WILL BE DELETED IN 10 MINUTES (DUE TO COPYRIGHT ISSUES).\n\n"
+        warning_text += f"THIS MOVIE FILE/VIDEO WILL BE DELETED IN {self.config.MOVIE_EXPIRY_MINUTES} MINUTES (DUE TO COPYRIGHT ISSUES).\n\n"
         warning_text += "PLEASE FORWARD THIS FILE TO SAVED MESSAGES AND START DOWNLOADING THERE\n\n"
         
         caption = f"**{movie['movie_name']}**\nQuality: {quality}\n\n{warning_text}"
         
         keyboard = [
-            [InlineKeyboardButton("🚀 Fast Download", callback_data=f"dl_{movie['file_id']}")],
-            [InlineKeyboardButton("🔙 Back", callback_data=f"select_{movie_id}")]
+            [InlineKeyboardButton("🚀 Fast Download", callback_data=self.callbacks.encode(Action.DOWNLOAD, movie_id))],
+            [InlineKeyboardButton("🔙 Back", callback_data=self.callbacks.encode(Action.SELECT, movie_id))]
         ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         # Send the actual file
         try:
-            await query.message.reply_document(
+            message = await query.message.reply_document(
                 document=movie['file_id'],
                 caption=caption,
                 reply_markup=reply_markup,
                 parse_mode='Markdown'
             )
-            await query.edit_message_text("✅ File sent! Check above message.")
+            await self.deletions.schedule(
+                message.chat_id, message.message_id, self.config.MOVIE_EXPIRY_MINUTES * 60
+            )
         except Exception as e:
             logger.error(f"Error sending file: {e}")
             await query.edit_message_text("❌ Error sending file. File might be expired or deleted.")
     
-    async def send_file(self, query, file_id: str):
-        """Send file directly"""
+    async def send_file(self, query, file_ref):
+        """Send file directly, given a movie id or (old buttons) a file_id"""
         try:
-            await query.message.reply_document(
+            if isinstance(file_ref, int):
+                movie = await self.db.get_movie_by_id(file_ref)
+                if not movie:
+                    await query.answer("❌ File not found!", show_alert=True)
+                    return
+                file_id = movie['file_id']
+            else:
+                file_id = file_ref
+            message = await query.message.reply_document(
                 document=file_id,
                 caption="🚀 **Fast Download**\n\nPlease save this file quickly!",
                 parse_mode='Markdown'
             )
+            await self.deletions.schedule(
+                message.chat_id, message.message_id, self.config.MOVIE_EXPIRY_MINUTES * 60
+            )
             await query.answer("File sent! ✅")
         except Exception as e:
             logger.error(f"Error sending file: {e}")
             await query.answer("❌ Error sending file. File might be expired.", show_alert=True)
     
-    async def send_all_qualities(self, query, movie_name: str):
-        """Send all available qualities for a movie"""
-        movies = self.db.get_movies_by_name(movie_name)
+    async def send_all_qualities(self, query, title_ref):
+        """Send all available qualities for a title id or (old buttons) a movie name"""
+        if isinstance(title_ref, int):
+            title = await self.db.get_title_variants(title_ref)
+            movies = title['variants'] if title else []
+            movie_name = title['title']['name'] if title else ""
+        else:
+            movie_name = title_ref
+            movies = await self.db.get_movies_by_name(movie_name)
         
         if not movies:
             await query.edit_message_text("❌ No qualities found for this movie!")
@@ -322,52 +697,150 @@ We accept:
         text = f"**🎬 {movie_name} - All Qualities**\n\n"
         
         for movie in movies:
-            text += f"• **{movie['quality']}** - {movie['file_size']}\n"
+            text += f"• **{movie['quality']}** - {self.movie_utils.display_size(movie)}\n"
         
         keyboard = []
         for movie in movies:
             keyboard.append([
                 InlineKeyboardButton(
                     f"📥 Download {movie['quality']}", 
-                    callback_data=f"quality_{movie['id']}_{movie['quality']}"
+                    callback_data=self.callbacks.encode(Action.QUALITY, movie['id'])
                 )
             ])
         
-        keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="main_menu")])
+        keyboard.append([InlineKeyboardButton("🔙 Back", callback_data=self.callbacks.encode(Action.MAIN_MENU))])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     
-    async def show_more_results(self, query, search_query: str):
-        """Show more search results"""
-        results = self.db.search_movies(search_query, 20)
-        
-        if not results:
-            await query.edit_message_text("❌ No more results found!")
-            return
+    def build_results_page(self, search_query: str, results, page: int, has_next: bool,
+                           filters=None, facets=None):
+        """Text and keyboard for one page of search results with Prev/Next navigation.
         
-        text = f"**🔍 More Results for '{search_query}'**\n\n"
+        Active filters show as removable chips; facets (from facet_counts)
+        adds chips that narrow the results further.
+        """
+        per_page = self.config.RESULTS_PER_PAGE
+        filters = filters or {}
+        text = f"**🎬 Search Results for '{search_query}'**"
+        if page > 1:
+            text += f" (page {page})"
+        text += "\n"
+        if filters:
+            text += "🔎 " + " · ".join(facet_label(name, value) for name, value in filters.items()) + "\n"
+        text += "\n"
         
-        for i, movie in enumerate(results, 1):
+        for i, movie in enumerate(results, (page - 1) * per_page + 1):
             text += f"**{i}.** {movie['movie_name']}"
             if movie.get('year'):
                 text += f" ({movie['year']})"
-            text += f"\n   📁 {movie.get('quality', '480p')} | 📊 {movie.get('file_size', 'N/A')}\n\n"
+            text += f"\n   📁 {movie.get('quality', '480p')} | 📊 {self.movie_utils.display_size(movie)}\n\n"
         
         keyboard = []
         for movie in results:
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"🎬 {movie['movie_name'][:25]}...", 
-                    callback_data=f"select_{movie['id']}"
-                )
+            btn_text = f"🎬 {movie['movie_name'][:20]}..."
+            if movie.get('year'):
+                btn_text += f" ({movie['year']})"
+            keyboard.append([InlineKeyboardButton(btn_text, callback_data=self.callbacks.encode(Action.SELECT, movie['id']))])
+        
+        keyboard += self.build_filter_chips(search_query, filters, facets or {})
+        
+        # Keyset cursors: (rank, id) of the first/last row shown; fuzzy rows
+        # continue with the corrected query they matched
+        extra = (encode_filters(filters),) if filters else ()
+        navigation = []
+        if page > 1:
+            first = results[0]
+            navigation.append(InlineKeyboardButton("⬅️ Prev", callback_data=self.callbacks.encode(
+                Action.PAGE, first.get('matched_query', search_query), page - 1,
+                float(first['rank']), first['id'], 1, *extra
+            )))
+        if has_next:
+            last = results[-1]
+            navigation.append(InlineKeyboardButton("Next ➡️", callback_data=self.callbacks.encode(
+                Action.PAGE, last.get('matched_query', search_query), page + 1,
+                float(last['rank']), last['id'], 0, *extra
+            )))
+        if navigation:
+            keyboard.append(navigation)
+        
+        keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data=self.callbacks.encode(Action.MAIN_MENU))])
+        
+        return text, InlineKeyboardMarkup(keyboard)
+    
+    def build_filter_chips(self, search_query: str, filters, facets):
+        """Keyboard rows of facet chips: chosen filters first, then the top values per facet"""
+        rows = []
+        if filters:
+            rows.append([
+                InlineKeyboardButton(f"✖ {facet_label(name, value)}", callback_data=self.callbacks.encode(
+                    Action.FILTER, search_query,
+                    encode_filters({other: v for other, v in filters.items() if other != name})
+                ))
+                for name, value in filters.items()
             ])
         
-        keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="main_menu")])
+        total = sum(count for _, count in facets.get('resolution', []))
+        for name in ('language', 'resolution', 'max_size', 'year'):
+            if name in filters:
+                continue
+            # A value every result shares narrows nothing
+            values = [(value, count) for value, count in facets.get(name, []) if count < total]
+            if values:
+                rows.append([
+                    InlineKeyboardButton(f"{facet_label(name, value)} ({count})", callback_data=self.callbacks.encode(
+                        Action.FILTER, search_query, encode_filters(dict(filters, **{name: value}))
+                    ))
+                    for value, count in values[:3]
+                ])
+        return rows
+    
+    async def show_results_page(self, query, search_query: str, page: int, rank: float, movie_id: int,
+                                backward: int, filters_text: str = ''):
+        """Show the page of results before or after a (rank, id) cursor"""
+        per_page = self.config.RESULTS_PER_PAGE
+        filters = decode_filters(filters_text)
+        if backward:
+            results = await self.db.search_movies(search_query, per_page, before=(rank, movie_id), filters=filters)
+            has_next = True
+        else:
+            results = await self.db.search_movies(search_query, per_page + 1, after=(rank, movie_id), filters=filters)
+            has_next = len(results) > per_page
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        if not results:
+            await query.edit_message_text("❌ No more results found!")
+            return
         
+        text, reply_markup = self.build_results_page(search_query, results[:per_page], page, has_next, filters)
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    
+    async def show_filtered_results(self, query, search_query: str, filters_text: str):
+        """Show the first page of results with the filters from a chip"""
+        per_page = self.config.RESULTS_PER_PAGE
+        filters = decode_filters(filters_text)
+        results = await self.db.search_movies(search_query, per_page + 1, filters=filters)
+        
+        if not results:
+            await query.edit_message_text("❌ No results match these filters!")
+            return
+        
+        facets = await self.db.facet_counts(search_query, filters)
+        text, reply_markup = self.build_results_page(
+            search_query, results[:per_page], 1, len(results) > per_page, filters, facets
+        )
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    
+    async def show_more_results(self, query, search_query: str):
+        """Show the first results page (buttons sent by older versions)"""
+        per_page = self.config.RESULTS_PER_PAGE
+        results = await self.db.search_movies(search_query, per_page + 1)
+        
+        if not results:
+            await query.edit_message_text("❌ No more results found!")
+            return
+        
+        text, reply_markup = self.build_results_page(search_query, results[:per_page], 1, len(results) > per_page)
         await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     
     def get_main_keyboard(self):
@@ -375,7 +848,7 @@ We accept:
         bot_username = (self.config.BOT_TOKEN or 'bot').split(':')[0]
         keyboard = [
             [InlineKeyboardButton("🎬 Search Movies", switch_inline_query_current_chat="")],
-            [InlineKeyboardButton("💎 Premium Plans", callback_data="buy_premium")],
+            [InlineKeyboardButton("💎 Premium Plans", callback_data=self.callbacks.encode(Action.BUY_PREMIUM))],
             [InlineKeyboardButton("📞 Contact Admin", url="https://t.me/your_admin")],
             [InlineKeyboardButton("🤖 Add to Group", url=f"https://t.me/{bot_username}?startgroup=true")]
         ]
@@ -391,55 +864,292 @@ We accept:
         ]
         await application.bot.set_my_commands(commands)
     
+    def register_gauges(self):
+        """Expose cache, buffer and pool sizes on /metrics"""
+        cache = self.db.search_cache
+        for stat in ('size', 'hits', 'misses', 'evictions', 'expirations', 'invalidations'):
+            self.metrics.gauge(
+                f'filmzi_search_cache_{stat}', f'Search cache {stat}',
+                lambda stat=stat: cache.stats()[stat]
+            )
+        self.metrics.gauge('filmzi_user_buffer_pending', 'User upserts waiting to be written', self.user_buffer.pending)
+        self.metrics.gauge('filmzi_search_log_pending', 'Searches waiting to be logged', self.search_log.pending)
+        self.metrics.gauge('filmzi_broadcast_rate', 'Broadcast messages per second', self.broadcaster.rate)
+        self.metrics.gauge('filmzi_callback_handles', 'Live callback handles', lambda: len(self.callbacks.handles))
+        self.metrics.gauge('filmzi_scheduled_deletions', 'Sent files waiting to be deleted', self.deletions.pending)
+        self.metrics.gauge('filmzi_title_filter_words', 'Words in the group title filter', lambda: len(self.title_filter))
+        self.metrics.gauge('filmzi_group_bursts', 'Group chats with an open reply window', self.group_bursts.pending)
+        self.metrics.gauge('filmzi_db_queue_size', 'Database calls waiting for a worker', self.db.queue_size)
+    
     async def health_check(self, request):
-        """Health check endpoint for Koyeb"""
+        """Liveness endpoint for Koyeb"""
         return web.Response(text="OK", status=200)
     
+    async def health_status(self, request):
+        """Report database reachability and event loop lag; 503 when unhealthy"""
+        try:
+            if self.config.ROLE == 'ingress':
+                # Ingress never touches the database, only the shared queue
+                await asyncio.wait_for(self.shared.cache_generation(), self.config.HEALTH_DB_TIMEOUT)
+                db_ok = True
+            else:
+                db_ok = await asyncio.wait_for(self.db.ping(), self.config.HEALTH_DB_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Health check failed: {e}")
+            db_ok = False
+        loop_ok = self.metrics.loop_lag <= self.config.HEALTH_MAX_LOOP_LAG
+        healthy = db_ok and loop_ok
+        return web.json_response({
+            'status': 'ok' if healthy else 'unhealthy',
+            'database': 'ok' if db_ok else 'unreachable',
+            'loop_lag_seconds': round(self.metrics.loop_lag, 4),
+            'db_queue_size': self.db.queue_size()
+        }, status=200 if healthy else 503)
+    
+    async def metrics_endpoint(self, request):
+        """Prometheus scrape endpoint"""
+        return web.Response(text=self.metrics.render(), content_type='text/plain', charset='utf-8')
+    
+    async def handle_webhook(self, request):
+        """Receive an update from Telegram and queue it for the application"""
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(token.encode(), self.webhook_secret.encode()):
+            return web.Response(status=403)
+        if self.application is None or not self.application.running:
+            return web.Response(status=503)
+        try:
+            data = await request.json()
+            update = None if self.config.ROLE == 'ingress' else Update.de_json(data, self.application.bot)
+        except Exception as e:
+            logger.error(f"Invalid webhook payload: {e}")
+            return web.Response(status=400)
+        if update is None:
+            # Telegram retries until it gets a 200, so only answer once queued
+            await self.shared.push_update(update_partition(data, self.config.QUEUE_PARTITIONS), encode_update(data))
+        else:
+            await self.application.update_queue.put(update)
+        return web.Response(status=200)
+    
     async def start_web_server(self):
-        """Start web server for health checks"""
+        """Start web server for health checks, metrics and webhook updates"""
         app = web.Application()
-        app.router.add_get('/health', self.health_check)
+        app.router.add_get('/health', self.health_status)
+        app.router.add_get('/metrics', self.metrics_endpoint)
         app.router.add_get('/', self.health_check)
+        if self.config.WEBHOOK_URL and self.config.ROLE != 'worker':
+            app.router.add_post(self.config.WEBHOOK_PATH, self.handle_webhook)
         
-        runner = web.AppRunner(app)
-        await runner.setup()
+        self.web_runner = web.AppRunner(app)
+        await self.web_runner.setup()
         
-        site = web.TCPSite(runner, '0.0.0.0', self.config.PORT)
+        site = web.TCPSite(self.web_runner, '0.0.0.0', self.config.PORT)
         await site.start()
         logger.info(f"Web server started on port {self.config.PORT}")
     
+    def build_application(self, base_url: str = None) -> Application:
+        """Create the Application with all handlers registered"""
+        builder = ApplicationBuilder()\
+            .token(self.config.BOT_TOKEN)\
+            .request(InstrumentedRequest(self.metrics, max(256, self.config.CONCURRENT_UPDATES)))\
+            .concurrent_updates(ChatOrderedUpdateProcessor(self.config.CONCURRENT_UPDATES, self.inline_debouncer))\
+            .rate_limiter(OutboundRateLimiter(
+                self.config.OUTBOUND_RATE, int(self.config.OUTBOUND_RATE), self.config.OUTBOUND_MAX_RETRIES,
+                self.shared
+            ))
+        if base_url:
+            builder = builder.base_url(base_url)
+        application = builder.build()
+        
+        if self.config.ROLE == 'ingress':
+            # Every update goes to the shared queue; workers run the handlers
+            application.add_handler(TypeHandler(Update, self.enqueue_update))
+            return application
+        
+        timed = self.metrics.timed
+        if self.shared:
+            application.add_handler(TypeHandler(Update, self.sync_cache), group=-2)
+        application.add_handler(TypeHandler(Update, self.rate_limit), group=-1)
+        application.add_handler(CommandHandler("start", timed(self.start)))
+        application.add_handler(CommandHandler("plan", timed(self.plan)))
+        application.add_handler(CommandHandler("help", timed(self.help_command)))
+        application.add_handler(CommandHandler("request", timed(self.request_movie)))
+        application.add_handler(CommandHandler("requests", timed(self.show_requests)))
+        application.add_handler(CommandHandler("trending", timed(self.show_trending)))
+        application.add_handler(CommandHandler("broadcast", timed(self.broadcast)))
+        application.add_handler(MessageHandler(
+            filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS, timed(self.group_message)
+        ))
+        application.add_handler(MessageHandler(
+            filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, timed(self.handle_message)
+        ))
+        application.add_handler(CallbackQueryHandler(timed(self.button_handler)))
+        application.add_handler(InlineQueryHandler(timed(self.inline_search)))
+        return application
+    
+    async def enqueue_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ingress: pass a polled update on to the workers"""
+        data = update.to_dict()
+        await self.shared.push_update(update_partition(data, self.config.QUEUE_PARTITIONS), encode_update(data))
+    
+    async def consume_updates(self):
+        """Worker: feed updates from this worker's queue partitions to the application.
+        
+        Live workers split the partitions between them, so each chat is
+        handled by one worker in order. At most CONCURRENT_UPDATES updates
+        are in flight; the rest stay in the shared queue. An update is acked
+        only once its handlers have finished, so a crash loses nothing (it
+        may run twice instead).
+        """
+        partitions: list = []
+        next_beat = 0.0
+        # Handler task -> queue row id
+        in_flight: dict = {}
+        while True:
+            try:
+                done = [task for task in in_flight if task.done()]
+                if done:
+                    await self.shared.ack_updates([in_flight.pop(task) for task in done])
+                
+                now = time.monotonic()
+                if now >= next_beat:
+                    workers = await self.shared.heartbeat(self.worker_id, self.config.WORKER_TTL)
+                    owned = assign_partitions(self.worker_id, workers, self.config.QUEUE_PARTITIONS)
+                    if owned != partitions:
+                        logger.info(f"Worker {self.worker_id} owns {len(owned)} of "
+                                    f"{self.config.QUEUE_PARTITIONS} partitions ({len(workers)} workers)")
+                        partitions = owned
+                        self.shared.reset_cursor()
+                    next_beat = now + self.config.WORKER_TTL / 3
+                
+                # Leave updates in the shared queue while this worker is busy
+                free = self.config.CONCURRENT_UPDATES - len(in_flight)
+                if free <= 0:
+                    await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                
+                rows = await self.shared.fetch_updates(partitions, free)
+                if not rows:
+                    await asyncio.sleep(self.config.QUEUE_POLL_SECONDS)
+                    continue
+                running = set(in_flight.values())
+                for row_id, payload in rows:
+                    # A cursor reset after a partition change reads running updates again
+                    if row_id in running:
+                        continue
+                    update = Update.de_json(json.loads(payload), self.application.bot)
+                    task = asyncio.create_task(self.application.update_processor.process_update(
+                        update, self.application.process_update(update)
+                    ))
+                    in_flight[task] = row_id
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error consuming updates: {e}")
+                await asyncio.sleep(1)
+    
+    async def start_updates(self):
+        """Receive updates by webhook when WEBHOOK_URL is set, otherwise poll"""
+        if self.config.WEBHOOK_URL:
+            url = self.config.WEBHOOK_URL.rstrip('/') + self.config.WEBHOOK_PATH
+            await self.application.bot.set_webhook(
+                url=url,
+                secret_token=self.webhook_secret,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=self.config.WEBHOOK_MAX_CONNECTIONS
+            )
+            logger.info(f"Webhook set to {url}")
+        else:
+            await self.application.updater.start_polling()
+    
+    async def stop_updates(self):
+        """Stop polling; a webhook stays registered so no updates are lost"""
+        if self.application.updater.running:
+            await self.application.updater.stop()
+    
     async def run(self):
-        """Run the bot"""
+        """Run the bot in the configured role"""
         try:
             # Validate configuration
             self.config.validate_config()
+            if self.config.ROLE not in ('all', 'ingress', 'worker'):
+                raise ValueError(f"Unknown ROLE: {self.config.ROLE}")
+            if self.config.ROLE != 'all' and self.shared is None:
+                raise ValueError(f"ROLE={self.config.ROLE} needs SHARED_STATE_URL")
+            if self.config.ROLE == 'ingress':
+                await self.run_ingress()
+                return
+            await self.db.connect()
             
-            # Create application
-            self.application = ApplicationBuilder()\
-                .token(self.config.BOT_TOKEN)\
-                .build()
-            
-            # Add handlers
-            self.application.add_handler(CommandHandler("start", self.start))
-            self.application.add_handler(CommandHandler("plan", self.plan))
-            self.application.add_handler(CommandHandler("help", self.help_command))
-            self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
-            self.application.add_handler(CallbackQueryHandler(self.button_handler))
-            
-            # Setup commands
-            await self.setup_commands(self.application)
+            self.application = self.build_application()
             
-            # Start web server for health checks
+            # Start web server for health checks and webhook updates
             await self.start_web_server()
             
-            logger.info("Filmzi Bot is starting...")
+            logger.info(f"Filmzi Bot is starting ({self.config.ROLE})...")
             
-            # Start polling
-            await self.application.run_polling()
+            # Start the application inside the running loop; run_polling() would
+            # try to own the loop that asyncio.run() already started
+            async with self.application:
+                await self.setup_commands(self.application)
+                await self.load_titles()
+                await self.application.start()
+                if self.config.ROLE == 'worker':
+                    consumer = asyncio.create_task(self.consume_updates())
+                else:
+                    consumer = None
+                    await self.start_updates()
+                self.user_buffer.start()
+                self.search_log.start()
+                await self.deletions.start(self.application.bot)
+                self.broadcaster.start(self.application.bot)
+                if self.notifier is not None:
+                    self.notifier.start()
+                lag_monitor = asyncio.create_task(self.metrics.monitor_loop_lag())
+                title_refresher = asyncio.create_task(self.refresh_titles())
+                try:
+                    await asyncio.Event().wait()
+                finally:
+                    lag_monitor.cancel()
+                    title_refresher.cancel()
+                    await self.group_bursts.stop()
+                    await self.broadcaster.stop()
+                    if self.notifier is not None:
+                        await self.notifier.stop()
+                    if consumer:
+                        consumer.cancel()
+                    else:
+                        await self.stop_updates()
+                    await self.application.stop()
+                    await self.user_buffer.stop()
+                    await self.search_log.stop()
+                    await self.deletions.stop()
+                    await self.web_runner.cleanup()
             
         except Exception as e:
             logger.error(f"Failed to start bot: {e}")
             raise
+        finally:
+            await self.db.close()
+            if self.shared:
+                await self.shared.close()
+    
+    async def run_ingress(self):
+        """Receive updates and queue them for the workers; no handlers run here"""
+        self.application = self.build_application()
+        await self.start_web_server()
+        logger.info("Filmzi Bot ingress is starting...")
+        async with self.application:
+            await self.setup_commands(self.application)
+            await self.application.start()
+            await self.start_updates()
+            lag_monitor = asyncio.create_task(self.metrics.monitor_loop_lag())
+            try:
+                await asyncio.Event().wait()
+            finally:
+                lag_monitor.cancel()
+                await self.stop_updates()
+                await self.application.stop()
+                await self.web_runner.cleanup()
 
 def main():
     """Main function to run the bot"""
@@ -452,6 +1162,11 @@ def main():
         print("Please set these variables in your Koyeb environment settings.")
         return
     
+    parser = argparse.ArgumentParser(description="Run Filmzi Bot")
+    parser.add_argument('--role', choices=['all', 'ingress', 'worker'], default=Config.ROLE,
+                        help="all: one process does everything; ingress/worker: split via SHARED_STATE_URL")
+    Config.ROLE = parser.parse_args().role
+    
     bot = FilmziBot()
     
     try:
@@ -459,10 +1174,8 @@ def main():
         asyncio.run(bot.run())
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
-        bot.db.close_connection()
     except Exception as e:
         logger.error(f"Bot crashed: {e}")
-        bot.db.close_connection()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,148 @@
+import time
+import asyncio
+import bisect
+import functools
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import psutil
+from telegram.request import HTTPXRequest
+
+# Seconds; spans a cached lookup (sub-ms) to a slow Telegram upload
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per label value"""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        """Record one duration"""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # Per-bucket counts (+Inf last), then [sum, count]
+                series = self._series[label_value] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+            series[0][index] += 1
+            series[1][0] += seconds
+            series[1][1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), list(totals)) for key, (counts, totals) in self._series.items()}
+        for label_value, (counts, (total, count)) in sorted(series.items()):
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+class Metrics:
+    """Process-wide metrics registry rendered in the Prometheus text format.
+
+    Handlers are timed with the ``timed`` decorator, database calls by
+    AsyncDatabase, and gauges are read from callbacks at scrape time so
+    they cost nothing between scrapes.
+    """
+
+    def __init__(self):
+        self.handler_latency = Histogram(
+            'filmzi_handler_seconds', 'Telegram update handler latency', 'handler'
+        )
+        self.db_latency = Histogram(
+            'filmzi_db_query_seconds', 'Database method latency', 'method'
+        )
+        self.telegram_latency = Histogram(
+            'filmzi_telegram_api_seconds', 'Telegram Bot API request latency', 'endpoint'
+        )
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self._process = psutil.Process()
+        self._process.cpu_percent(None)
+        self.loop_lag = 0.0
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]):
+        """Register a gauge whose value is read when /metrics is scraped"""
+        self._gauges[name] = (help_text, read)
+
+    def timed(self, handler: Callable) -> Callable:
+        """Decorator recording the latency of an async handler"""
+        name = handler.__name__
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                self.handler_latency.observe(name, time.perf_counter() - started)
+
+        return wrapper
+
+    async def monitor_loop_lag(self, interval: float = 0.5):
+        """Measure how late the event loop wakes up; a blocked loop shows as lag"""
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, time.perf_counter() - started - interval)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for histogram in (self.handler_latency, self.db_latency, self.telegram_latency):
+            lines += histogram.render()
+
+        with self._process.oneshot():
+            memory = self._process.memory_info()
+            cpu_times = self._process.cpu_times()
+            values = {
+                'process_resident_memory_bytes': ('Resident memory size', 'gauge', memory.rss),
+                'process_cpu_seconds_total': (
+                    'User and system CPU time', 'counter', cpu_times.user + cpu_times.system
+                ),
+                'process_cpu_percent': ('CPU usage since last scrape', 'gauge', self._process.cpu_percent(None)),
+                'filmzi_event_loop_lag_seconds': ('Latest event loop wake-up delay', 'gauge', self.loop_lag),
+            }
+        for name, (help_text, read) in self._gauges.items():
+            try:
+                values[name] = (help_text, 'gauge', read())
+            except Exception:
+                continue
+
+        for name, (help_text, kind, value) in values.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records Bot API latency per endpoint.
+
+    The pool defaults to ApplicationBuilder's own 256 connections rather
+    than HTTPXRequest's single one, which would serialize every call.
+    """
+
+    def __init__(self, metrics: Metrics, connection_pool_size: int = 256, pool_timeout: float = 5.0, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, pool_timeout=pool_timeout, **kwargs)
+        self.metrics = metrics
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            self.metrics.telegram_latency.observe(url.rsplit('/', 1)[-1], time.perf_counter() - started)
@@ -0,0 +1,96 @@
+import html
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from storage import Storage
+from ratelimit import OutboundRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class RequestNotifier:
+    """Tell requesters that a title they asked for is now available.
+
+    Fulfilled requests are worked through one at a time. Requesters are
+    read in keyset batches of batch_size and each batch is marked notified
+    once it is sent. Messages share the bot's outbound limit: send either
+    goes through the bot's OutboundRateLimiter itself, or limiter is that
+    bucket shared through a SharedState. With poll set, requests fulfilled
+    by another process are picked up from the database every poll seconds.
+    A restart picks up where it stopped and does not message anyone twice.
+    Messages are HTML.
+    """
+
+    def __init__(self, db: Storage, send: Callable[[int, str], Awaitable[Any]],
+                 limiter: Optional[OutboundRateLimiter] = None, batch_size: int = 100,
+                 poll: Optional[float] = None):
+        self.db = db
+        self.send = send
+        self.limiter = limiter
+        self.batch_size = batch_size
+        self.poll = poll
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self._task = None
+
+    def enqueue(self, requests: List[Dict[str, Any]]):
+        """Queue fulfilled requests for notification"""
+        for request in requests:
+            self._queue.put_nowait(request)
+
+    @staticmethod
+    def message(request: Dict[str, Any]) -> str:
+        return (
+            f"🎉 <b>{html.escape(request['title'])}</b> is now available!\n\n"
+            "Send the movie name to search for it."
+        )
+
+    async def notify(self, request: Dict[str, Any]) -> int:
+        """Message every requester of request; returns how many were sent"""
+        text = self.message(request)
+        sent = 0
+        after = 0
+        while True:
+            user_ids = await self.db.get_requesters(request['id'], after, self.batch_size)
+            if not user_ids:
+                break
+            for user_id in user_ids:
+                if self.limiter is not None:
+                    await self.limiter.wait()
+                try:
+                    await self.send(user_id, text)
+                    sent += 1
+                except Exception as e:
+                    # Blocked the bot or deleted the account: nothing to retry
+                    logger.info(f"Could not notify {user_id}: {e}")
+            await self.db.mark_requesters_notified(request['id'], user_ids)
+            after = user_ids[-1]
+        logger.info(f"Notified {sent} requesters of '{request['title']}'")
+        return sent
+
+    async def _run(self):
+        self.enqueue(await self.db.get_unnotified_requests())
+        while True:
+            try:
+                request = await asyncio.wait_for(self._queue.get(), self.poll)
+            except asyncio.TimeoutError:
+                try:
+                    self.enqueue(await self.db.get_unnotified_requests())
+                except Exception as e:
+                    logger.error(f"Error reading fulfilled requests: {e}")
+                continue
+            try:
+                await self.notify(request)
+            except Exception as e:
+                logger.error(f"Error notifying requesters of '{request['title']}': {e}")
+
+    def start(self):
+        """Resume unfinished notifications and start sending new ones"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop sending; unsent notifications resume on the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,924 @@
+import re
+import time
+import logging
+import functools
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from cache import SearchCache
+from database import Database
+from facets import SIZE_LIMITS, clean_filters, filters_key
+from utils import MovieUtils
+
+logger = logging.getLogger(__name__)
+
+LIKE_ESCAPE_RE = re.compile(r'([\\%_])')
+
+SCHEMA = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    '''
+    CREATE TABLE IF NOT EXISTS titles (
+        id BIGSERIAL PRIMARY KEY,
+        canonical_name TEXT NOT NULL,
+        year INTEGER,
+        display_name TEXT,
+        created_at TIMESTAMPTZ DEFAULT now()
+    )
+    ''',
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_titles_name_year
+    ON titles(canonical_name, COALESCE(year, 0))
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS movies (
+        id BIGSERIAL PRIMARY KEY,
+        file_id TEXT UNIQUE,
+        file_name TEXT,
+        file_size TEXT,
+        movie_name TEXT,
+        year INTEGER,
+        quality TEXT,
+        language TEXT,
+        category TEXT,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        title_id BIGINT REFERENCES titles(id),
+        resolution_rank INTEGER DEFAULT 0,
+        size_bytes BIGINT
+    )
+    ''',
+    'ALTER TABLE movies ADD COLUMN IF NOT EXISTS size_bytes BIGINT',
+    'ALTER TABLE movies ADD COLUMN IF NOT EXISTS file_unique_id TEXT',
+    'CREATE INDEX IF NOT EXISTS idx_movies_file_unique ON movies(file_unique_id, size_bytes)',
+    '''
+    CREATE TABLE IF NOT EXISTS movie_aliases (
+        old_id BIGINT PRIMARY KEY,
+        movie_id BIGINT
+    )
+    ''',
+    # Trigram indexes serve both substring (ILIKE) and typo-tolerant (<%) matches
+    'CREATE INDEX IF NOT EXISTS idx_movies_name_trgm ON movies USING GIN (movie_name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS idx_movies_file_trgm ON movies USING GIN (file_name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS idx_movies_name ON movies(movie_name)',
+    'CREATE INDEX IF NOT EXISTS idx_movies_title ON movies(title_id, resolution_rank DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_movies_facets ON movies(language, resolution_rank, size_bytes)',
+    'CREATE INDEX IF NOT EXISTS idx_movies_year ON movies(year, resolution_rank)',
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        is_premium BOOLEAN DEFAULT FALSE,
+        joined_at TIMESTAMPTZ DEFAULT now(),
+        is_active BOOLEAN DEFAULT TRUE
+    )
+    ''',
+    'ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE',
+    '''
+    CREATE TABLE IF NOT EXISTS index_state (
+        key TEXT PRIMARY KEY,
+        value BIGINT,
+        updated_at TIMESTAMPTZ DEFAULT now()
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS movie_requests (
+        id BIGSERIAL PRIMARY KEY,
+        norm_title TEXT UNIQUE NOT NULL,
+        title TEXT,
+        requester_count INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMPTZ DEFAULT now(),
+        fulfilled_at TIMESTAMPTZ
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_movie_requests_demand
+    ON movie_requests(status, requester_count DESC)
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS movie_request_users (
+        request_id BIGINT REFERENCES movie_requests(id),
+        user_id BIGINT,
+        notified BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        PRIMARY KEY (request_id, user_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS scheduled_deletions (
+        chat_id BIGINT,
+        message_id BIGINT,
+        due_at DOUBLE PRECISION,
+        PRIMARY KEY (chat_id, message_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_scheduled_deletions_due ON scheduled_deletions(due_at)',
+    '''
+    CREATE TABLE IF NOT EXISTS search_log (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT,
+        query TEXT,
+        norm_query TEXT,
+        result_count INTEGER,
+        searched_at DOUBLE PRECISION
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_search_log_time ON search_log(searched_at)',
+    '''
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        id BIGSERIAL PRIMARY KEY,
+        from_chat_id BIGINT,
+        message_id BIGINT,
+        status TEXT DEFAULT 'running',
+        last_user_id BIGINT DEFAULT 0,
+        sent INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        blocked INTEGER DEFAULT 0,
+        owner TEXT,
+        lease_until DOUBLE PRECISION DEFAULT 0,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        finished_at TIMESTAMPTZ
+    )
+    ''',
+]
+
+# Same row layout as database.UPSERT_MOVIE_SQL; a NULL id takes the next serial
+UPSERT_MOVIE_SQL = '''
+    INSERT INTO movies
+    (id, file_id, file_unique_id, file_name, file_size, movie_name, year, quality, language,
+     category, title_id, resolution_rank, size_bytes)
+    VALUES (COALESCE($1, nextval(pg_get_serial_sequence('movies', 'id'))),
+            $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
+    ON CONFLICT (id) DO UPDATE SET
+        file_id = excluded.file_id,
+        file_unique_id = excluded.file_unique_id,
+        file_name = excluded.file_name,
+        file_size = excluded.file_size,
+        movie_name = excluded.movie_name,
+        year = excluded.year,
+        quality = excluded.quality,
+        language = excluded.language,
+        category = excluded.category,
+        title_id = excluded.title_id,
+        resolution_rank = excluded.resolution_rank,
+        size_bytes = excluded.size_bytes
+'''
+
+# $1 query, $2 escaped LIKE pattern; $4-$7 facet filters (language,
+# resolution, max size, year), NULL when unused so the statement stays fixed.
+MATCH_SQL = '''
+    ($1 <% m.movie_name
+     OR m.movie_name ILIKE '%' || $2 || '%'
+     OR m.file_name ILIKE '%' || $2 || '%')
+    AND ($4::text IS NULL OR m.language = $4)
+    AND ($5::int IS NULL OR m.resolution_rank = $5)
+    AND ($6::bigint IS NULL OR m.size_bytes BETWEEN 1 AND $6)
+    AND ($7::int IS NULL OR m.year = $7)
+'''
+# A prefix match on movie_name ranks first, then word similarity; lower is
+# better, as with SQLite's bm25.
+RANKED_SEARCH_SQL = f'''
+    SELECT m.*,
+           (CASE WHEN m.movie_name ILIKE $2 || '%' THEN 0 ELSE 1 END
+            + 1 - word_similarity($1, m.movie_name))::float8 AS rank
+    FROM movies m
+    WHERE {MATCH_SQL}
+'''
+# Fixed statements per direction so asyncpg's prepared statement cache reuses them
+SEARCH_SQL = {
+    None: f'SELECT * FROM ({RANKED_SEARCH_SQL}) ranked ORDER BY rank, id LIMIT $3',
+    'after': f'''
+        SELECT * FROM ({RANKED_SEARCH_SQL}) ranked WHERE (rank, id) > ($8, $9)
+        ORDER BY rank, id LIMIT $3
+    ''',
+    'before': f'''
+        SELECT * FROM ({RANKED_SEARCH_SQL}) ranked WHERE (rank, id) < ($8, $9)
+        ORDER BY rank DESC, id DESC LIMIT $3
+    ''',
+}
+# $3 is the array of SIZE_LIMITS; rows are (facet, value, count)
+FACET_SQL = f'''
+    WITH matched AS (
+        SELECT m.language, m.resolution_rank, m.year, m.size_bytes FROM movies m WHERE {MATCH_SQL}
+    )
+    SELECT 'language', language, COUNT(*) FROM matched WHERE language IS NOT NULL GROUP BY language
+    UNION ALL
+    SELECT 'resolution', resolution_rank::text, COUNT(*) FROM matched GROUP BY resolution_rank
+    UNION ALL
+    SELECT 'year', year::text, COUNT(*) FROM matched WHERE year IS NOT NULL GROUP BY year
+    UNION ALL
+    SELECT 'max_size', size_limit::text, COUNT(matched.size_bytes)
+    FROM unnest($3::bigint[]) AS size_limit
+    LEFT JOIN matched ON matched.size_bytes BETWEEN 1 AND size_limit
+    GROUP BY size_limit
+'''
+
+EXISTING_MOVIE_SQL = '''
+    SELECT id, 0 AS preference FROM movies WHERE file_id = $1
+    UNION ALL
+    SELECT id, 1 FROM movies WHERE file_unique_id = $2 AND size_bytes IN ($3, $4)
+    ORDER BY preference, id LIMIT 1
+'''
+
+TITLE_VARIANTS_SQL = '''
+    SELECT m.*, t.display_name AS title_name, t.year AS title_year
+    FROM movies m JOIN titles t ON t.id = m.title_id
+    WHERE m.title_id = $1
+    ORDER BY m.resolution_rank DESC, m.id
+'''
+
+
+def _observed(method):
+    """Report the duration of a PostgresDatabase method to its observe callback"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            if self.observe:
+                self.observe(method.__name__, time.perf_counter() - started)
+    return wrapper
+
+
+class PostgresDatabase:
+    """Storage backend on PostgreSQL through an asyncpg connection pool.
+
+    Search uses pg_trgm GIN indexes, which also absorb typos, so there is no
+    separate spelling-correction stage. Every statement is a constant string,
+    so asyncpg prepares it once per connection and reuses it from its
+    statement cache.
+    """
+
+    def __init__(self, dsn: str, pool_size: int = 10, cache_size: int = 1024, cache_ttl: float = 300,
+                 observe: Optional[Callable[[str, float], None]] = None):
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.observe = observe
+        self.search_cache = SearchCache(cache_size, cache_ttl)
+        self.pool: Optional[asyncpg.Pool] = None
+        self._waiting = 0
+
+    async def connect(self):
+        """Open the pool and create missing tables"""
+        if self.pool is not None:
+            return
+        self.pool = await asyncpg.create_pool(
+            self.dsn, min_size=1, max_size=self.pool_size, statement_cache_size=256
+        )
+        async with self.pool.acquire() as conn:
+            for statement in SCHEMA:
+                await conn.execute(statement)
+            await self._backfill_sizes(conn)
+            await self._backfill_unique_ids(conn)
+        logger.info("PostgreSQL database initialized successfully")
+
+    @staticmethod
+    async def _backfill_sizes(conn, batch_size: int = 5000):
+        """Fill size_bytes of movies stored with only the formatted file_size"""
+        while True:
+            rows = await conn.fetch(
+                'SELECT id, file_size FROM movies WHERE size_bytes IS NULL LIMIT $1', batch_size
+            )
+            if not rows:
+                return
+            await conn.executemany('UPDATE movies SET size_bytes = $1 WHERE id = $2', [
+                (MovieUtils.parse_file_size(row['file_size']), row['id']) for row in rows
+            ])
+            logger.info(f"Backfilled sizes of {len(rows)} movies")
+
+    @staticmethod
+    async def _backfill_unique_ids(conn, batch_size: int = 5000):
+        """Fill file_unique_id of movies stored before it was kept"""
+        while True:
+            rows = await conn.fetch(
+                'SELECT id, file_id FROM movies WHERE file_unique_id IS NULL LIMIT $1', batch_size
+            )
+            if not rows:
+                return
+            await conn.executemany('UPDATE movies SET file_unique_id = $1 WHERE id = $2', [
+                (MovieUtils.file_unique_id(row['file_id']), row['id']) for row in rows
+            ])
+            logger.info(f"Backfilled file_unique_id of {len(rows)} movies")
+
+    async def close(self):
+        """Close all pooled connections"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        """Pooled connection, counting callers waiting for one"""
+        self._waiting += 1
+        try:
+            conn = await self.pool.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    def queue_size(self) -> int:
+        """Calls waiting for a free connection"""
+        return self._waiting
+
+    @_observed
+    async def ping(self) -> bool:
+        """Check that the database answers"""
+        try:
+            async with self.connection() as conn:
+                return await conn.fetchval('SELECT 1') == 1
+        except Exception as e:
+            logger.error(f"Database ping failed: {e}")
+            return False
+
+    async def _resolve_title_ids(self, conn, movies: List[Dict[str, Any]]) -> List[int]:
+        """Title id for each movie, with the same keying as Database._resolve_title_ids"""
+        resolved: Dict[tuple, int] = {}
+        title_ids = []
+        for movie in movies:
+            key = (MovieUtils.normalize_title(movie['movie_name']), movie.get('year'))
+            if key not in resolved:
+                title_id = await conn.fetchval('''
+                    SELECT id FROM titles
+                    WHERE canonical_name = $1 AND (COALESCE(year, 0) = COALESCE($2, 0) OR $2 IS NULL)
+                    ORDER BY COALESCE(year, 0) = COALESCE($2, 0) DESC
+                    LIMIT 1
+                ''', key[0], key[1])
+                if title_id is None:
+                    title_id = await conn.fetchval('''
+                        INSERT INTO titles (canonical_name, year, display_name) VALUES ($1, $2, $3)
+                        ON CONFLICT (canonical_name, COALESCE(year, 0))
+                        DO UPDATE SET display_name = titles.display_name
+                        RETURNING id
+                    ''', key[0], key[1], movie['movie_name'])
+                resolved[key] = title_id
+            title_ids.append(resolved[key])
+        return title_ids
+
+    async def add_movie(self, movie_data: Dict[str, Any]):
+        """Add movie to database"""
+        await self.add_movies([movie_data])
+
+    @_observed
+    async def add_movies(self, movies: List[Dict[str, Any]], checkpoint: Optional[Tuple[str, int]] = None) -> int:
+        """Add many movies in one transaction, optionally saving an indexer checkpoint with them"""
+        try:
+            async with self.connection() as conn, conn.transaction():
+                unique = Database.unique_movies(movies)
+                title_ids = await self._resolve_title_ids(conn, unique)
+                movie_ids = [
+                    await conn.fetchval(EXISTING_MOVIE_SQL, *Database._existing_params(movie))
+                    for movie in unique
+                ]
+                await conn.executemany(UPSERT_MOVIE_SQL, [
+                    Database._movie_row(movie, title_id, movie_id)
+                    for movie, title_id, movie_id in zip(unique, title_ids, movie_ids)
+                ])
+                if checkpoint:
+                    await conn.execute('''
+                        INSERT INTO index_state (key, value) VALUES ($1, $2)
+                        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = now()
+                    ''', *checkpoint)
+            for movie in movies:
+                self.search_cache.invalidate_matching(movie['movie_name'], movie['file_name'])
+            return len(movies)
+        except Exception as e:
+            logger.error(f"Error adding movies: {e}")
+            return 0
+
+    @_observed
+    async def get_checkpoint(self, key: str) -> Optional[int]:
+        """Get a saved indexer checkpoint"""
+        try:
+            async with self.connection() as conn:
+                return await conn.fetchval('SELECT value FROM index_state WHERE key = $1', key)
+        except Exception as e:
+            logger.error(f"Error getting checkpoint: {e}")
+            return None
+
+    @_observed
+    async def search_movies(self, query: str, limit: int = 10, after: Optional[Tuple[float, int]] = None,
+                            before: Optional[Tuple[float, int]] = None,
+                            filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search movies by name, ordered by (rank, id) like Database.search_movies"""
+        key = self.search_cache.make_key(query, limit, after, before, filters_key(filters))
+        results = self.search_cache.get(key)
+        if results is not None:
+            return list(results)
+        try:
+            params = self._match_params(query, limit, filters)
+            direction = 'before' if before is not None else 'after' if after is not None else None
+            if direction:
+                params += list(before if before is not None else after)
+            async with self.connection() as conn:
+                rows = [dict(row) for row in await conn.fetch(SEARCH_SQL[direction], *params)]
+            results = rows[::-1] if before is not None else rows
+        except Exception as e:
+            logger.error(f"Error searching movies: {e}")
+            return []
+        self.search_cache.set(key, results)
+        return list(results)
+
+    @staticmethod
+    def _match_params(query: str, third: Any, filters: Optional[Dict[str, Any]]) -> List[Any]:
+        """$1-$7 of MATCH_SQL statements; third is the statement's own $3"""
+        text = ' '.join(query.split())
+        filters = clean_filters(filters)
+        return [
+            text, LIKE_ESCAPE_RE.sub(r'\\\1', text), third,
+            filters.get('language'), filters.get('resolution'), filters.get('max_size'), filters.get('year')
+        ]
+
+    @_observed
+    async def facet_counts(self, query: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Tuple[Any, int]]]:
+        """Matches per facet value for query within filters; see Database.facet_counts"""
+        key = self.search_cache.make_key(query, 'facets', filters_key(filters))
+        counts = self.search_cache.get(key)
+        if counts is not None:
+            return counts
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch(FACET_SQL, *self._match_params(query, list(SIZE_LIMITS), filters))
+        except Exception as e:
+            logger.error(f"Error counting facets: {e}")
+            return {}
+        # Values share one text column in the UNION; restore the numeric facets
+        counts = Database._group_facet_counts([
+            (facet, value if facet == 'language' else int(value), count) for facet, value, count in rows
+        ])
+        self.search_cache.set(key, counts)
+        return counts
+
+    @_observed
+    async def get_movie_by_id(self, movie_id: int) -> Optional[Dict[str, Any]]:
+        """Get movie by ID"""
+        try:
+            async with self.connection() as conn:
+                row = await conn.fetchrow('SELECT * FROM movies WHERE id = $1', movie_id)
+                if row is None:
+                    # Merged into another row by compaction
+                    row = await conn.fetchrow('''
+                        SELECT m.* FROM movie_aliases a JOIN movies m ON m.id = a.movie_id
+                        WHERE a.old_id = $1
+                    ''', movie_id)
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting movie: {e}")
+            return None
+
+    async def compact_movies(self) -> Dict[str, int]:
+        """Merge movies that are the same file, then VACUUM; see Database.compact_movies"""
+        removed = 0
+        async with self.connection() as conn:
+            bytes_before = await conn.fetchval("SELECT pg_total_relation_size('movies')")
+            async with conn.transaction():
+                await self._backfill_unique_ids(conn)
+                rows = await conn.fetch('''
+                    SELECT id, file_id, file_size, size_bytes, file_unique_id FROM movies
+                    WHERE file_unique_id IN (
+                        SELECT file_unique_id FROM movies GROUP BY file_unique_id HAVING COUNT(*) > 1
+                    )
+                ''')
+                groups = Database.duplicate_groups([dict(row) for row in rows])
+                for kept, newest, merged_ids in groups:
+                    await conn.execute('DELETE FROM movies WHERE id = ANY($1::bigint[])', merged_ids)
+                    await conn.execute('''
+                        UPDATE movies SET file_id = $1, file_size = $2, size_bytes = $3 WHERE id = $4
+                    ''', newest['file_id'], newest['file_size'], newest['size_bytes'], kept['id'])
+                    await conn.execute('''
+                        UPDATE movie_aliases SET movie_id = $1 WHERE movie_id = ANY($2::bigint[])
+                    ''', kept['id'], merged_ids)
+                    await conn.executemany('''
+                        INSERT INTO movie_aliases (old_id, movie_id) VALUES ($1, $2)
+                        ON CONFLICT (old_id) DO UPDATE SET movie_id = excluded.movie_id
+                    ''', [(old_id, kept['id']) for old_id in merged_ids])
+                    removed += len(merged_ids)
+            # FULL rewrites the table so the space is given back to the disk
+            await conn.execute('VACUUM (FULL, ANALYZE) movies')
+            bytes_after = await conn.fetchval("SELECT pg_total_relation_size('movies')")
+        self.search_cache.clear()
+        return {'groups': len(groups), 'removed': removed, 'bytes_before': bytes_before, 'bytes_after': bytes_after}
+
+    @_observed
+    async def get_movies_by_name(self, movie_name: str) -> List[Dict[str, Any]]:
+        """Get all movies with same name"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch('''
+                    SELECT * FROM movies WHERE movie_name = $1
+                    ORDER BY resolution_rank DESC, id
+                ''', movie_name)
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting movies by name: {e}")
+            return []
+
+    async def _title_with_variants(self, conn, title_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        if title_id is None:
+            return None
+        rows = [dict(row) for row in await conn.fetch(TITLE_VARIANTS_SQL, title_id)]
+        if not rows:
+            return None
+        return {
+            'title': {
+                'id': rows[0]['title_id'],
+                'name': rows[0]['title_name'],
+                'year': rows[0]['title_year']
+            },
+            'variants': rows
+        }
+
+    @_observed
+    async def get_title_variants(self, title_id: int) -> Optional[Dict[str, Any]]:
+        """Get a title with all its files, best resolution first"""
+        try:
+            async with self.connection() as conn:
+                return await self._title_with_variants(conn, title_id)
+        except Exception as e:
+            logger.error(f"Error getting title variants: {e}")
+            return None
+
+    @_observed
+    async def get_title_names(self, after_id: int = 0, limit: int = 10000) -> List[Tuple[int, str]]:
+        """(id, canonical_name) of titles after after_id, in id order"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch(
+                    'SELECT id, canonical_name FROM titles WHERE id > $1 ORDER BY id LIMIT $2', after_id, limit
+                )
+            return [tuple(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting title names: {e}")
+            return []
+
+    @_observed
+    async def get_movie_with_variants(self, movie_id: int) -> Optional[Dict[str, Any]]:
+        """Get the title of a movie with all its files; see Database.get_movie_with_variants"""
+        try:
+            async with self.connection() as conn:
+                title_id = await conn.fetchval('SELECT title_id FROM movies WHERE id = $1', movie_id)
+                if title_id is None:
+                    # Merged into another row by compaction
+                    movie_id = await conn.fetchval(
+                        'SELECT movie_id FROM movie_aliases WHERE old_id = $1', movie_id
+                    )
+                    title_id = await conn.fetchval('SELECT title_id FROM movies WHERE id = $1', movie_id)
+                result = await self._title_with_variants(conn, title_id)
+            if result:
+                result['movie'] = next((v for v in result['variants'] if v['id'] == movie_id), None)
+            return result
+        except Exception as e:
+            logger.error(f"Error getting title variants: {e}")
+            return None
+
+    async def add_user(self, user_id: int, username: str, first_name: str, last_name: str = ""):
+        """Add or update user"""
+        await self.add_users([(user_id, username, first_name, last_name)])
+
+    @_observed
+    async def add_users(self, users: List[Tuple[int, str, str, str]]):
+        """Upsert many (user_id, username, first_name, last_name) rows in one transaction"""
+        try:
+            async with self.connection() as conn:
+                await conn.executemany('''
+                    INSERT INTO users (user_id, username, first_name, last_name)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        username = excluded.username,
+                        first_name = excluded.first_name,
+                        last_name = excluded.last_name,
+                        is_active = TRUE
+                ''', users)
+        except Exception as e:
+            logger.error(f"Error adding users: {e}")
+
+    @_observed
+    async def get_active_user_ids(self, after_user_id: int = 0, limit: int = 500) -> List[int]:
+        """Next limit user_ids above after_user_id of users who have not blocked the bot"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch('''
+                    SELECT user_id FROM users WHERE user_id > $1 AND is_active
+                    ORDER BY user_id LIMIT $2
+                ''', after_user_id, limit)
+                return [row['user_id'] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting active users: {e}")
+            return []
+
+    @_observed
+    async def mark_users_inactive(self, user_ids: List[int]):
+        """Skip these users in later broadcasts (they blocked the bot)"""
+        try:
+            async with self.connection() as conn:
+                await conn.execute(
+                    'UPDATE users SET is_active = FALSE WHERE user_id = ANY($1::bigint[])', user_ids
+                )
+        except Exception as e:
+            logger.error(f"Error marking users inactive: {e}")
+
+    @_observed
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get user by ID"""
+        try:
+            async with self.connection() as conn:
+                row = await conn.fetchrow('SELECT * FROM users WHERE user_id = $1', user_id)
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting user: {e}")
+            return None
+
+    @_observed
+    async def add_request(self, user_id: int, title: str) -> Optional[Dict[str, Any]]:
+        """Record that user_id wants title; returns the request row plus is_new"""
+        norm_title = Database.request_key(title)
+        if not norm_title:
+            return None
+        try:
+            async with self.connection() as conn, conn.transaction():
+                request_id = await conn.fetchval('''
+                    INSERT INTO movie_requests (norm_title, title) VALUES ($1, $2)
+                    ON CONFLICT (norm_title) DO UPDATE SET status = 'pending'
+                    RETURNING id
+                ''', norm_title, title.strip())
+                is_new = await conn.fetchval('''
+                    INSERT INTO movie_request_users (request_id, user_id) VALUES ($1, $2)
+                    ON CONFLICT DO NOTHING
+                    RETURNING TRUE
+                ''', request_id, user_id) is not None
+                if is_new:
+                    await conn.execute(
+                        'UPDATE movie_requests SET requester_count = requester_count + 1 WHERE id = $1',
+                        request_id
+                    )
+                else:
+                    await conn.execute('''
+                        UPDATE movie_request_users SET notified = FALSE WHERE request_id = $1 AND user_id = $2
+                    ''', request_id, user_id)
+                request = dict(await conn.fetchrow('SELECT * FROM movie_requests WHERE id = $1', request_id))
+            request['is_new'] = is_new
+            return request
+        except Exception as e:
+            logger.error(f"Error adding request: {e}")
+            return None
+
+    @_observed
+    async def title_exists(self, title: str) -> bool:
+        """Whether the catalog already has a title matching a request"""
+        try:
+            async with self.connection() as conn:
+                return await conn.fetchval(
+                    'SELECT EXISTS (SELECT 1 FROM titles WHERE canonical_name = $1)', Database.request_key(title)
+                )
+        except Exception as e:
+            logger.error(f"Error checking title: {e}")
+            return False
+
+    @_observed
+    async def get_top_requests(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Pending requests with the most requesters (served by idx_movie_requests_demand)"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch('''
+                    SELECT id, title, requester_count, created_at FROM movie_requests
+                    WHERE status = 'pending'
+                    ORDER BY requester_count DESC
+                    LIMIT $1
+                ''', limit)
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting top requests: {e}")
+            return []
+
+    @_observed
+    async def fulfill_requests(self, movie_names: List[str]) -> List[Dict[str, Any]]:
+        """Mark pending requests for these movie names fulfilled and return them"""
+        keys = list({MovieUtils.normalize_title(name) for name in movie_names} - {''})
+        if not keys:
+            return []
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch('''
+                    UPDATE movie_requests SET status = 'fulfilled', fulfilled_at = now()
+                    WHERE status = 'pending' AND norm_title = ANY($1::text[])
+                    RETURNING id, title, requester_count
+                ''', keys)
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error fulfilling requests: {e}")
+            return []
+
+    @_observed
+    async def get_unnotified_requests(self) -> List[Dict[str, Any]]:
+        """Fulfilled requests that still have requesters to notify"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch('''
+                    SELECT id, title, requester_count FROM movie_requests r
+                    WHERE status = 'fulfilled' AND EXISTS (
+                        SELECT 1 FROM movie_request_users u
+                        WHERE u.request_id = r.id AND NOT u.notified
+                    )
+                ''')
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting unnotified requests: {e}")
+            return []
+
+    @_observed
+    async def get_requesters(self, request_id: int, after_user_id: int = 0, limit: int = 100) -> List[int]:
+        """Next batch of not yet notified requesters, in user_id order"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch('''
+                    SELECT user_id FROM movie_request_users
+                    WHERE request_id = $1 AND user_id > $2 AND NOT notified
+                    ORDER BY user_id
+                    LIMIT $3
+                ''', request_id, after_user_id, limit)
+                return [row['user_id'] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting requesters: {e}")
+            return []
+
+    @_observed
+    async def mark_requesters_notified(self, request_id: int, user_ids: List[int]):
+        """Record that these requesters have been told"""
+        try:
+            async with self.connection() as conn:
+                await conn.execute('''
+                    UPDATE movie_request_users SET notified = TRUE
+                    WHERE request_id = $1 AND user_id = ANY($2::bigint[])
+                ''', request_id, user_ids)
+        except Exception as e:
+            logger.error(f"Error marking requesters notified: {e}")
+
+    @_observed
+    async def schedule_deletions(self, jobs: List[Tuple[int, int, float]]):
+        """Save (chat_id, message_id, due_at) deletion jobs"""
+        try:
+            async with self.connection() as conn:
+                await conn.executemany('''
+                    INSERT INTO scheduled_deletions (chat_id, message_id, due_at) VALUES ($1, $2, $3)
+                    ON CONFLICT (chat_id, message_id) DO UPDATE SET due_at = excluded.due_at
+                ''', jobs)
+        except Exception as e:
+            logger.error(f"Error scheduling deletions: {e}")
+
+    @_observed
+    async def create_broadcast(self, from_chat_id: int, message_id: int) -> Optional[int]:
+        """Start a broadcast of message_id in from_chat_id; returns its id"""
+        try:
+            async with self.connection() as conn:
+                return await conn.fetchval('''
+                    INSERT INTO broadcasts (from_chat_id, message_id) VALUES ($1, $2) RETURNING id
+                ''', from_chat_id, message_id)
+        except Exception as e:
+            logger.error(f"Error creating broadcast: {e}")
+            return None
+
+    @_observed
+    async def get_broadcasts(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """Latest broadcasts, newest first"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch('SELECT * FROM broadcasts ORDER BY id DESC LIMIT $1', limit)
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting broadcasts: {e}")
+            return []
+
+    @_observed
+    async def get_unfinished_broadcasts(self) -> List[Dict[str, Any]]:
+        """Running broadcasts, oldest first"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting unfinished broadcasts: {e}")
+            return []
+
+    @_observed
+    async def claim_broadcast(self, broadcast_id: int, owner: str, lease_until: float, now: float) -> bool:
+        """Take a running broadcast unless another process holds a live lease on it"""
+        try:
+            async with self.connection() as conn:
+                status = await conn.execute('''
+                    UPDATE broadcasts SET owner = $2, lease_until = $3
+                    WHERE id = $1 AND status = 'running' AND (owner = $2 OR owner IS NULL OR lease_until < $4)
+                ''', broadcast_id, owner, lease_until, now)
+                return status == 'UPDATE 1'
+        except Exception as e:
+            logger.error(f"Error claiming broadcast: {e}")
+            return False
+
+    @_observed
+    async def save_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                                      blocked: int, lease_until: float) -> bool:
+        """Record progress and extend the lease; False once the broadcast was cancelled"""
+        try:
+            async with self.connection() as conn:
+                status = await conn.execute('''
+                    UPDATE broadcasts SET last_user_id = $2, sent = $3, failed = $4, blocked = $5, lease_until = $6
+                    WHERE id = $1 AND status = 'running'
+                ''', broadcast_id, last_user_id, sent, failed, blocked, lease_until)
+                return status == 'UPDATE 1'
+        except Exception as e:
+            logger.error(f"Error saving broadcast progress: {e}")
+            return True
+
+    @_observed
+    async def finish_broadcast(self, broadcast_id: int):
+        """Mark a broadcast as sent to everyone"""
+        try:
+            async with self.connection() as conn:
+                await conn.execute('''
+                    UPDATE broadcasts SET status = 'done', finished_at = now()
+                    WHERE id = $1 AND status = 'running'
+                ''', broadcast_id)
+        except Exception as e:
+            logger.error(f"Error finishing broadcast: {e}")
+
+    @_observed
+    async def cancel_broadcasts(self) -> int:
+        """Stop every running broadcast; returns how many were running"""
+        try:
+            async with self.connection() as conn:
+                status = await conn.execute('''
+                    UPDATE broadcasts SET status = 'cancelled', finished_at = now()
+                    WHERE status = 'running'
+                ''')
+                return int(status.split()[-1])
+        except Exception as e:
+            logger.error(f"Error cancelling broadcasts: {e}")
+            return 0
+
+    @_observed
+    async def log_searches(self, searches: List[Tuple[int, str, str, int, float]]):
+        """Save (user_id, query, norm_query, result_count, searched_at) rows"""
+        try:
+            async with self.connection() as conn:
+                await conn.executemany('''
+                    INSERT INTO search_log (user_id, query, norm_query, result_count, searched_at)
+                    VALUES ($1, $2, $3, $4, $5)
+                ''', searches)
+        except Exception as e:
+            logger.error(f"Error logging searches: {e}")
+
+    @_observed
+    async def first_search_id(self, since: float) -> int:
+        """Id of the first search at or after since; one past the last id if there is none"""
+        try:
+            async with self.connection() as conn:
+                first = await conn.fetchval('SELECT MIN(id) FROM search_log WHERE searched_at >= $1', since)
+                if first is None:
+                    first = await conn.fetchval('SELECT COALESCE(MAX(id), 0) + 1 FROM search_log')
+                return first
+        except Exception as e:
+            logger.error(f"Error finding first search: {e}")
+            return 1
+
+    @_observed
+    async def get_searches(self, after_id: int = 0, limit: int = 5000) -> List[Tuple[int, str, int, float]]:
+        """(id, norm_query, result_count, searched_at) of searches after after_id, oldest first"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch('''
+                    SELECT id, norm_query, result_count, searched_at FROM search_log
+                    WHERE id > $1 ORDER BY id LIMIT $2
+                ''', after_id, limit)
+                return [tuple(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting searches: {e}")
+            return []
+
+    @_observed
+    async def get_scheduled_deletions(self) -> List[Tuple[int, int, float]]:
+        """All pending deletion jobs, earliest first"""
+        try:
+            async with self.connection() as conn:
+                rows = await conn.fetch(
+                    'SELECT chat_id, message_id, due_at FROM scheduled_deletions ORDER BY due_at'
+                )
+                return [tuple(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting scheduled deletions: {e}")
+            return []
+
+    @_observed
+    async def remove_scheduled_deletions(self, messages: List[Tuple[int, int]]):
+        """Forget deletion jobs for (chat_id, message_id) pairs"""
+        try:
+            async with self.connection() as conn:
+                await conn.executemany(
+                    'DELETE FROM scheduled_deletions WHERE chat_id = $1 AND message_id = $2', messages
+                )
+        except Exception as e:
+            logger.error(f"Error removing scheduled deletions: {e}")
@@ -0,0 +1,204 @@
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Hashable, List, Optional, Union
+
+from telegram import Update
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter, BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Calls that do not count towards Telegram's message limits
+UNLIMITED_ENDPOINTS = {
+    'getUpdates', 'getMe', 'answerCallbackQuery', 'answerInlineQuery',
+    'setWebhook', 'deleteWebhook', 'setMyCommands', 'getFile'
+}
+
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens/second up to capacity.
+
+    try_acquire() takes a token only if one is available; reserve() always
+    takes one and returns how long the caller must wait for it.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if self.tokens < 1 or now < self.blocked_until:
+                return False
+            self.tokens -= 1
+            return True
+
+    def reserve(self) -> float:
+        """Take a token, possibly in advance; seconds until it is valid"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def block(self, seconds: float):
+        """Hand out no tokens for the next seconds (e.g. after a 429)"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+class UserRateLimiter:
+    """One token bucket per user; idle buckets are dropped LRU-first"""
+
+    def __init__(self, rate: float, burst: int, max_users: int = 100000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.clock = clock
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, user_id: Hashable) -> bool:
+        """Whether user_id may make another request now"""
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst, self.clock)
+                if len(self._buckets) > self.max_users:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+        return bucket.try_acquire()
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process up to max_concurrent_updates updates at once, one at a time per chat.
+
+    Updates from the same chat wait on that chat's lock before taking a
+    slot, so a flood from one chat cannot occupy the whole pool. Inline
+    queries are not ordered: a newer one supersedes the one in flight.
+    With a debouncer, inline queries settle before taking a slot and the
+    superseded ones never reach the handlers.
+    """
+
+    def __init__(self, max_concurrent_updates: int, debouncer=None):
+        super().__init__(max_concurrent_updates)
+        self.debouncer = debouncer
+        self._chat_locks: Dict[int, List[Any]] = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def process_update(self, update: object, coroutine: "Awaitable[Any]"):
+        if self.debouncer is not None and isinstance(update, Update) and update.inline_query:
+            if not await self.debouncer.settle(update.inline_query.from_user.id):
+                if asyncio.iscoroutine(coroutine):
+                    coroutine.close()
+                return
+
+        chat_id = None
+        if isinstance(update, Update) and not update.inline_query:
+            if update.effective_chat:
+                chat_id = update.effective_chat.id
+            elif update.effective_user:
+                chat_id = update.effective_user.id
+        if chat_id is None:
+            await super().process_update(update, coroutine)
+            return
+
+        # [lock, updates waiting or running]; removed when the chat goes idle
+        entry = self._chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat_id]
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]"):
+        await coroutine
+
+
+class OutboundRateLimiter(BaseRateLimiter[int]):
+    """Global limit on Bot API calls, retrying after Telegram's 429s.
+
+    A RetryAfter pauses every outgoing call, not just the one that hit it.
+    rate_limit_args may override the number of retries per call. With a
+    SharedState the bucket is shared by all worker processes and by the
+    indexer's request notifications.
+    """
+
+    def __init__(self, rate: float = 30, burst: int = 30, max_retries: int = 2, shared=None):
+        self.rate = rate
+        self.burst = burst
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.shared = shared
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def wait(self):
+        """Wait for a token; also taken by senders outside the bot (the indexer)"""
+        if self.shared:
+            wait = await self.shared.acquire('outbound', self.rate, self.burst)
+        else:
+            wait = self.bucket.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    async def pause(self, seconds: float):
+        """Hand out no tokens for the next seconds, in every process sharing the bucket"""
+        if self.shared:
+            await self.shared.block('outbound', seconds)
+        else:
+            self.bucket.block(seconds)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        retries = self.max_retries if rate_limit_args is None else rate_limit_args
+        limited = endpoint not in UNLIMITED_ENDPOINTS
+        for attempt in itertools.count():
+            if limited:
+                await self.wait()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= retries:
+                    raise
+                logger.warning(f"Telegram asked to retry {endpoint} after {e.retry_after}s")
+                await self.pause(float(e.retry_after))
+                await asyncio.sleep(float(e.retry_after))
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from telegram import Message
+from telegram.constants import ChatAction
+
+logger = logging.getLogger(__name__)
+
+
+class PendingReply:
+    """Collect a handler's answer and send it as a single API call.
+
+    While the block runs, a typing action is sent only if it takes longer
+    than typing_delay, so fast (cached) searches cost one call. Calling
+    update() again replaces the pending text, merging what used to be a
+    send followed by edits. Nothing is sent if the block raises.
+    """
+
+    def __init__(self, send: Callable[..., Awaitable[Message]],
+                 typing: Optional[Callable[[], Awaitable[Any]]] = None, typing_delay: float = 0.5):
+        self._send = send
+        self._typing = typing
+        self.typing_delay = typing_delay
+        self._typing_task = None
+        self.text = None
+        self.kwargs = {}
+        self.message = None
+
+    def update(self, text: str, **kwargs):
+        """Set the text (and send_message keyword arguments) to send on exit"""
+        self.text = text
+        self.kwargs = kwargs
+
+    async def _delayed_typing(self):
+        await asyncio.sleep(self.typing_delay)
+        try:
+            await self._typing()
+        except Exception as e:
+            logger.error(f"Error sending chat action: {e}")
+
+    async def __aenter__(self) -> "PendingReply":
+        if self._typing is not None:
+            self._typing_task = asyncio.create_task(self._delayed_typing())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._typing_task is not None:
+            self._typing_task.cancel()
+        if exc_type is None and self.text is not None:
+            self.message = await self._send(self.text, **self.kwargs)
+        return False
+
+    @classmethod
+    def to_message(cls, message: Message, typing_delay: float = 0.5) -> "PendingReply":
+        """Reply to message, showing typing in its chat while waiting"""
+        return cls(
+            message.reply_text,
+            lambda: message.chat.send_action(ChatAction.TYPING),
+            typing_delay
+        )
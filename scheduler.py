@@ -0,0 +1,117 @@
+import time
+import heapq
+import asyncio
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Bot API limit for one deleteMessages call
+MAX_DELETE_BATCH = 100
+
+
+class DeletionScheduler:
+    """Delete sent messages once they are due.
+
+    Jobs are saved in the scheduled_deletions table and kept in one
+    in-memory min-heap ordered by due_at. A single task wakes every tick,
+    pops everything that is due and deletes it with one deleteMessages
+    call per chat (up to 100 messages). A batch Telegram throttles is
+    pushed back by the retry_after it asked for. Pending jobs are reloaded
+    from the database on start, so a restart does not leave files behind.
+    """
+
+    def __init__(self, db: Storage, tick: float = 1.0, retry_delay: float = 30.0,
+                 clock: Callable[[], float] = time.time):
+        self.db = db
+        self.tick = tick
+        self.retry_delay = retry_delay
+        # Wall-clock time: due_at must stay meaningful across restarts
+        self.clock = clock
+        self.bot = None
+        self._heap: List[Tuple[float, int, int]] = []
+        self._task = None
+
+    async def schedule(self, chat_id: int, message_id: int, delay: float):
+        """Delete message_id in chat_id after delay seconds"""
+        job = (self.clock() + delay, chat_id, message_id)
+        await self.db.schedule_deletions([(chat_id, message_id, job[0])])
+        heapq.heappush(self._heap, job)
+
+    async def load(self):
+        """Reload pending jobs saved by a previous run"""
+        self._heap = [(due_at, chat_id, message_id)
+                      for chat_id, message_id, due_at in await self.db.get_scheduled_deletions()]
+        heapq.heapify(self._heap)
+        logger.info(f"Loaded {len(self._heap)} scheduled deletions")
+
+    def pending(self) -> int:
+        """Deletions waiting to run"""
+        return len(self._heap)
+
+    async def run_due(self, now: float = None) -> int:
+        """Delete every message due at now; returns how many were handled"""
+        now = self.clock() if now is None else now
+        due: Dict[int, List[int]] = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            due.setdefault(chat_id, []).append(message_id)
+
+        done, retry = [], []
+        for chat_id, message_ids in due.items():
+            for start in range(0, len(message_ids), MAX_DELETE_BATCH):
+                batch = message_ids[start:start + MAX_DELETE_BATCH]
+                try:
+                    await self.bot.delete_messages(chat_id, batch)
+                except RetryAfter as e:
+                    # Also a TelegramError, but the messages are still there
+                    logger.warning(f"Deleting messages in {chat_id} throttled for {e.retry_after}s")
+                    due_at = now + float(e.retry_after)
+                    retry += [(due_at, chat_id, message_id) for message_id in batch]
+                    continue
+                except (BadRequest, Forbidden) as e:
+                    # Already deleted, too old or bot blocked: nothing left to do
+                    logger.info(f"Could not delete messages in {chat_id}: {e}")
+                except NetworkError as e:
+                    logger.error(f"Error deleting messages in {chat_id}, retrying: {e}")
+                    retry += [(now + self.retry_delay, chat_id, message_id) for message_id in batch]
+                    continue
+                except TelegramError as e:
+                    logger.error(f"Error deleting messages in {chat_id}: {e}")
+                done += [(chat_id, message_id) for message_id in batch]
+
+        if retry:
+            await self.db.schedule_deletions([(chat_id, message_id, due_at)
+                                              for due_at, chat_id, message_id in retry])
+            for job in retry:
+                heapq.heappush(self._heap, job)
+        if done:
+            await self.db.remove_scheduled_deletions(done)
+        return len(done)
+
+    async def _run(self):
+        while True:
+            delay = self._heap[0][0] - self.clock() if self._heap else self.tick
+            await asyncio.sleep(min(max(delay, 0), self.tick))
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error(f"Error running scheduled deletions: {e}")
+
+    async def start(self, bot: Bot):
+        """Load saved jobs and start deleting with bot"""
+        self.bot = bot
+        await self.load()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the timer; unfinished jobs stay saved for the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
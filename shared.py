@@ -0,0 +1,369 @@
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Update kinds whose object carries the chat directly or via .message
+UPDATE_KINDS = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post', 'callback_query',
+    'inline_query', 'chosen_inline_result', 'my_chat_member', 'chat_member', 'chat_join_request'
+)
+
+
+def update_partition(update: Dict[str, Any], partitions: int) -> int:
+    """Queue partition of a raw update: by chat, or by user when there is no chat"""
+    for kind in UPDATE_KINDS:
+        obj = update.get(kind)
+        if obj:
+            chat = obj.get('chat') or (obj.get('message') or {}).get('chat')
+            key = chat['id'] if chat else (obj.get('from') or {}).get('id', 0)
+            return key % partitions
+    return 0
+
+
+def assign_partitions(worker_id: str, workers: List[str], partitions: int) -> List[int]:
+    """Partitions owned by worker_id when split evenly across the live workers"""
+    if worker_id not in workers:
+        return []
+    rank = sorted(workers).index(worker_id)
+    return [p for p in range(partitions) if p % len(workers) == rank]
+
+
+class SharedState(Protocol):
+    """State that ingress and worker processes share so they act as one bot.
+
+    - An update queue split into partitions by chat, so each chat is only
+      ever handled by one worker, in order. Updates are deleted once acked.
+    - Worker membership, used to split partitions between live workers.
+    - Token buckets (global outbound limit, per-user limits).
+    - Callback handles, so a button still works after its worker changes.
+    - A search cache generation, bumped when the catalog changes.
+    """
+
+    async def push_update(self, partition: int, payload: str): ...
+    async def fetch_updates(self, partitions: List[int], limit: int = 100) -> List[Tuple[Any, str]]: ...
+    async def ack_updates(self, ids: List[Any]): ...
+    def reset_cursor(self): ...
+    async def heartbeat(self, worker_id: str, ttl: float) -> List[str]: ...
+    async def acquire(self, key: str, rate: float, capacity: float, reserve: bool = True) -> float: ...
+    async def block(self, key: str, seconds: float): ...
+    async def put_handle(self, handle: int, value: str, ttl: float): ...
+    async def get_handle(self, handle: int) -> Optional[str]: ...
+    async def cache_generation(self) -> int: ...
+    async def bump_cache_generation(self): ...
+    async def close(self): ...
+
+
+def _bucket(tokens: float, updated: float, blocked: float, now: float,
+            rate: float, capacity: float, reserve: bool) -> Tuple[float, float]:
+    """Token bucket step shared with the Redis script: (new tokens, wait)"""
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1 and now >= blocked:
+        return tokens - 1, 0.0
+    if reserve:
+        tokens -= 1
+        return tokens, max(-tokens / rate, blocked - now, 0.0)
+    return tokens, max((1 - tokens) / rate, blocked - now)
+
+
+class SqliteSharedState:
+    """SharedState in a SQLite file for several processes on one machine.
+
+    All calls run on one background thread with its own connection;
+    read-modify-write steps use BEGIN IMMEDIATE so processes do not race.
+    """
+
+    # Forget idle token buckets and expired handles every this many writes
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shared')
+        self._conn = None
+        self._cursor_id = 0
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS update_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    partition INTEGER,
+                    payload TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_update_queue_partition ON update_queue(partition, id);
+                CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, expires_at REAL);
+                CREATE TABLE IF NOT EXISTS token_buckets (
+                    key TEXT PRIMARY KEY, tokens REAL, updated REAL, blocked REAL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS callback_handles (
+                    handle INTEGER PRIMARY KEY, value TEXT, expires_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS shared_counters (key TEXT PRIMARY KEY, value INTEGER);
+            ''')
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    def _transaction(self, func):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(conn)
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM token_buckets WHERE updated < ? AND blocked < ?', (now - 3600, now))
+            conn.execute('DELETE FROM callback_handles WHERE expires_at < ?', (now,))
+
+    async def push_update(self, partition: int, payload: str):
+        """Append a raw update to its partition"""
+        await self._run(lambda: self._connection().execute(
+            'INSERT INTO update_queue (partition, payload) VALUES (?, ?)', (partition, payload)
+        ))
+
+    def _fetch(self, partitions: List[int], limit: int) -> List[Tuple[int, str]]:
+        placeholders = ','.join('?' * len(partitions))
+        rows = self._connection().execute(f'''
+            SELECT id, payload FROM update_queue
+            WHERE partition IN ({placeholders}) AND id > ?
+            ORDER BY id LIMIT ?
+        ''', (*partitions, self._cursor_id, limit)).fetchall()
+        if rows:
+            self._cursor_id = rows[-1][0]
+        return rows
+
+    async def fetch_updates(self, partitions: List[int], limit: int = 100) -> List[Tuple[int, str]]:
+        """Next (id, payload) updates of these partitions, oldest first"""
+        if not partitions:
+            return []
+        return await self._run(self._fetch, partitions, limit)
+
+    async def ack_updates(self, ids: List[int]):
+        """Delete handled updates"""
+        await self._run(lambda: self._connection().executemany(
+            'DELETE FROM update_queue WHERE id = ?', [(update_id,) for update_id in ids]
+        ))
+
+    def reset_cursor(self):
+        """Read unacked updates again, e.g. after taking over partitions"""
+        self._cursor_id = 0
+
+    def _heartbeat(self, worker_id: str, ttl: float) -> List[str]:
+        def beat(conn):
+            now = time.time()
+            conn.execute('INSERT OR REPLACE INTO workers (id, expires_at) VALUES (?, ?)', (worker_id, now + ttl))
+            conn.execute('DELETE FROM workers WHERE expires_at < ?', (now,))
+            return [row[0] for row in conn.execute('SELECT id FROM workers ORDER BY id')]
+        return self._transaction(beat)
+
+    async def heartbeat(self, worker_id: str, ttl: float) -> List[str]:
+        """Keep worker_id registered for ttl seconds; returns the live workers"""
+        return await self._run(self._heartbeat, worker_id, ttl)
+
+    def _acquire(self, key: str, rate: float, capacity: float, reserve: bool) -> float:
+        def take(conn):
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated, blocked FROM token_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated, blocked = row if row else (capacity, now, 0.0)
+            tokens, wait = _bucket(tokens, updated, blocked, now, rate, capacity, reserve)
+            conn.execute('''
+                INSERT OR REPLACE INTO token_buckets (key, tokens, updated, blocked) VALUES (?, ?, ?, ?)
+            ''', (key, tokens, now, blocked))
+            self._prune(conn, now)
+            return wait
+        return self._transaction(take)
+
+    async def acquire(self, key: str, rate: float, capacity: float, reserve: bool = True) -> float:
+        """Take a token from the shared bucket key; seconds to wait for it.
+
+        With reserve=False nothing is taken unless a token is available now.
+        """
+        return await self._run(self._acquire, key, rate, capacity, reserve)
+
+    async def block(self, key: str, seconds: float):
+        """Hand out no tokens from key for the next seconds"""
+        until = time.time() + seconds
+        await self._run(lambda: self._connection().execute('''
+            UPDATE token_buckets SET blocked = MAX(blocked, ?) WHERE key = ?
+        ''', (until, key)))
+
+    async def put_handle(self, handle: int, value: str, ttl: float):
+        """Share a callback handle"""
+        await self._run(lambda: self._connection().execute('''
+            INSERT OR REPLACE INTO callback_handles (handle, value, expires_at) VALUES (?, ?, ?)
+        ''', (handle, value, time.time() + ttl)))
+
+    async def get_handle(self, handle: int) -> Optional[str]:
+        """Value of a shared callback handle, None if unknown or expired"""
+        row = await self._run(lambda: self._connection().execute(
+            'SELECT value FROM callback_handles WHERE handle = ? AND expires_at > ?', (handle, time.time())
+        ).fetchone())
+        return row[0] if row else None
+
+    async def cache_generation(self) -> int:
+        """Current search cache generation"""
+        row = await self._run(lambda: self._connection().execute(
+            "SELECT value FROM shared_counters WHERE key = 'cache_generation'"
+        ).fetchone())
+        return row[0] if row else 0
+
+    async def bump_cache_generation(self):
+        """Tell every process to drop its cached searches"""
+        await self._run(lambda: self._connection().execute('''
+            INSERT INTO shared_counters (key, value) VALUES ('cache_generation', 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1
+        '''))
+
+    async def close(self):
+        def shutdown():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._run(shutdown)
+        self._executor.shutdown(wait=True)
+
+
+# Same arithmetic as _bucket, run atomically inside Redis on Redis' clock
+ACQUIRE_SCRIPT = '''
+local rate, capacity, reserve = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3] == '1'
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local v = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'blocked')
+local tokens = math.min(capacity, (tonumber(v[1]) or capacity) + (now - (tonumber(v[2]) or now)) * rate)
+local blocked = tonumber(v[3]) or 0
+local wait = 0
+if tokens >= 1 and now >= blocked then
+    tokens = tokens - 1
+elseif reserve then
+    tokens = tokens - 1
+    wait = math.max(-tokens / rate, blocked - now, 0)
+else
+    wait = math.max((1 - tokens) / rate, blocked - now)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now, 'blocked', blocked)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate + math.max(blocked - now, 0)) + 60)
+return tostring(wait)
+'''
+
+BLOCK_SCRIPT = '''
+local t = redis.call('TIME')
+local until_ = tonumber(t[1]) + tonumber(t[2]) / 1000000 + tonumber(ARGV[1])
+local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked')) or 0
+redis.call('HSET', KEYS[1], 'blocked', math.max(blocked, until_))
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])) + 60)
+'''
+
+
+class RedisSharedState:
+    """SharedState on Redis for workers spread over several machines.
+
+    Each partition is a stream; a worker reads its partitions with a
+    blocking XREAD and deletes entries once handled.
+    """
+
+    # Streams are trimmed to about this many entries per partition
+    MAX_QUEUE = 100000
+
+    def __init__(self, url: str, prefix: str = 'filmzi'):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._acquire_script = self.redis.register_script(ACQUIRE_SCRIPT)
+        self._block_script = self.redis.register_script(BLOCK_SCRIPT)
+        self._stream_ids: Dict[str, str] = {}
+
+    def _stream(self, partition: int) -> str:
+        return f'{self.prefix}:updates:{partition}'
+
+    async def push_update(self, partition: int, payload: str):
+        await self.redis.xadd(self._stream(partition), {'u': payload}, maxlen=self.MAX_QUEUE, approximate=True)
+
+    async def fetch_updates(self, partitions: List[int], limit: int = 100) -> List[Tuple[Tuple[str, str], str]]:
+        if not partitions:
+            return []
+        streams = {self._stream(p): self._stream_ids.get(self._stream(p), '0') for p in partitions}
+        response = await self.redis.xread(streams, count=limit, block=1000)
+        updates = []
+        for stream, entries in response or []:
+            for entry_id, fields in entries:
+                updates.append(((stream, entry_id), fields['u']))
+                self._stream_ids[stream] = entry_id
+        return updates
+
+    async def ack_updates(self, ids: List[Tuple[str, str]]):
+        by_stream: Dict[str, List[str]] = {}
+        for stream, entry_id in ids:
+            by_stream.setdefault(stream, []).append(entry_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for stream, entry_ids in by_stream.items():
+                pipe.xdel(stream, *entry_ids)
+            await pipe.execute()
+
+    def reset_cursor(self):
+        self._stream_ids.clear()
+
+    async def heartbeat(self, worker_id: str, ttl: float) -> List[str]:
+        key = f'{self.prefix}:workers'
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(key, {worker_id: now + ttl})
+            pipe.zremrangebyscore(key, '-inf', now)
+            pipe.zrange(key, 0, -1)
+            return (await pipe.execute())[-1]
+
+    async def acquire(self, key: str, rate: float, capacity: float, reserve: bool = True) -> float:
+        wait = await self._acquire_script(keys=[f'{self.prefix}:bucket:{key}'],
+                                          args=[rate, capacity, '1' if reserve else '0'])
+        return float(wait)
+
+    async def block(self, key: str, seconds: float):
+        await self._block_script(keys=[f'{self.prefix}:bucket:{key}'], args=[seconds])
+
+    async def put_handle(self, handle: int, value: str, ttl: float):
+        await self.redis.set(f'{self.prefix}:handle:{handle}', value, ex=max(1, int(ttl)))
+
+    async def get_handle(self, handle: int) -> Optional[str]:
+        return await self.redis.get(f'{self.prefix}:handle:{handle}')
+
+    async def cache_generation(self) -> int:
+        return int(await self.redis.get(f'{self.prefix}:cache_generation') or 0)
+
+    async def bump_cache_generation(self):
+        await self.redis.incr(f'{self.prefix}:cache_generation')
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_shared_state(url: str) -> Optional[SharedState]:
+    """SharedState for SHARED_STATE_URL (redis://... or sqlite:///path); None when unset"""
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisSharedState(url)
+    if url.startswith('sqlite:///'):
+        return SqliteSharedState(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme: {url.split(':', 1)[0]}")
+
+
+def encode_update(update: Dict[str, Any]) -> str:
+    return json.dumps(update, separators=(',', ':'))
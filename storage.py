@@ -0,0 +1,111 @@
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+
+from cache import SearchCache
+from config import Config
+from database import Database, AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class Storage(Protocol):
+    """Async storage interface shared by the SQLite and PostgreSQL backends.
+
+    Method names and return shapes follow Database; rows are plain dicts.
+    """
+
+    search_cache: SearchCache
+
+    async def connect(self): ...
+    async def close(self): ...
+    async def ping(self) -> bool: ...
+    def queue_size(self) -> int: ...
+
+    # Catalog
+    async def add_movie(self, movie_data: Dict[str, Any]): ...
+    async def add_movies(self, movies: List[Dict[str, Any]],
+                         checkpoint: Optional[Tuple[str, int]] = None) -> int: ...
+    async def get_checkpoint(self, key: str) -> Optional[int]: ...
+    async def search_movies(self, query: str, limit: int = 10, after: Optional[Tuple[float, int]] = None,
+                            before: Optional[Tuple[float, int]] = None,
+                            filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]: ...
+    async def facet_counts(self, query: str,
+                           filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Tuple[Any, int]]]: ...
+    async def get_movie_by_id(self, movie_id: int) -> Optional[Dict[str, Any]]: ...
+    async def get_movies_by_name(self, movie_name: str) -> List[Dict[str, Any]]: ...
+    async def get_title_variants(self, title_id: int) -> Optional[Dict[str, Any]]: ...
+    async def get_title_names(self, after_id: int = 0, limit: int = 10000) -> List[Tuple[int, str]]: ...
+    async def get_movie_with_variants(self, movie_id: int) -> Optional[Dict[str, Any]]: ...
+    async def compact_movies(self) -> Dict[str, int]: ...
+
+    # Users
+    async def add_user(self, user_id: int, username: str, first_name: str, last_name: str = ""): ...
+    async def add_users(self, users: List[Tuple[int, str, str, str]]): ...
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]: ...
+    async def get_active_user_ids(self, after_user_id: int = 0, limit: int = 500) -> List[int]: ...
+    async def mark_users_inactive(self, user_ids: List[int]): ...
+
+    # Broadcasts
+    async def create_broadcast(self, from_chat_id: int, message_id: int) -> Optional[int]: ...
+    async def get_broadcasts(self, limit: int = 5) -> List[Dict[str, Any]]: ...
+    async def get_unfinished_broadcasts(self) -> List[Dict[str, Any]]: ...
+    async def claim_broadcast(self, broadcast_id: int, owner: str, lease_until: float, now: float) -> bool: ...
+    async def save_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                                      blocked: int, lease_until: float) -> bool: ...
+    async def finish_broadcast(self, broadcast_id: int): ...
+    async def cancel_broadcasts(self) -> int: ...
+
+    # Movie requests
+    async def add_request(self, user_id: int, title: str) -> Optional[Dict[str, Any]]: ...
+    async def title_exists(self, title: str) -> bool: ...
+    async def get_top_requests(self, limit: int = 20) -> List[Dict[str, Any]]: ...
+    async def fulfill_requests(self, movie_names: List[str]) -> List[Dict[str, Any]]: ...
+    async def get_unnotified_requests(self) -> List[Dict[str, Any]]: ...
+    async def get_requesters(self, request_id: int, after_user_id: int = 0, limit: int = 100) -> List[int]: ...
+    async def mark_requesters_notified(self, request_id: int, user_ids: List[int]): ...
+
+    # Scheduled deletions
+    async def schedule_deletions(self, jobs: List[Tuple[int, int, float]]): ...
+    async def get_scheduled_deletions(self) -> List[Tuple[int, int, float]]: ...
+    async def remove_scheduled_deletions(self, messages: List[Tuple[int, int]]): ...
+
+    # Search log
+    async def log_searches(self, searches: List[Tuple[int, str, str, int, float]]): ...
+    async def first_search_id(self, since: float) -> int: ...
+    async def get_searches(self, after_id: int = 0, limit: int = 5000) -> List[Tuple[int, str, int, float]]: ...
+
+
+def sqlite_path(url: str) -> Optional[str]:
+    """File path of a sqlite:/// URL, None for other URLs"""
+    if url.startswith('sqlite:///'):
+        return url[len('sqlite:///'):]
+    return None
+
+
+def create_storage(config: Config, observe: Optional[Callable[[str, float], None]] = None) -> Storage:
+    """Storage backend for config.DATABASE_URL (postgresql://, sqlite:/// or unset for DB_NAME)"""
+    url = config.DATABASE_URL
+    if url.startswith(('postgres://', 'postgresql://')):
+        from postgres import PostgresDatabase
+        return PostgresDatabase(
+            url, config.DB_POOL_SIZE, config.SEARCH_CACHE_SIZE, config.SEARCH_CACHE_TTL, observe
+        )
+    if url and sqlite_path(url) is None:
+        raise ValueError(f"Unsupported DATABASE_URL scheme: {url.split(':', 1)[0]}")
+    path = sqlite_path(url) or config.DB_NAME
+    if not os.path.exists(path) and os.path.exists(config.DB_NAME):
+        # DATABASE_URL used to be ignored: keep the catalog that is already there
+        logger.warning(f"{path} does not exist, using the existing {config.DB_NAME}; "
+                       f"move that file to {path} to switch")
+        path = config.DB_NAME
+    return AsyncDatabase(
+        Database(
+            path,
+            config.SEARCH_CACHE_SIZE,
+            config.SEARCH_CACHE_TTL,
+            config.FUZZY_MIN_RESULTS
+        ),
+        config.DB_WORKERS,
+        observe
+    )
@@ -0,0 +1,207 @@
+"""A stand-in for an asyncpg pool that runs PostgresDatabase's SQL on SQLite.
+
+Statements are rewritten just enough for SQLite: $n parameters become ?n,
+casts are dropped, arrays travel as JSON, ILIKE keeps PostgreSQL's
+case-insensitive matching with backslash escapes, and <% / word_similarity
+follow pg_trgm. This checks PostgresDatabase's queries and result handling
+without a PostgreSQL server; planner and index behaviour are not covered.
+"""
+import asyncio
+import json
+import re
+import sqlite3
+from contextlib import asynccontextmanager
+from typing import Any, List, Optional, Tuple
+
+# pg_trgm.word_similarity_threshold
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+REWRITES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r'nextval\(pg_get_serial_sequence\([^)]*\)\)'), 'NULL'),
+    (re.compile(r'BIGSERIAL PRIMARY KEY'), 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r'ADD COLUMN IF NOT EXISTS'), 'ADD COLUMN'),
+    (re.compile(r'::\w+(\[\])?'), ''),
+    (re.compile(r'\$(\d+)'), r'?\1'),
+    (re.compile(r'(\?\d+) <% ([\w.]+)'), rf'word_similarity(\1, \2) >= {WORD_SIMILARITY_THRESHOLD}'),
+    (re.compile(r'= ANY\((\?\d+)\)'), r'IN (SELECT value FROM json_each(\1))'),
+    (re.compile(r'unnest\((\?\d+)\) AS (\w+)'), r'(SELECT value AS \2 FROM json_each(\1))'),
+    (re.compile(r'\bILIKE\b'), 'LIKE'),
+    (re.compile(r'\bnow\(\)'), 'CURRENT_TIMESTAMP'),
+    (re.compile(r'VACUUM \([^)]*\) \w+'), 'SELECT 1'),
+]
+# Statements with no SQLite counterpart that change nothing the tests see
+SKIPPED = re.compile(r'^\s*(CREATE EXTENSION|CREATE INDEX [^(]* USING GIN|SELECT setval)', re.S)
+
+
+def translate(sql: str) -> str:
+    for pattern, replacement in REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def _trigrams(text: str) -> List[str]:
+    """pg_trgm trigrams of each word, in order: lowercased, padded '  word '"""
+    trigrams = []
+    for word in re.findall(r'\w+', (text or '').lower()):
+        padded = f'  {word} '
+        trigrams += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    return trigrams
+
+
+def word_similarity(query: str, text: str) -> float:
+    """Best similarity between query's trigrams and a run of text's trigrams"""
+    wanted = set(_trigrams(query))
+    found = _trigrams(text)
+    if not wanted or not found:
+        return 0.0
+    best = 0.0
+    for start in range(len(found)):
+        extent = set()
+        for trigram in found[start:]:
+            extent.add(trigram)
+            best = max(best, len(wanted & extent) / len(wanted | extent))
+    return best
+
+
+def ilike(pattern: str, text: str) -> bool:
+    """text ILIKE pattern, with backslash as the escape character"""
+    if pattern is None or text is None:
+        return None
+    regex, escaped = [], False
+    for char in pattern:
+        if escaped:
+            regex.append(re.escape(char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '%':
+            regex.append('.*')
+        elif char == '_':
+            regex.append('.')
+        else:
+            regex.append(re.escape(char))
+    return re.fullmatch(''.join(regex), text, re.I | re.S) is not None
+
+
+def _param(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return json.dumps(list(value))
+    return value
+
+
+class FakeConnection:
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.create_function('word_similarity', 2, word_similarity, deterministic=True)
+        self.db.create_function('like', 2, ilike, deterministic=True)
+        self.db.create_function('pg_total_relation_size', 1, lambda table: 0)
+        self._depth = 0
+
+    def _run(self, sql: str, args) -> Optional[sqlite3.Cursor]:
+        if SKIPPED.match(sql):
+            return None
+        if sql.strip().startswith('TRUNCATE'):
+            for table in sql.strip()[len('TRUNCATE'):].split(','):
+                self.db.execute(f'DELETE FROM {table.strip()}')
+            return None
+        try:
+            return self.db.execute(translate(sql), [_param(arg) for arg in args])
+        except sqlite3.OperationalError as e:
+            # ADD COLUMN IF NOT EXISTS on a column that is already there
+            if 'duplicate column' in str(e):
+                return None
+            raise
+
+    async def execute(self, sql: str, *args) -> str:
+        cursor = self._run(sql, args)
+        verb = sql.split()[0].upper()
+        count = cursor.rowcount if cursor is not None and cursor.rowcount >= 0 else 0
+        return f'INSERT 0 {count}' if verb == 'INSERT' else f'{verb} {count}'
+
+    async def executemany(self, sql: str, args):
+        for row in args:
+            self._run(sql, row)
+
+    async def fetch(self, sql: str, *args) -> List[sqlite3.Row]:
+        cursor = self._run(sql, args)
+        return cursor.fetchall() if cursor is not None else []
+
+    async def fetchrow(self, sql: str, *args) -> Optional[sqlite3.Row]:
+        rows = await self.fetch(sql, *args)
+        return rows[0] if rows else None
+
+    async def fetchval(self, sql: str, *args) -> Any:
+        row = await self.fetchrow(sql, *args)
+        return row[0] if row else None
+
+    async def copy_records_to_table(self, table: str, records, columns: List[str]):
+        placeholders = ', '.join('?' * len(columns))
+        self.db.executemany(
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders})',
+            [[_param(value) for value in record] for record in records]
+        )
+
+    @asynccontextmanager
+    async def transaction(self):
+        savepoint = f'sp{self._depth}'
+        self.db.execute('BEGIN' if not self._depth else f'SAVEPOINT {savepoint}')
+        self._depth += 1
+        try:
+            yield
+        except BaseException:
+            self._depth -= 1
+            self.db.execute('ROLLBACK' if not self._depth else f'ROLLBACK TO {savepoint}')
+            raise
+        self._depth -= 1
+        self.db.execute('COMMIT' if not self._depth else f'RELEASE {savepoint}')
+
+    def close(self):
+        self.db.close()
+
+
+class _Acquire:
+    """pool.acquire(): awaitable, and an async context manager that releases"""
+
+    def __init__(self, pool: 'FakePool'):
+        self.pool = pool
+
+    def __await__(self):
+        return self.pool._acquire().__await__()
+
+    async def __aenter__(self) -> FakeConnection:
+        return await self.pool._acquire()
+
+    async def __aexit__(self, *exc_info):
+        await self.pool.release(self.pool.conn)
+
+
+class FakePool:
+    """One connection handed out to one caller at a time"""
+
+    def __init__(self, path: str):
+        self.conn = FakeConnection(path)
+        self._lock = asyncio.Lock()
+
+    async def _acquire(self) -> FakeConnection:
+        await self._lock.acquire()
+        return self.conn
+
+    def acquire(self) -> _Acquire:
+        return _Acquire(self)
+
+    async def release(self, conn: FakeConnection):
+        self._lock.release()
+
+    async def close(self):
+        self.conn.close()
+
+
+def patch_create_pool(monkeypatch, path: str):
+    """Make asyncpg.create_pool in postgres.py return a FakePool on path"""
+    import postgres
+
+    async def create_pool(dsn, **kwargs):
+        return FakePool(path)
+
+    monkeypatch.setattr(postgres.asyncpg, 'create_pool', create_pool)
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+from copy_db import copy_database
+from database import AsyncDatabase, Database
+from fake_asyncpg import patch_create_pool
+from postgres import PostgresDatabase
+from test_postgres import MOVIES, normalize
+
+TARGET = 'postgresql://stand-in/filmzi'
+
+
+def digest(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def schema(path: str):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY name').fetchall()
+    finally:
+        conn.close()
+
+
+async def read_movies(db) -> list:
+    await db.connect()
+    try:
+        return [await db.get_movie_by_id(movie_id) for movie_id in range(1, len(MOVIES) + 1)]
+    finally:
+        await db.close()
+
+
+@pytest.fixture
+def target(tmp_path, monkeypatch):
+    patch_create_pool(monkeypatch, os.path.join(tmp_path, 'postgres.db'))
+
+
+def test_missing_source_is_not_created(tmp_path, target):
+    source = os.path.join(tmp_path, 'typo.db')
+    with pytest.raises(SystemExit, match='does not exist'):
+        asyncio.run(copy_database(source, TARGET))
+    assert not os.path.exists(source)
+
+
+def test_copies_without_touching_the_source(tmp_path, target):
+    source = os.path.join(tmp_path, 'filmzi.db')
+
+    async def fill():
+        db = AsyncDatabase(Database(source), 1)
+        await db.add_movies(MOVIES, ('channel:1', 40))
+        await db.add_users([(1, 'a', 'A', ''), (2, 'b', 'B', '')])
+        await db.add_request(1, 'Dune')
+        await db.close()
+
+    asyncio.run(fill())
+    expected = normalize(asyncio.run(read_movies(AsyncDatabase(Database(source), 1))))
+    before = digest(source)
+
+    asyncio.run(copy_database(source, TARGET))
+
+    assert digest(source) == before
+    postgres_db = PostgresDatabase(TARGET)
+    assert normalize(asyncio.run(read_movies(postgres_db))) == expected
+
+    async def rest():
+        await postgres_db.connect()
+        try:
+            return (await postgres_db.get_active_user_ids(), await postgres_db.get_checkpoint('channel:1'),
+                    [r['title'] for r in await postgres_db.get_top_requests()])
+        finally:
+            await postgres_db.close()
+
+    assert asyncio.run(rest()) == ([1, 2], 40, ['Dune'])
+
+    with pytest.raises(SystemExit, match='not empty'):
+        asyncio.run(copy_database(source, TARGET))
+    asyncio.run(copy_database(source, TARGET, replace=True))
+    assert normalize(asyncio.run(read_movies(postgres_db))) == expected
+
+
+def test_old_source_is_copied_as_it_is(tmp_path, target):
+    source = os.path.join(tmp_path, 'old.db')
+    conn = sqlite3.connect(source)
+    conn.executescript('''
+        CREATE TABLE movies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, file_id TEXT UNIQUE, file_name TEXT, file_size TEXT,
+            movie_name TEXT, year INTEGER, quality TEXT, language TEXT, category TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT,
+            is_premium BOOLEAN DEFAULT FALSE, joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO movies (file_id, file_name, file_size, movie_name, year, quality)
+        VALUES ('f1', 'Old.Movie.1999.720p.mkv', '1.5 GB', 'Old Movie', 1999, '720p');
+    ''')
+    conn.close()
+    old_schema = schema(source)
+
+    asyncio.run(copy_database(source, TARGET))
+
+    assert schema(source) == old_schema
+    movie = asyncio.run(read_movies(PostgresDatabase(TARGET)))[0]
+    assert movie['file_id'] == 'f1'
+    # Filled in by PostgresDatabase.connect
+    assert movie['size_bytes'] == int(1.5 * 1024 ** 3)
+    assert movie['file_unique_id'] == 'f1'
@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import pytest
+
+from database import AsyncDatabase, Database
+from notifier import RequestNotifier
+
+
+class FakeSender:
+    """Records sent notifications; fails for the user ids in blocked"""
+
+    def __init__(self, blocked=()):
+        self.sent = []
+        self.blocked = set(blocked)
+
+    async def __call__(self, user_id: int, text: str):
+        if user_id in self.blocked:
+            raise RuntimeError('Forbidden: bot was blocked by the user')
+        self.sent.append((user_id, text))
+
+
+@pytest.fixture
+def db(tmp_path):
+    storage = AsyncDatabase(Database(os.path.join(tmp_path, 'test.db')), 1)
+    yield storage
+    asyncio.run(storage.close())
+
+
+async def fulfil(db, title: str, user_ids):
+    for user_id in user_ids:
+        await db.add_request(user_id, title)
+    return await db.fulfill_requests([title])
+
+
+def test_notifies_in_batches_once(db):
+    send = FakeSender(blocked=[3])
+    notifier = RequestNotifier(db, send, batch_size=2)
+
+    async def scenario():
+        request, = await fulfil(db, 'Dune', [5, 1, 4, 3, 2])
+        assert await notifier.notify(request) == 4
+        assert [user_id for user_id, _ in send.sent] == [1, 2, 4, 5]
+        # Everyone was handled, blocked users included: nothing left to send
+        assert await notifier.notify(request) == 0
+        assert await db.get_unnotified_requests() == []
+
+    asyncio.run(scenario())
+
+
+def test_title_is_escaped(db):
+    send = FakeSender()
+    notifier = RequestNotifier(db, send)
+
+    async def scenario():
+        request, = await fulfil(db, 'Tom & <Jerry>', [1])
+        await notifier.notify(request)
+
+    asyncio.run(scenario())
+    assert '<b>Tom &amp; &lt;Jerry&gt;</b>' in send.sent[0][1]
+
+
+def test_polls_requests_fulfilled_elsewhere(db):
+    send = FakeSender()
+    notifier = RequestNotifier(db, send, poll=0.05)
+
+    async def scenario():
+        notifier.start()
+        try:
+            # Fulfilled by another process (the indexer): nothing is enqueued here
+            await fulfil(db, 'Dune', [1, 2])
+            for _ in range(100):
+                if len(send.sent) == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await notifier.stop()
+
+    asyncio.run(scenario())
+    assert sorted(user_id for user_id, _ in send.sent) == [1, 2]
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+from indexer import ChannelIndexer
+from utils import MovieUtils
+
+# (filename, expected fields) pairs in the shapes seen in movie channels
+CORPUS = [
+    ('Avengers.Endgame.2019.1080p.BluRay.x264.Hindi.mkv',
+     {'movie_name': 'Avengers Endgame', 'year': 2019, 'resolution': '1080p', 'source': 'BluRay', 'codec': 'x264', 'language': 'Hindi'}),
+    ('[Tamil] Vikram (2022) 720p HDRip.mp4',
+     {'movie_name': 'Vikram', 'year': 2022, 'resolution': '720p', 'source': 'HDRip', 'language': 'Tamil'}),
+    ('Blade Runner 2049 (2017) 2160p WEB-DL HEVC.mkv',
+     {'movie_name': 'Blade Runner 2049', 'year': 2017, 'resolution': '2160p', 'source': 'WEB-DL', 'codec': 'x265'}),
+    ('2012 (2009) 480p.mkv',
+     {'movie_name': '2012', 'year': 2009, 'resolution': '480p'}),
+    ('Money.Heist.S01E02.720p.WEB-DL.English.Hindi.mkv',
+     {'movie_name': 'Money Heist', 'season': 1, 'episode': 2, 'category': 'series', 'languages': ['English', 'Hindi']}),
+    ('Mirzapur S02 E05 1080p Hindi.mkv',
+     {'movie_name': 'Mirzapur', 'season': 2, 'episode': 5, 'resolution': '1080p', 'language': 'Hindi'}),
+    ('Panchayat Season 2 Complete.mkv',
+     {'movie_name': 'Panchayat', 'season': 2, 'category': 'series'}),
+    ('KGF Chapter 2 Hindi 720p.mkv',
+     {'movie_name': 'KGF Chapter 2', 'resolution': '720p', 'language': 'Hindi'}),
+    ('KGF.Chapter.2.2022.Kannada.1080p.mkv',
+     {'movie_name': 'KGF Chapter 2', 'year': 2022, 'language': 'Kannada'}),
+    ('English Vinglish 2012.mkv',
+     {'movie_name': 'English Vinglish', 'year': 2012}),
+    ('Hotel Mumbai (2018).mkv',
+     {'movie_name': 'Hotel Mumbai', 'year': 2018, 'language': 'English'}),
+    ('@FilmziChannel Jawan 2023 HDTS H.264.mkv',
+     {'movie_name': 'Jawan', 'year': 2023, 'source': 'HDTS', 'codec': 'x264'}),
+    ('Oppenheimer_2023_4K_HDR_x265.mkv',
+     {'movie_name': 'Oppenheimer', 'year': 2023, 'resolution': '2160p', 'codec': 'x265'}),
+    ('Pushpa The Rise (2021) Telugu 480p WEBRip.mkv',
+     {'movie_name': 'Pushpa The Rise', 'year': 2021, 'language': 'Telugu', 'source': 'WEBRip'}),
+    ('Spider-Man No Way Home 2021 720p HDCAM.mp4',
+     {'movie_name': 'Spider-Man No Way Home', 'year': 2021, 'source': 'HDCAM'}),
+    ('[Malayalam] Drishyam 2 (2021) 1080p AMZN WEB-DL.mkv',
+     {'movie_name': 'Drishyam 2', 'year': 2021, 'language': 'Malayalam', 'source': 'WEB-DL'}),
+    ('The.Dark.Knight.2008.BRRip.XviD.avi',
+     {'movie_name': 'The Dark Knight', 'year': 2008, 'source': 'BRRip', 'codec': 'XviD'}),
+    ('Leo (2023) Tamil HQ PreDVD x264.mkv',
+     {'movie_name': 'Leo', 'year': 2023, 'language': 'Tamil', 'source': 'PreDVD'}),
+    ('Dune Part Two 2024 1080p Dual Audio Hindi English.mkv',
+     {'movie_name': 'Dune Part Two', 'year': 2024, 'languages': ['Hindi', 'English']}),
+    ('Stranger.Things.S04E01.Chapter.One.2160p.NF.WEB-DL.mkv',
+     {'movie_name': 'Stranger Things', 'season': 4, 'episode': 1, 'resolution': '2160p'}),
+    ('The Kan Do 2020 720p.mkv',
+     {'movie_name': 'The Kan Do', 'year': 2020, 'language': 'English'}),
+    ('Tel Aviv on Fire (2018) 1080p.mkv',
+     {'movie_name': 'Tel Aviv on Fire', 'year': 2018, 'languages': ['English']}),
+    ('Vikram.2022.1080p.WEB-DL.Tam.mkv',
+     {'movie_name': 'Vikram', 'year': 2022, 'source': 'WEB-DL', 'language': 'Tamil'}),
+    ('Jailer 2023 Tel Hin 720p.mkv',
+     {'movie_name': 'Jailer', 'year': 2023, 'languages': ['Telugu', 'Hindi']}),
+    ('Joker.2019.1080p.BluRay.x264-GROUP.mkv',
+     {'movie_name': 'Joker', 'year': 2019, 'source': 'BluRay', 'codec': 'x264'}),
+]
+
+
+def test_corpus():
+    failures = []
+    for filename, expected in CORPUS:
+        info = MovieUtils.parse_movie_info(filename)
+        for field, value in expected.items():
+            if info.get(field) != value:
+                failures.append(f"{filename}: {field}={info.get(field)!r}, expected {value!r}")
+    assert not failures, '\n'.join(failures)
+
+
+def test_existing_keys_for_plain_names():
+    info = MovieUtils.parse_movie_info('Inception')
+    assert (info['movie_name'], info['year'], info['quality'], info['language'], info['category']) == \
+        ('Inception', None, '480p', 'English', 'movie')
+
+
+def test_parse_many_keeps_order():
+    filenames = [filename for filename, _ in CORPUS]
+    assert MovieUtils.parse_many(filenames) == [MovieUtils.parse_movie_info(name) for name in filenames]
+    assert MovieUtils.parse_many([]) == []
+
+
+def test_indexer_rows_use_parse_many():
+    def message(file_name=None, caption=None, media=True):
+        document = SimpleNamespace(file_id=f'id-{file_name}', file_unique_id=f'u-{file_name}',
+                                   file_name=file_name, file_size=1024) if media else None
+        return SimpleNamespace(document=document, video=None, caption=caption)
+
+    messages = [
+        message('Vikram.2022.1080p.WEB-DL.Tam.mkv'),
+        message(media=False, caption='No file here'),
+        message(caption='Hotel Mumbai (2018)\nUploaded by admin'),
+        message(),
+    ]
+    rows = ChannelIndexer.movies_from_messages(messages)
+    assert [(row['file_name'], row['movie_name'], row['year']) for row in rows] == [
+        ('Vikram.2022.1080p.WEB-DL.Tam.mkv', 'Vikram', 2022),
+        ('Hotel Mumbai (2018)', 'Hotel Mumbai', 2018),
+    ]
@@ -0,0 +1,224 @@
+"""PostgresDatabase on the fake_asyncpg stand-in, checked against the SQLite backend"""
+import asyncio
+import os
+
+import pytest
+
+from database import AsyncDatabase, Database
+from fake_asyncpg import patch_create_pool, word_similarity
+from postgres import PostgresDatabase
+
+MOVIES = [
+    {'file_id': 'f1', 'file_unique_id': 'u1', 'file_name': 'The.Matrix.1999.1080p.mkv', 'file_size': '2.0 GB',
+     'movie_name': 'The Matrix', 'year': 1999, 'quality': '1080p', 'language': 'english'},
+    {'file_id': 'f2', 'file_unique_id': 'u2', 'file_name': 'The.Matrix.1999.720p.mkv', 'file_size': '1.0 GB',
+     'movie_name': 'The Matrix', 'year': 1999, 'quality': '720p', 'language': 'english'},
+    {'file_id': 'f3', 'file_unique_id': 'u3', 'file_name': 'Matrix.Reloaded.2003.720p.mkv', 'file_size': '1.2 GB',
+     'movie_name': 'Matrix Reloaded', 'year': 2003, 'quality': '720p', 'language': 'english'},
+    {'file_id': 'f4', 'file_unique_id': 'u4', 'file_name': 'Inception.2010.480p.Hindi.mkv', 'file_size': '700 MB',
+     'movie_name': 'Inception', 'year': 2010, 'quality': '480p', 'language': 'hindi'},
+]
+# Defaults the backends fill in differently (text vs datetime, bm25 vs trigram)
+IGNORED = {'created_at', 'joined_at', 'updated_at', 'fulfilled_at', 'finished_at', 'rank'}
+
+
+def normalize(value):
+    """Rows of both backends in one comparable shape"""
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items() if key not in IGNORED}
+    if isinstance(value, (list, tuple)):
+        return type(value)(normalize(item) for item in value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+@pytest.fixture
+def parity(tmp_path, monkeypatch):
+    """Run a scenario on SQLite and on PostgresDatabase; returns both results"""
+    patch_create_pool(monkeypatch, os.path.join(tmp_path, 'postgres.db'))
+
+    def run(scenario):
+        async def on(db):
+            await db.connect()
+            try:
+                return normalize(await scenario(db))
+            finally:
+                await db.close()
+
+        sqlite_result = asyncio.run(on(AsyncDatabase(Database(os.path.join(tmp_path, 'sqlite.db')), 1)))
+        postgres_result = asyncio.run(on(PostgresDatabase('postgresql://stand-in/filmzi')))
+        return sqlite_result, postgres_result
+
+    return run
+
+
+def test_word_similarity_follows_pg_trgm():
+    # Examples from the pg_trgm documentation
+    assert word_similarity('word', 'two words') == pytest.approx(0.8)
+    assert word_similarity('word', 'word') == 1.0
+    assert word_similarity('word', 'xyz') == 0.0
+
+
+def test_movies(parity):
+    async def scenario(db):
+        written = await db.add_movies(MOVIES, ('channel:1', 40))
+        movies = [await db.get_movie_by_id(movie_id) for movie_id in range(1, 5)]
+        title = await db.get_title_variants(movies[0]['title_id'])
+        return {
+            'written': written,
+            'checkpoint': await db.get_checkpoint('channel:1'),
+            'movies': movies,
+            'by_name': await db.get_movies_by_name('The Matrix'),
+            'title': title,
+            'titles': await db.get_title_names(),
+            'missing': await db.get_movie_by_id(99),
+        }
+
+    sqlite_result, postgres_result = parity(scenario)
+    assert postgres_result == sqlite_result
+    assert postgres_result['written'] == 4
+    assert [m['file_id'] for m in postgres_result['title']['variants']] == ['f1', 'f2']
+
+
+def test_reposted_file_keeps_its_id(parity):
+    async def scenario(db):
+        await db.add_movies(MOVIES)
+        # Same file (file_unique_id and size) posted again with a new file_id
+        await db.add_movies([dict(MOVIES[0], file_id='f1-new')])
+        return await db.get_movies_by_name('The Matrix')
+
+    sqlite_result, postgres_result = parity(scenario)
+    assert postgres_result == sqlite_result
+    assert [(m['id'], m['file_id']) for m in postgres_result] == [(1, 'f1-new'), (2, 'f2')]
+
+
+def test_search_pages(parity):
+    async def scenario(db):
+        await db.add_movies(MOVIES)
+        results = {}
+        for query in ('matrix', 'inception', 'reloaded', 'nothing like this'):
+            first = await db.search_movies(query, 10)
+            # Walk one row per page; keyset pages must neither skip nor repeat rows
+            walked, after = [], None
+            while True:
+                page = await db.search_movies(query, 1, after=after)
+                if not page:
+                    break
+                walked.append(page[0]['id'])
+                after = (page[0]['rank'], page[0]['id'])
+            results[query] = {'ids': sorted(m['id'] for m in first), 'walked': sorted(walked)}
+        results['filtered'] = sorted(
+            m['id'] for m in await db.search_movies('matrix', 10, filters={'resolution': 720})
+        )
+        return results
+
+    sqlite_result, postgres_result = parity(scenario)
+    assert postgres_result == sqlite_result
+    assert postgres_result['matrix'] == {'ids': [1, 2, 3], 'walked': [1, 2, 3]}
+    assert postgres_result['nothing like this']['ids'] == []
+    assert postgres_result['filtered'] == [2, 3]
+
+
+def test_facet_counts(parity):
+    async def scenario(db):
+        await db.add_movies(MOVIES)
+        counts = await db.facet_counts('matrix')
+        return {facet: sorted(values) for facet, values in counts.items()}
+
+    sqlite_result, postgres_result = parity(scenario)
+    assert postgres_result == sqlite_result
+
+
+def test_users(parity):
+    async def scenario(db):
+        await db.add_users([(3, 'c', 'C', ''), (1, 'a', 'A', ''), (2, 'b', 'B', '')])
+        await db.add_user(1, 'a2', 'A', 'Z')
+        await db.mark_users_inactive([2])
+        return {
+            'active': await db.get_active_user_ids(),
+            'after_1': await db.get_active_user_ids(1, 1),
+            'user': await db.get_user(1),
+            'missing': await db.get_user(9),
+        }
+
+    sqlite_result, postgres_result = parity(scenario)
+    assert postgres_result == sqlite_result
+    assert postgres_result['active'] == [1, 3]
+    assert postgres_result['user']['username'] == 'a2'
+
+
+def test_requests(parity):
+    async def scenario(db):
+        await db.add_movies(MOVIES)
+        first = await db.add_request(10, 'Dune 2021')
+        second = await db.add_request(11, 'dune (2021)')
+        again = await db.add_request(10, 'Dune 2021')
+        await db.add_request(12, 'Tenet')
+        top = await db.get_top_requests()
+        fulfilled = await db.fulfill_requests(['Dune'])
+        unnotified = await db.get_unnotified_requests()
+        requesters = await db.get_requesters(fulfilled[0]['id'])
+        await db.mark_requesters_notified(fulfilled[0]['id'], [10])
+        return {
+            'added': [first, second, again],
+            'top': top,
+            'fulfilled': fulfilled,
+            'unnotified': unnotified,
+            'requesters': requesters,
+            'left': await db.get_requesters(fulfilled[0]['id']),
+            'exists': [bool(await db.title_exists('the matrix')), bool(await db.title_exists('Dune'))],
+        }
+
+    sqlite_result, postgres_result = parity(scenario)
+    assert postgres_result == sqlite_result
+    assert [r['is_new'] for r in postgres_result['added']] == [1, 1, 0]
+    assert postgres_result['requesters'] == [10, 11]
+    assert postgres_result['left'] == [11]
+
+
+def test_broadcasts(parity):
+    async def scenario(db):
+        broadcast_id = await db.create_broadcast(5, 77)
+        claims = [
+            await db.claim_broadcast(broadcast_id, 'a', 100.0, 0.0),
+            await db.claim_broadcast(broadcast_id, 'b', 100.0, 50.0),
+            await db.claim_broadcast(broadcast_id, 'b', 200.0, 150.0),
+        ]
+        saved = await db.save_broadcast_progress(broadcast_id, 42, 3, 1, 1, 300.0)
+        running = await db.get_unfinished_broadcasts()
+        second = await db.create_broadcast(5, 78)
+        await db.finish_broadcast(broadcast_id)
+        cancelled = await db.cancel_broadcasts()
+        return {
+            'claims': claims,
+            'saved': saved,
+            'running': running,
+            'cancelled': cancelled,
+            'saved_after_cancel': await db.save_broadcast_progress(second, 1, 1, 0, 0, 400.0),
+            'all': await db.get_broadcasts(),
+        }
+
+    sqlite_result, postgres_result = parity(scenario)
+    assert postgres_result == sqlite_result
+    assert postgres_result['claims'] == [1, 0, 1]
+    assert [b['status'] for b in postgres_result['all']] == ['cancelled', 'done']
+
+
+def test_search_log_and_deletions(parity):
+    async def scenario(db):
+        await db.log_searches([(1, 'Matrix', 'matrix', 3, 100.0), (2, 'Dune', 'dune', 0, 200.0)])
+        await db.schedule_deletions([(1, 10, 30.0), (1, 11, 10.0), (2, 20, 20.0)])
+        await db.schedule_deletions([(1, 10, 5.0)])
+        await db.remove_scheduled_deletions([(2, 20)])
+        return {
+            'first': [await db.first_search_id(150.0), await db.first_search_id(500.0)],
+            'searches': await db.get_searches(),
+            'after_1': await db.get_searches(1),
+            'deletions': await db.get_scheduled_deletions(),
+        }
+
+    sqlite_result, postgres_result = parity(scenario)
+    assert postgres_result == sqlite_result
+    assert postgres_result['first'] == [2, 3]
+    assert postgres_result['deletions'] == [(1, 10, 5.0), (1, 11, 10.0)]
@@ -0,0 +1,156 @@
+import asyncio
+import os
+
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from database import AsyncDatabase, Database
+from scheduler import DeletionScheduler
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeBot:
+    """Records delete_messages calls; raises the queued errors first"""
+
+    def __init__(self):
+        self.deleted = []
+        self.errors = []
+
+    async def delete_messages(self, chat_id, message_ids):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.deleted.append((chat_id, list(message_ids)))
+        return True
+
+
+@pytest.fixture
+def db(tmp_path):
+    storage = AsyncDatabase(Database(os.path.join(tmp_path, 'test.db')), 1)
+    yield storage
+    asyncio.run(storage.close())
+
+
+def make_scheduler(db, clock):
+    scheduler = DeletionScheduler(db, retry_delay=30, clock=clock)
+    scheduler.bot = FakeBot()
+    return scheduler
+
+
+def test_deletes_in_due_order(db):
+    clock = FakeClock()
+    scheduler = make_scheduler(db, clock)
+
+    async def scenario():
+        await scheduler.schedule(1, 10, 30)
+        await scheduler.schedule(1, 11, 10)
+        await scheduler.schedule(2, 20, 20)
+
+        assert await scheduler.run_due() == 0
+        clock.now += 15
+        assert await scheduler.run_due() == 1
+        assert scheduler.bot.deleted == [(1, [11])]
+        clock.now += 10
+        assert await scheduler.run_due() == 1
+        clock.now += 10
+        assert await scheduler.run_due() == 1
+        assert scheduler.bot.deleted == [(1, [11]), (2, [20]), (1, [10])]
+        assert scheduler.pending() == 0
+        assert await db.get_scheduled_deletions() == []
+
+    asyncio.run(scenario())
+
+
+def test_batches_per_chat(db):
+    clock = FakeClock()
+    scheduler = make_scheduler(db, clock)
+
+    async def scenario():
+        for message_id in range(150):
+            await scheduler.schedule(1, message_id, 5)
+        clock.now += 5
+        assert await scheduler.run_due() == 150
+        assert [len(ids) for _, ids in scheduler.bot.deleted] == [100, 50]
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_reschedules(db):
+    clock = FakeClock()
+    scheduler = make_scheduler(db, clock)
+    scheduler.bot.errors.append(RetryAfter(7))
+
+    async def scenario():
+        await scheduler.schedule(1, 10, 5)
+        clock.now += 5
+        assert await scheduler.run_due() == 0
+        assert scheduler.pending() == 1
+        assert await db.get_scheduled_deletions() == [(1, 10, clock.now + 7)]
+
+        clock.now += 6
+        assert await scheduler.run_due() == 0
+        assert scheduler.bot.deleted == []
+        clock.now += 1
+        assert await scheduler.run_due() == 1
+        assert scheduler.bot.deleted == [(1, [10])]
+        assert await db.get_scheduled_deletions() == []
+
+    asyncio.run(scenario())
+
+
+def test_network_error_retries_after_delay(db):
+    clock = FakeClock()
+    scheduler = make_scheduler(db, clock)
+    scheduler.bot.errors.append(NetworkError('timed out'))
+
+    async def scenario():
+        await scheduler.schedule(1, 10, 0)
+        assert await scheduler.run_due() == 0
+        assert await db.get_scheduled_deletions() == [(1, 10, clock.now + 30)]
+        clock.now += 30
+        assert await scheduler.run_due() == 1
+
+    asyncio.run(scenario())
+
+
+def test_bad_request_is_not_retried(db):
+    clock = FakeClock()
+    scheduler = make_scheduler(db, clock)
+    scheduler.bot.errors.append(BadRequest('Message to delete not found'))
+
+    async def scenario():
+        await scheduler.schedule(1, 10, 0)
+        assert await scheduler.run_due() == 1
+        assert scheduler.pending() == 0
+        assert await db.get_scheduled_deletions() == []
+
+    asyncio.run(scenario())
+
+
+def test_restart_reloads_pending_jobs(db):
+    clock = FakeClock()
+    scheduler = make_scheduler(db, clock)
+
+    async def scenario():
+        await scheduler.schedule(1, 10, 60)
+        await scheduler.schedule(1, 11, 5)
+        await scheduler.schedule(2, 20, 30)
+
+        # A new process: nothing in memory, jobs come back from the database
+        restarted = make_scheduler(db, clock)
+        await restarted.load()
+        assert restarted.pending() == 3
+        clock.now += 40
+        assert await restarted.run_due() == 2
+        assert restarted.bot.deleted == [(1, [11]), (2, [20])]
+        clock.now += 20
+        assert await restarted.run_due() == 1
+        assert await db.get_scheduled_deletions() == []
+
+    asyncio.run(scenario())
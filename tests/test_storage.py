@@ -0,0 +1,27 @@
+import os
+
+from config import Config
+from storage import create_storage
+
+
+def config(tmp_path, url: str) -> Config:
+    config = Config()
+    config.DATABASE_URL = url
+    config.DB_NAME = os.path.join(tmp_path, 'filmzi_bot.db')
+    return config
+
+
+def test_sqlite_url_is_used(tmp_path):
+    path = os.path.join(tmp_path, 'movies.db')
+    assert create_storage(config(tmp_path, f'sqlite:///{path}')).db.db_name == path
+
+
+def test_existing_db_name_wins_over_a_missing_file(tmp_path):
+    settings = config(tmp_path, f'sqlite:///{os.path.join(tmp_path, "movies.db")}')
+    open(settings.DB_NAME, 'w').close()
+    assert create_storage(settings).db.db_name == settings.DB_NAME
+
+
+def test_unset_url_uses_db_name(tmp_path):
+    settings = config(tmp_path, '')
+    assert create_storage(settings).db.db_name == settings.DB_NAME
@@ -1,63 +1,231 @@
 import re
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from urllib.parse import quote
 
+try:
+    from pyrogram.file_id import FileId, FileUniqueId, FileUniqueType
+except ImportError:
+    # Only the indexer needs pyrogram; without it file_ids are not decoded
+    FileId = None
+
 logger = logging.getLogger(__name__)
 
+NON_WORD_RE = re.compile(r'[\W_]+')
+# "1.40 GB" as written by format_file_size
+FILE_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(B|KB|MB|GB|TB)\s*$', re.IGNORECASE)
+SIZE_UNITS = {'B': 0, 'KB': 1, 'MB': 2, 'GB': 3, 'TB': 4}
+
+# Filename parsing: separators become spaces and the name is split into
+# words once; each word is looked up in FILENAME_TAGS, and only the words
+# that miss are tried against the few patterned tags (S01E02, "x264-GRP")
+VIDEO_EXTENSIONS = {'mkv', 'mp4', 'avi', 'm4v', 'mov', 'webm', 'ts'}
+# Separators and brackets both become spaces
+WORD_TABLE = str.maketrans('._[](){}', ' ' * 8)
+LEADING_TAGS_RE = re.compile(r'^\s*(?:(?:\[[^\]]*\]|\([^)]*\)|@\w+)\s*)+')
+EPISODE_RE = re.compile(r's(\d{1,2})e(\d{1,3})')
+EPISODE_NUMBER_RE = re.compile(r'e(\d{1,3})')
+WORD_PARTS_RE = re.compile(r'\W+')
+RESOLUTION_NAMES = {'4k': '2160p', 'uhd': '2160p'}
+RESOLUTION_RE = re.compile(r'\b(\d{3,4}[pi]|4k|uhd)\b', re.IGNORECASE)
+SOURCE_NAMES = {
+    'bluray': 'BluRay', 'bdrip': 'BDRip', 'brrip': 'BRRip', 'webdl': 'WEB-DL',
+    'webrip': 'WEBRip', 'hdtv': 'HDTV', 'hdrip': 'HDRip', 'dvdrip': 'DVDRip',
+    'dvdscr': 'DVDScr', 'hdcam': 'HDCAM', 'camrip': 'CAMRip', 'hdts': 'HDTS', 'predvd': 'PreDVD'
+}
+CODEC_NAMES = {
+    'x264': 'x264', 'h264': 'x264', 'avc': 'x264', 'x265': 'x265', 'h265': 'x265',
+    'hevc': 'x265', 'xvid': 'XviD', 'divx': 'DivX', 'av1': 'AV1'
+}
+LANGUAGE_NAMES = {
+    'hindi': 'Hindi', 'tamil': 'Tamil', 'telugu': 'Telugu', 'english': 'English',
+    'malayalam': 'Malayalam', 'kannada': 'Kannada', 'bengali': 'Bengali', 'marathi': 'Marathi',
+    'punjabi': 'Punjabi', 'korean': 'Korean', 'japanese': 'Japanese'
+}
+# Also ordinary words ("The Kan Do", "Tel Aviv"): only tags after a year or quality
+LANGUAGE_CODES = {
+    'hin': 'Hindi', 'tam': 'Tamil', 'tel': 'Telugu', 'eng': 'English', 'mal': 'Malayalam', 'kan': 'Kannada'
+}
+
+
+def _filename_tags() -> Dict[str, Tuple[str, Any]]:
+    """Lowercased word -> (kind, value) for every tag that is a fixed word"""
+    tags: Dict[str, Tuple[str, Any]] = {}
+    for year in range(1920, 2050):
+        tags[str(year)] = ('year', year)
+    for lines in (2160, 1440, 1080, 720, 576, 480, 360, 240):
+        for scan in 'pi':
+            tags[f'{lines}{scan}'] = ('res', f'{lines}{scan}')
+    tags.update({word: ('res', value) for word, value in RESOLUTION_NAMES.items()})
+    for key, value in SOURCE_NAMES.items():
+        tags[key] = ('source', value)
+    for spelled in ('blu-ray', 'web-dl', 'web-rip', 'pre-dvd'):
+        tags[spelled] = ('source', SOURCE_NAMES[spelled.replace('-', '')])
+    tags.update({word: ('codec', value) for word, value in CODEC_NAMES.items()})
+    tags.update({word: ('lang', value) for word, value in LANGUAGE_NAMES.items()})
+    tags.update({word: ('code', value) for word, value in LANGUAGE_CODES.items()})
+    for season in range(100):
+        for number in {str(season), f'{season:02d}'}:
+            tags[f's{number}'] = tags[f'season{number}'] = ('season', season)
+    return tags
+
+
+FILENAME_TAGS = _filename_tags()
+
+
+def _patterned_tag(word: str) -> Optional[Tuple[str, Any]]:
+    """(kind, value) of a lowercased word FILENAME_TAGS misses: "s01e02", or a tag glued to other text ("x264-grp")"""
+    if word[:1] == 's':
+        match = EPISODE_RE.fullmatch(word)
+        if match:
+            return 'episode', (int(match.group(1)), int(match.group(2)))
+    if not word.isalnum():
+        for part in WORD_PARTS_RE.split(word):
+            if part and part != word:
+                tag = FILENAME_TAGS.get(part) or _patterned_tag(part)
+                if tag is not None:
+                    return tag
+    return None
+
+
 class MovieUtils:
+    @staticmethod
+    def normalize_title(text: str) -> str:
+        """Case-fold, strip punctuation and collapse whitespace"""
+        return NON_WORD_RE.sub(' ', (text or '').casefold()).strip()
+    
     @staticmethod
     def parse_movie_info(filename: str) -> Dict[str, Any]:
-        """Extract movie information from filename"""
+        """Extract movie information from filename in one pass over its words.
+        
+        Returns movie_name, year, quality, language and category as before,
+        plus season, episode, resolution, source, codec and languages.
+        """
         try:
-            info = {
-                'movie_name': filename,
-                'year': None,
-                'quality': '480p',
-                'language': 'English',
-                'category': 'movie'
-            }
+            head, dot, extension = filename.rpartition('.')
+            text = head if dot and extension.lower() in VIDEO_EXTENSIONS else filename
             
-            # Extract year
-            year_match = re.search(r'\((\d{4})\)', filename)
-            if year_match:
-                info['year'] = int(year_match.group(1))
-                info['movie_name'] = re.sub(r'\(\d{4}\)', '', filename).strip()
+            # Channel tags like "[Hindi]" or "@channel" before the title
+            name_start = 0
+            if text.lstrip()[:1] in ('[', '(', '@'):
+                lead = LEADING_TAGS_RE.match(text).end()
+                name_start = len(text[:lead].translate(WORD_TABLE).split())
+                text = text[:lead] + ' ' + text[lead:]
+            text = text.translate(WORD_TABLE)
+            words = text.split()
+            # Lowercasing never adds or removes whitespace, so the lists line up
+            lowered = text.lower().split()
             
-            # Extract quality
-            quality_patterns = [
-                r'(\d{3,4}p)', r'(HDTV)', r'(BluRay)', r'(WEB-DL)', 
-                r'(720p)', r'(1080p)', r'(480p)', r'(4K)'
-            ]
-            for pattern in quality_patterns:
-                quality_match = re.search(pattern, filename, re.IGNORECASE)
-                if quality_match:
-                    info['quality'] = quality_match.group(1).upper()
-                    break
+            years = []
+            meta_start = None
+            # A year or quality tag was seen: three-letter language codes count from here
+            tagged = False
+            season = episode = resolution = source = codec = None
+            languages = []
+            last = len(lowered) - 1
+            skip = False
+            tags = FILENAME_TAGS
             
-            # Extract language
-            lang_patterns = {
-                'hindi': ['hindi', 'hin'],
-                'tamil': ['tamil', 'tam'],
-                'telugu': ['telugu', 'tel'],
-                'english': ['english', 'eng']
-            }
+            for position, word in enumerate(lowered):
+                if skip:
+                    skip = False
+                    continue
+                tag = tags.get(word)
+                if tag is None:
+                    following = lowered[position + 1] if position < last else ''
+                    if word == 'season' and following.isdigit() and len(following) <= 2:
+                        tag = ('season', int(following))
+                        skip = True
+                    elif (word == 'x' or word == 'h') and (following == '264' or following == '265'):
+                        tag = ('codec', CODEC_NAMES['x' + following])
+                        skip = True
+                    else:
+                        tag = _patterned_tag(word)
+                        if tag is None:
+                            continue
+                kind, value = tag
+                if kind == 'code':
+                    if not tagged:
+                        continue
+                    kind = 'lang'
+                if kind == 'year':
+                    if position > name_start:
+                        years.append((position, value))
+                        tagged = True
+                    continue
+                if kind == 'lang':
+                    if value not in languages:
+                        languages.append(value)
+                    # A language word ends the name unless it starts it ("English Vinglish")
+                    if meta_start is None and position > name_start:
+                        meta_start = position
+                    continue
+                tagged = True
+                if meta_start is None and position >= name_start:
+                    meta_start = position
+                if kind == 'res':
+                    if resolution is None:
+                        resolution = value
+                elif kind == 'source':
+                    if source is None:
+                        source = value
+                elif kind == 'codec':
+                    if codec is None:
+                        codec = value
+                elif kind == 'season':
+                    if season is None:
+                        season = value
+                        # "S02 E05"
+                        following = lowered[position + 1] if position < last else ''
+                        if word[1:2].isdigit() and following[:1] == 'e':
+                            match = EPISODE_NUMBER_RE.fullmatch(following)
+                            if match:
+                                episode = int(match.group(1))
+                                skip = True
+                elif season is None:
+                    season, episode = value
             
-            for lang, patterns in lang_patterns.items():
-                if any(pattern in filename.lower() for pattern in patterns):
-                    info['language'] = lang.capitalize()
+            # Last year before the first other tag; "2012 (2009)" keeps 2012 in the name
+            name_end = meta_start if meta_start is not None else len(words)
+            year = None
+            for position, value in reversed(years):
+                if position < name_end:
+                    name_end, year = position, value
                     break
             
-            # Clean movie name
-            info['movie_name'] = re.sub(r'[\[\]]', '', info['movie_name'])
-            info['movie_name'] = re.sub(r'\.mkv$|\.mp4$|\.avi$', '', info['movie_name'])
-            info['movie_name'] = info['movie_name'].strip()
+            name = ' '.join(words[name_start:name_end]).strip(' -')
             
-            return info
+            return {
+                'movie_name': name or filename,
+                'year': year,
+                'quality': (resolution or source).upper() if (resolution or source) else '480p',
+                'language': languages[0] if languages else 'English',
+                'languages': languages or ['English'],
+                'category': 'series' if season is not None else 'movie',
+                'season': season,
+                'episode': episode,
+                'resolution': resolution,
+                'source': source,
+                'codec': codec
+            }
         except Exception as e:
             logger.error(f"Error parsing movie info: {e}")
             return {'movie_name': filename, 'quality': '480p', 'language': 'English'}
     
+    @staticmethod
+    def parse_many(filenames: List[str]) -> List[Dict[str, Any]]:
+        """parse_movie_info for each filename, in order; the tag tables are built once at import"""
+        return [MovieUtils.parse_movie_info(filename) for filename in filenames]
+    
+    @staticmethod
+    def resolution_rank(quality: str) -> int:
+        """Vertical resolution of a quality string ("1080P" -> 1080, "4K" -> 2160), 0 if unknown"""
+        match = RESOLUTION_RE.search(quality or '')
+        if not match:
+            return 0
+        value = match.group(1).lower()
+        return int(RESOLUTION_NAMES.get(value, value)[:-1])
+    
     @staticmethod
     def format_file_size(size_bytes: int) -> str:
         """Convert bytes to human readable format"""
@@ -75,6 +243,41 @@ class MovieUtils:
         except:
             return "N/A"
     
+    @staticmethod
+    def parse_file_size(text: str) -> int:
+        """Bytes of a format_file_size string ("1.40 GB"), 0 if it cannot be read"""
+        match = FILE_SIZE_RE.match(text or '')
+        if not match:
+            return 0
+        return int(float(match.group(1)) * 1024 ** SIZE_UNITS[match.group(2).upper()])
+    
+    @staticmethod
+    def rounded_size(size_bytes: int) -> int:
+        """size_bytes as stored for movies indexed with only a formatted file_size"""
+        return MovieUtils.parse_file_size(MovieUtils.format_file_size(size_bytes or 0))
+    
+    @staticmethod
+    def file_unique_id(file_id: str) -> str:
+        """Telegram's file_unique_id for a document or video file_id.
+        
+        The same file posted again gets a new file_id but keeps its
+        file_unique_id. Falls back to file_id if it cannot be decoded.
+        """
+        if FileId is None:
+            return file_id
+        try:
+            media_id = FileId.decode(file_id).media_id
+            return FileUniqueId(file_unique_type=FileUniqueType.DOCUMENT, media_id=media_id).encode()
+        except Exception:
+            return file_id
+    
+    @staticmethod
+    def display_size(movie: Dict[str, Any]) -> str:
+        """Human readable size of a movies row"""
+        if movie.get('size_bytes'):
+            return MovieUtils.format_file_size(movie['size_bytes'])
+        return movie.get('file_size') or 'N/A'
+    
     @staticmethod
     def create_movie_caption(movie_data: Dict[str, Any]) -> str:
         """Create formatted caption for movie"""
@@ -83,7 +286,7 @@ class MovieUtils:
         if movie_data.get('year'):
             caption += f" ({movie_data['year']})"
         
-        caption += f"\n\n📊 **Size:** {movie_data.get('file_size', 'N/A')}"
+        caption += f"\n\n📊 **Size:** {MovieUtils.display_size(movie_data)}"
         caption += f"\n🎭 **Language:** {movie_data.get('language', 'English')}"
         caption += f"\n⭐ **Quality:** {movie_data.get('quality', '480p')}"
         